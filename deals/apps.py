@@ -0,0 +1,23 @@
+import os
+import sys
+
+from django.apps import AppConfig
+
+
+def is_runserver():
+    """Дочерний процесс runserver, который обслуживает запросы (не родитель автоперезагрузки)"""
+    if sys.argv[1:2] != ['runserver']:
+        return False
+    return os.environ.get('RUN_MAIN') == 'true' or '--noreload' in sys.argv
+
+
+class DealsConfig(AppConfig):
+    name = 'deals'
+
+    def ready(self):
+        # Встроенный обработчик очереди включается явно и только для runserver:
+        # в WSGI-процессах он запускается при постановке задачи, а в рабочей
+        # среде очередь обрабатывает отдельный процесс run_import_export_worker
+        if is_runserver():
+            from .services.job_runner import start_embedded_runner
+            start_embedded_runner()
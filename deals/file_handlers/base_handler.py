@@ -1,17 +1,67 @@
 import abc
+import codecs
 import csv
+import gzip
 import io
+import os
+import zipfile
+from itertools import chain, count, islice
 from django.http import HttpResponse
 import openpyxl
+from openpyxl.utils import get_column_letter
 from openpyxl.utils.exceptions import InvalidFileException
+from .header_mapping import HeaderMapping, RECORD_FIELDS
+
+EMPTY_RECORD = dict.fromkeys(RECORD_FIELDS, '')
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_ZIP = 'zip'
+EXPORT_HEADERS = ['Имя', 'Фамилия', 'Телефон', 'Email', 'Компания']
+
+
+EXPORT_COLUMNS = list(zip(EXPORT_HEADERS, RECORD_FIELDS))
+
+
+def record_row(record, fields=RECORD_FIELDS):
+    """Строка файла экспорта для записи контакта"""
+    return [record.get(field, '') for field in fields]
 
 
 class BaseFileHandler(abc.ABC):
     """Базовый класс для обработки файлов"""
 
+    def __init__(self, column_mapping=None, aliases=None):
+        self.column_mapping = column_mapping
+        self.aliases = aliases
+
+    def compile_headers(self, headers):
+        """Соответствие колонок полям контакта для строки заголовков файла"""
+        return HeaderMapping(headers, column_mapping=self.column_mapping, aliases=self.aliases)
+
     @abc.abstractmethod
+    def iter_rows(self, file):
+        """Потоковое чтение непустых строк файла: (номер строки в файле, запись).
+
+        В отличие от iter_records, отдаются и строки без имени и фамилии,
+        чтобы проверка файла могла указать на них по номеру строки.
+        """
+        pass
+
+    def iter_records(self, file):
+        """Потоковое чтение записей с именем или фамилией из файла"""
+        for _, record in self.iter_rows(file):
+            if record['first_name'] or record['last_name']:
+                yield record
+
     def read_records(self, file):
-        """Чтение записей из файла"""
+        """Чтение всех записей из файла"""
+        return list(self.iter_records(file))
+
+    @abc.abstractmethod
+    def write_records_to(self, file, records, columns=None):
+        """Потоковая запись записей в бинарный файл, возвращает количество строк.
+
+        columns — список (заголовок, поле записи), по умолчанию EXPORT_COLUMNS.
+        """
         pass
 
     @abc.abstractmethod
@@ -19,72 +69,95 @@ class BaseFileHandler(abc.ABC):
         """Запись записей в файл"""
         pass
 
+    ZIP_COMPRESSION = zipfile.ZIP_DEFLATED
 
-class CSVHandler(BaseFileHandler):
-    """Обработчик CSV файлов"""
-
-    def read_records(self, file):
-        """Чтение CSV файла с поддержкой русской кодировки"""
-        records = []
+    def write_gzip_to(self, file, records):
+        """Потоковая запись через gzip по мере поступления строк"""
+        with gzip.GzipFile(fileobj=file, mode='wb', mtime=0) as compressed:
+            return self.write_records_to(compressed, records)
 
-        try:
+    def write_zip_to(self, file, records, part_name, split_rows):
+        """Запись в zip-архив частями: новый файл part_name каждые split_rows строк"""
+        records = iter(records)
+        written = 0
 
-            for encoding in ['utf-8-sig', 'utf-8', 'cp1251', 'windows-1251']:
-                try:
-                    file.seek(0)
-                    content = file.read().decode(encoding)
+        with zipfile.ZipFile(file, 'w', compression=self.ZIP_COMPRESSION, allowZip64=True) as archive:
+            for number in count(1):
+                first = next(records, None)
+                if first is None and number > 1:
                     break
-                except UnicodeDecodeError:
-                    continue
-            else:
-                raise ValueError("Не удалось определить кодировку файла")
 
+                part = chain([first], islice(records, split_rows - 1)) if first is not None else iter(())
+                with archive.open(part_name.format(number=number), 'w', force_zip64=True) as entry:
+                    written += self.write_records_to(entry, part)
 
-            sample = content[:1024]
-            if ';' in sample and sample.count(';') > sample.count(','):
-                delimiter = ';'
-            else:
-                delimiter = ','
+        return written
 
-            io_string = io.StringIO(content)
+    def write_records_to_path(self, path, records, compression=None, part_name=None, split_rows=None):
+        """Запись в файл на диске через временный файл, чтобы не отдать недописанный.
 
+        compression: None, 'gzip' или 'zip' (части по split_rows строк с именами part_name).
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.part"
 
-            reader = csv.DictReader(io_string, delimiter=delimiter)
+        try:
+            with open(temp_path, 'wb') as file:
+                if compression == COMPRESSION_GZIP:
+                    written = self.write_gzip_to(file, records)
+                elif compression == COMPRESSION_ZIP:
+                    written = self.write_zip_to(file, records, part_name, split_rows)
+                else:
+                    written = self.write_records_to(file, records)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
 
-            for row_num, row in enumerate(reader, 1):
-                try:
+        return written
 
-                    normalized_row = {}
-                    for key, value in row.items():
-                        if key:
-                            normalized_key = key.strip().lower().replace('\ufeff', '')
-                            normalized_row[normalized_key] = value.strip() if value else ''
 
+class CSVHandler(BaseFileHandler):
+    """Обработчик CSV файлов"""
+
+    ENCODINGS = ['utf-8-sig', 'utf-8', 'cp1251', 'windows-1251']
+    CHUNK_SIZE = 64 * 1024
+
+    def iter_rows(self, file):
+        """Потоковое чтение CSV файла с поддержкой русской кодировки.
+
+        Кодировка определяется проходом по всему файлу до чтения записей:
+        файл в cp1251 может начинаться с длинного ASCII-блока, который
+        декодируется и как utf-8. Разделитель определяется по первому блоку,
+        файл читается по блокам без загрузки целиком. Номер строки — первая
+        строка записи в файле с учетом заголовка и многострочных значений.
+        """
+        try:
+            encoding = self._detect_encoding(file)
 
-                    record = {
-                        'first_name': '',
-                        'last_name': '',
-                        'phone': '',
-                        'email': '',
-                        'company_name': ''
-                    }
+            file.seek(0)
+            sample = codecs.getincrementaldecoder(encoding)().decode(file.read(self.CHUNK_SIZE))[:1024]
+            if ';' in sample and sample.count(';') > sample.count(','):
+                delimiter = ';'
+            else:
+                delimiter = ','
 
+            reader = csv.reader(self._iter_lines(file, encoding), delimiter=delimiter)
 
-                    for key in normalized_row.keys():
-                        if any(x in key for x in ['имя', 'name', 'first']):
-                            record['first_name'] = normalized_row[key]
-                        elif any(x in key for x in ['фамилия', 'last', 'surname']):
-                            record['last_name'] = normalized_row[key]
-                        elif any(x in key for x in ['телефон', 'phone', 'тел']):
-                            record['phone'] = normalized_row[key]
-                        elif any(x in key for x in ['почта', 'email', 'mail']):
-                            record['email'] = normalized_row[key]
-                        elif any(x in key for x in ['компания', 'company']):
-                            record['company_name'] = normalized_row[key]
+            mapping = self.compile_headers(next(reader, []))
+            fields = mapping.fields
 
+            line_num = reader.line_num
+            for row in reader:
+                row_num, line_num = line_num + 1, reader.line_num
+                try:
+                    record = EMPTY_RECORD.copy()
+                    record.update(zip(fields, [
+                        value.strip() if value else '' for value in mapping.project(row)
+                    ]))
 
-                    if record['first_name'] or record['last_name']:
-                        records.append(record)
+                    if any(record.values()):
+                        yield row_num, record
 
                 except Exception as e:
                     print(f"Ошибка в строке {row_num}: {e}")
@@ -94,162 +167,192 @@ class CSVHandler(BaseFileHandler):
             print(f"Ошибка чтения CSV: {e}")
             raise
 
-        return records
+    def _detect_encoding(self, file):
+        """Первая кодировка из ENCODINGS, в которой без ошибок декодируется весь файл"""
+        for encoding in self.ENCODINGS:
+            decoder = codecs.getincrementaldecoder(encoding)()
+            try:
+                for chunk in self._iter_chunks(file):
+                    decoder.decode(chunk)
+                decoder.decode(b'', final=True)
+                return encoding
+            except UnicodeDecodeError:
+                continue
+
+        raise ValueError("Не удалось определить кодировку файла")
+
+    def _iter_chunks(self, file):
+        """Блоки байт файла с начала"""
+        if hasattr(file, 'chunks'):
+            yield from file.chunks(self.CHUNK_SIZE)
+            return
+
+        file.seek(0)
+        while True:
+            chunk = file.read(self.CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+    def _iter_lines(self, file, encoding):
+        """Строки файла, декодированные инкрементальным декодером"""
+        decoder = codecs.getincrementaldecoder(encoding)()
+        pending = ''
+
+        for chunk in self._iter_chunks(file):
+            pending += decoder.decode(chunk)
+            *lines, pending = pending.split('\n')
+            for line in lines:
+                yield line + '\n'
+
+        pending += decoder.decode(b'', final=True)
+        if pending:
+            yield pending
+
+    def write_records_to(self, file, records, columns=None):
+        """Потоковая запись CSV с русскими заголовками"""
+        headers, fields = zip(*(columns or EXPORT_COLUMNS))
 
-    def write_records(self, records):
-        """Создание CSV файла с русскими заголовками"""
         try:
-            output = io.StringIO()
+            output = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
             writer = csv.writer(output, delimiter=',', quoting=csv.QUOTE_ALL)
 
+            writer.writerow(headers)
 
-            writer.writerow(['Имя', 'Фамилия', 'Телефон', 'Email', 'Компания'])
-
-
+            count = 0
             for record in records:
-                writer.writerow([
-                    record.get('first_name', ''),
-                    record.get('last_name', ''),
-                    record.get('phone', ''),
-                    record.get('email', ''),
-                    record.get('company_name', '')
-                ])
-
-            response = HttpResponse(
-                output.getvalue().encode('utf-8-sig'),
-                content_type='text/csv; charset=utf-8-sig'
-            )
-            response['Content-Disposition'] = 'attachment; filename="contacts_export.csv"'
-
-            return response
+                writer.writerow(record_row(record, fields))
+                count += 1
+
+            output.flush()
+            output.detach()
+            return count
 
         except Exception as e:
             print(f"Ошибка записи CSV: {e}")
             raise
 
+    def write_records(self, records):
+        """Создание CSV файла с русскими заголовками"""
+        output = io.BytesIO()
+        self.write_records_to(output, records)
+
+        response = HttpResponse(
+            output.getvalue(),
+            content_type='text/csv; charset=utf-8-sig'
+        )
+        response['Content-Disposition'] = 'attachment; filename="contacts_export.csv"'
+
+        return response
+
 
 class XLSXHandler(BaseFileHandler):
     """Обработчик XLSX файлов"""
 
-    def read_records(self, file):
-        """Чтение XLSX файла"""
-        records = []
-
+    def iter_rows(self, file):
+        """Потоковое чтение XLSX файла; номер строки — номер строки листа"""
         try:
             file.seek(0)
             workbook = openpyxl.load_workbook(file, read_only=True)
-            sheet = workbook.active
+        except InvalidFileException:
+            raise ValueError("Некорректный XLSX файл")
 
-            headers = []
+        try:
+            sheet = workbook.active
 
-            for row_num, row in enumerate(sheet.iter_rows(values_only=True), 1):
-                if row_num == 1:
+            rows = sheet.iter_rows(values_only=True)
 
-                    headers = [str(cell).strip().lower() if cell else '' for cell in row]
-                    continue
+            mapping = self.compile_headers(next(rows, ()))
+            fields = mapping.fields
 
+            for row_num, row in enumerate(rows, 2):
                 if not any(cell for cell in row):
                     continue
 
                 try:
-                    record = {
-                        'first_name': '',
-                        'last_name': '',
-                        'phone': '',
-                        'email': '',
-                        'company_name': ''
-                    }
-
-
-                    for col_num, cell in enumerate(row):
-                        if col_num < len(headers) and cell is not None:
-                            cell_value = str(cell).strip()
-                            header = headers[col_num]
-
-                            if any(x in header for x in ['имя', 'name', 'first']):
-                                record['first_name'] = cell_value
-                            elif any(x in header for x in ['фамилия', 'last', 'surname']):
-                                record['last_name'] = cell_value
-                            elif any(x in header for x in ['телефон', 'phone', 'тел']):
-                                record['phone'] = cell_value
-                            elif any(x in header for x in ['почта', 'email', 'mail']):
-                                record['email'] = cell_value
-                            elif any(x in header for x in ['компания', 'company']):
-                                record['company_name'] = cell_value
-
-
-                    if record['first_name'] or record['last_name']:
-                        records.append(record)
+                    record = EMPTY_RECORD.copy()
+                    record.update(zip(fields, [
+                        str(value).strip() if value is not None else '' for value in mapping.project(row)
+                    ]))
+
+                    if any(record.values()):
+                        yield row_num, record
 
                 except Exception as e:
                     print(f"Ошибка в строке {row_num}: {e}")
                     continue
 
-            workbook.close()
-
-        except InvalidFileException:
-            raise ValueError("Некорректный XLSX файл")
         except Exception as e:
             print(f"Ошибка чтения XLSX: {e}")
             raise
+        finally:
+            workbook.close()
 
-        return records
+    WIDTH_SAMPLE_ROWS = 1000
+    # XLSX уже сжат, повторное сжатие в zip только тратит время
+    ZIP_COMPRESSION = zipfile.ZIP_STORED
+
+    def write_records_to(self, file, records, columns=None):
+        """Потоковая запись XLSX в write-only режиме openpyxl.
+
+        Строки не хранятся в памяти: openpyxl сбрасывает их во временный файл.
+        Ширина колонок в write-only режиме задается до первой строки, поэтому
+        она набирается по заголовку и первым WIDTH_SAMPLE_ROWS строкам.
+        """
+        headers, fields = zip(*(columns or EXPORT_COLUMNS))
 
-    def write_records(self, records):
-        """Создание XLSX файла"""
         try:
-            workbook = openpyxl.Workbook()
-            sheet = workbook.active
-            sheet.title = "Контакты"
+            workbook = openpyxl.Workbook(write_only=True)
+            sheet = workbook.create_sheet("Контакты")
 
+            rows = (record_row(record, fields) for record in records)
+            widths = [len(header) for header in headers]
 
-            sheet.append(['Имя', 'Фамилия', 'Телефон', 'Email', 'Компания'])
+            sample = []
+            for row in islice(rows, self.WIDTH_SAMPLE_ROWS):
+                sample.append(row)
+                for index, value in enumerate(row):
+                    widths[index] = max(widths[index], len(str(value)))
 
+            for index, width in enumerate(widths, 1):
+                sheet.column_dimensions[get_column_letter(index)].width = min(width + 2, 50)
 
-            for record in records:
-                sheet.append([
-                    record.get('first_name', ''),
-                    record.get('last_name', ''),
-                    record.get('phone', ''),
-                    record.get('email', ''),
-                    record.get('company_name', '')
-                ])
-
-
-            for column in sheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = min(max_length + 2, 50)
-                sheet.column_dimensions[column_letter].width = adjusted_width
-
-            response = HttpResponse(
-                content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-            response['Content-Disposition'] = 'attachment; filename="contacts_export.xlsx"'
-
-            workbook.save(response)
-            return response
+            sheet.append(list(headers))
+
+            count = 0
+            for row in chain(sample, rows):
+                sheet.append(row)
+                count += 1
+
+            workbook.save(file)
+            return count
 
         except Exception as e:
             print(f"Ошибка записи XLSX: {e}")
             raise
 
+    def write_records(self, records):
+        """Создание XLSX файла"""
+        response = HttpResponse(
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+        response['Content-Disposition'] = 'attachment; filename="contacts_export.xlsx"'
+
+        output = io.BytesIO()
+        self.write_records_to(output, records)
+        response.write(output.getvalue())
+        return response
+
 
 class FileHandlerFactory:
     """Фабрика для получения обработчиков файлов"""
 
     @staticmethod
-    def get_handler(file_format):
+    def get_handler(file_format, **options):
         file_format = file_format.lower()
         if file_format == 'csv':
-            return CSVHandler()
+            return CSVHandler(**options)
         elif file_format == 'xlsx':
-            return XLSXHandler()
+            return XLSXHandler(**options)
         else:
             raise ValueError(f"Неподдерживаемый формат файла: {file_format}")
\ No newline at end of file
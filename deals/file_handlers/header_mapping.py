@@ -0,0 +1,97 @@
+from operator import itemgetter
+
+RECORD_FIELDS = ('first_name', 'last_name', 'phone', 'email', 'company_name')
+
+# Порядок важен: при совпадении по подстроке побеждает первое поле в списке
+FIELD_KEYWORDS = (
+    ('first_name', ('имя', 'name', 'first')),
+    ('last_name', ('фамилия', 'last', 'surname')),
+    ('phone', ('телефон', 'phone', 'тел')),
+    ('email', ('почта', 'email', 'mail')),
+    ('company_name', ('компания', 'company')),
+)
+
+# Точные названия колонок, которые подстрочный поиск определил бы неверно
+DEFAULT_ALIASES = {
+    'first name': 'first_name',
+    'first_name': 'first_name',
+    'last name': 'last_name',
+    'last_name': 'last_name',
+    'surname': 'last_name',
+    'номер телефона': 'phone',
+    'e-mail': 'email',
+    'электронная почта': 'email',
+    'company name': 'company_name',
+    'company_name': 'company_name',
+    'название компании': 'company_name',
+}
+
+
+def normalize_header(header):
+    """Приведение заголовка колонки к виду для сопоставления"""
+    if header is None:
+        return ''
+    return str(header).replace('\ufeff', '').strip().lower()
+
+
+def match_field(header, aliases=None):
+    """Поле контакта для нормализованного заголовка или None"""
+    if not header:
+        return None
+
+    if aliases and header in aliases:
+        return aliases[header]
+    if header in DEFAULT_ALIASES:
+        return DEFAULT_ALIASES[header]
+
+    for field, keywords in FIELD_KEYWORDS:
+        if any(keyword in header for keyword in keywords):
+            return field
+
+    return None
+
+
+class HeaderMapping:
+    """Соответствие колонок файла полям контакта, вычисляемое один раз на файл.
+
+    Явное соответствие column_mapping задается как {заголовок или номер колонки: поле}
+    и имеет приоритет над псевдонимами aliases ({заголовок: поле}) и поиском по подстроке.
+    """
+
+    def __init__(self, headers, column_mapping=None, aliases=None):
+        self.headers = [normalize_header(header) for header in headers]
+        self.width = len(self.headers)
+
+        explicit = {}
+        for key, field in (column_mapping or {}).items():
+            if field not in RECORD_FIELDS:
+                raise ValueError(f"Неизвестное поле контакта: {field}")
+            if isinstance(key, int) or (isinstance(key, str) and key.isdigit()):
+                explicit[int(key)] = field
+            else:
+                explicit[normalize_header(key)] = field
+
+        aliases = {normalize_header(key): field for key, field in (aliases or {}).items()}
+
+        # Как и раньше, при повторе поля значение берется из последней колонки
+        field_columns = {}
+        for index, header in enumerate(self.headers):
+            field = explicit.get(index) or explicit.get(header) or match_field(header, aliases)
+            if field:
+                field_columns[field] = index
+
+        self.fields = tuple(field_columns)
+        self.indices = tuple(field_columns.values())
+        self._getter = itemgetter(*self.indices) if self.indices else None
+
+    def __bool__(self):
+        return bool(self.indices)
+
+    def project(self, row):
+        """Кортеж значений колонок в порядке self.fields"""
+        if self._getter is None:
+            return ()
+        if len(row) < self.width:
+            row = tuple(row) + (None,) * (self.width - len(row))
+        values = self._getter(row)
+        return values if len(self.indices) > 1 else (values,)
@@ -0,0 +1,80 @@
+import csv
+import os
+import tempfile
+import time
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+
+from deals.file_handlers.base_handler import CSVHandler
+
+HEADERS = ['Имя', 'Фамилия', 'Телефон', 'Почта', 'Компания']
+
+
+def legacy_records(file):
+    """Прежнее сопоставление: поиск подстрок для каждой колонки каждой строки"""
+    file.seek(0)
+    reader = csv.DictReader((line.decode('utf-8-sig') for line in file), delimiter=',')
+
+    for row in reader:
+        normalized_row = {}
+        for key, value in row.items():
+            if key:
+                normalized_key = key.strip().lower().replace('\ufeff', '')
+                normalized_row[normalized_key] = value.strip() if value else ''
+
+        record = {
+            'first_name': '',
+            'last_name': '',
+            'phone': '',
+            'email': '',
+            'company_name': ''
+        }
+
+        for key in normalized_row.keys():
+            if any(x in key for x in ['имя', 'name', 'first']):
+                record['first_name'] = normalized_row[key]
+            elif any(x in key for x in ['фамилия', 'last', 'surname']):
+                record['last_name'] = normalized_row[key]
+            elif any(x in key for x in ['телефон', 'phone', 'тел']):
+                record['phone'] = normalized_row[key]
+            elif any(x in key for x in ['почта', 'email', 'mail']):
+                record['email'] = normalized_row[key]
+            elif any(x in key for x in ['компания', 'company']):
+                record['company_name'] = normalized_row[key]
+
+        if record['first_name'] or record['last_name']:
+            yield record
+
+
+class Command(BaseCommand):
+    help = 'Замер скорости чтения CSV: поиск подстрок по строкам против скомпилированного соответствия колонок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Количество строк в тестовом файле')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8-sig', newline='', delete=False) as tmp:
+            writer = csv.writer(tmp)
+            writer.writerow(HEADERS)
+            for i in range(rows):
+                writer.writerow([f'Иван{i}', f'Петров{i}', f'+7900{i:07d}', f'user{i}@example.ru', f'ООО Компания {i % 200}'])
+            path = tmp.name
+
+        try:
+            with open(path, 'rb') as raw:
+                file = File(raw)
+                results = [
+                    ('Поиск подстрок', legacy_records(file)),
+                    ('Скомпилированное соответствие', CSVHandler().iter_records(file)),
+                ]
+
+                for title, records in results:
+                    started = time.perf_counter()
+                    count = sum(1 for _ in records)
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(f"{title}: {count} строк за {elapsed:.2f} с, {count / elapsed:,.0f} строк/с")
+        finally:
+            os.remove(path)
@@ -0,0 +1,89 @@
+import random
+import re
+import time
+
+from django.core.management.base import BaseCommand
+
+from deals.services import normalization
+from deals.services.normalization import normalize_phone, normalize_phones
+
+PHONE_FORMATS = [
+    '8 ({code}) {a}-{b}-{c}',
+    '+7 ({code}) {a}-{b}-{c}',
+    '+7{code}{a}{b}{c}',
+    '7-{code}-{a}-{b}-{c}',
+    '8{code}{a}{b}{c}',
+    '{code} {a} {b} {c}',
+    '8-{code}-{a}{b}{c}',
+    '+7 {code} {a} {b} {c} доб. 12',
+    '{a}-{b}-{c}',
+]
+
+
+def legacy_normalize_phone(phone: str) -> str:
+    """Прежняя нормализация: строковый шаблон re.sub на каждый вызов"""
+    if not phone:
+        return ''
+
+    phone = re.sub(r'[^\d+]', '', phone)
+
+    if not phone:
+        return ''
+
+    if phone.startswith('8') and len(phone) == 11:
+        phone = '+7' + phone[1:]
+    elif phone.startswith('7') and len(phone) == 11:
+        phone = '+' + phone
+    elif len(phone) == 10:
+        phone = '+7' + phone
+    elif not phone.startswith('+') and len(phone) > 10:
+        phone = '+' + phone
+
+    return phone if len(phone) >= 11 else ''
+
+
+def synthetic_phones(count, seed=0):
+    """Телефоны в типичных российских форматах записи"""
+    rnd = random.Random(seed)
+    return [
+        rnd.choice(PHONE_FORMATS).format(
+            code=rnd.randint(900, 999),
+            a=f'{rnd.randint(0, 999):03d}',
+            b=f'{rnd.randint(0, 99):02d}',
+            c=f'{rnd.randint(0, 99):02d}',
+        )
+        for _ in range(count)
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Замер скорости нормализации телефонов: построчно через re.sub против колонки целиком'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Количество телефонов')
+
+    def handle(self, *args, **options):
+        phones = synthetic_phones(options['rows'])
+
+        runs = [
+            ('re.sub со строковым шаблоном', lambda: [legacy_normalize_phone(phone) for phone in phones]),
+            ('Скомпилированный шаблон', lambda: [normalize_phone(phone) for phone in phones]),
+        ]
+        if normalization.pd is not None:
+            runs.append(('Колонка через pandas', lambda: normalize_phones(phones, use_pandas=True)))
+        else:
+            self.stdout.write('pandas не установлен, векторная нормализация пропущена')
+
+        expected = None
+        for title, run in runs:
+            started = time.perf_counter()
+            result = run()
+            elapsed = time.perf_counter() - started
+
+            if expected is None:
+                expected = result
+            elif result != expected:
+                self.stderr.write(f"{title}: результат расходится с прежней нормализацией")
+
+            self.stdout.write(f"{title}: {len(phones)} телефонов за {elapsed:.2f} с, "
+                              f"{len(phones) / elapsed:,.0f} телефонов/с")
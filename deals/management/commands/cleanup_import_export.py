@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from deals.services.retention import RetentionCleaner, get_retention_days
+
+
+class Command(BaseCommand):
+    help = 'Удаление устаревших файлов и журналов задач импорта/экспорта по срокам IMPORT_EXPORT_RETENTION_DAYS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только посчитать, что будет удалено')
+        parser.add_argument('--archive', action='store_true',
+                            help='Сохранять журнал задач в jsonl.gz перед удалением')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Количество строк журнала, удаляемых одним запросом')
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Повторять очистку каждые N секунд вместо однократного запуска')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Сроки хранения, дней: {get_retention_days()}")
+
+        while True:
+            close_old_connections()
+            report = RetentionCleaner(
+                dry_run=options['dry_run'],
+                archive=options['archive'],
+                batch_size=options['batch_size']
+            ).run()
+
+            prefix = 'Будет удалено' if options['dry_run'] else 'Удалено'
+            self.stdout.write(
+                f"{prefix}: файлов экспорта {report['export_files']}, файлов импорта {report['import_files']}, "
+                f"освобождено {report['freed_bytes'] / 1024 / 1024:.1f} МБ, "
+                f"строк журнала {report['records_deleted']} (в архиве {report['records_archived']})"
+            )
+
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from deals.models import ImportExportJob, ImportExportRecord
+from deals.services.import_export_service import HISTORY_FIELDS
+
+
+class Command(BaseCommand):
+    help = 'Планы запросов истории, статуса, скачивания и журнала задач импорта/экспорта'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--job', default=None, help='ID задачи (по умолчанию задача с самым большим журналом)')
+        parser.add_argument('--analyze', action='store_true', help='EXPLAIN ANALYZE: запросы выполняются')
+
+    def handle(self, *args, **options):
+        if options['job']:
+            job = ImportExportJob.objects.filter(id=options['job']).first()
+        else:
+            job = ImportExportJob.objects.order_by('-processed_records').first()
+
+        if job is None:
+            raise CommandError('Нет задач для разбора')
+
+        explain_options = {'analyze': True, 'buffers': True} if options['analyze'] else {}
+
+        queries = [
+            ('История пользователя', ImportExportJob.objects.filter(
+                created_by_id=job.created_by_id
+            ).only(*HISTORY_FIELDS).order_by('-created_at')[:20]),
+            ('Статус задачи', ImportExportJob.objects.filter(
+                id=job.id, created_by_id=job.created_by_id
+            ).values('status', 'processed_records', 'failed_records')),
+            ('Скачивание экспорта', ImportExportJob.objects.filter(
+                id=job.id,
+                created_by_id=job.created_by_id,
+                status=ImportExportJob.STATUS_COMPLETED,
+                job_type=ImportExportJob.JOB_TYPE_EXPORT
+            ).only('id', 'file_name', 'completed_at', 'export_file')),
+            ('Очередь задач', ImportExportJob.objects.filter(
+                status=ImportExportJob.STATUS_PENDING
+            ).order_by('created_at')[:1]),
+            ('Журнал задачи по порядку', ImportExportRecord.objects.filter(job_id=job.id).order_by('record_index')[:500]),
+        ]
+
+        self.stdout.write(f"Задача {job.id}: {job.processed_records} строк журнала")
+
+        for title, queryset in queries:
+            self.stdout.write(f"\n{title}:")
+            self.stdout.write(queryset.explain(**explain_options))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from integration_utils.bitrix24.models import BitrixUserToken
+
+from deals.services.geocoding import address_query, get_geocoder
+from deals.services.rate_limiter import rate_limited
+
+
+class Command(BaseCommand):
+    help = 'Заполнение таблицы координат адресами компаний из crm.address.list'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, default=None,
+                            help='ID пользователя Bitrix24, чей токен используется (по умолчанию последний активный)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Количество адресов, геокодируемых за один проход')
+
+    def handle(self, *args, **options):
+        tokens = BitrixUserToken.objects.filter(is_active=True)
+        if options['user']:
+            tokens = tokens.filter(user_id=options['user'])
+
+        token = tokens.order_by('-id').first()
+        if token is None:
+            raise CommandError('Нет активного токена Bitrix24')
+
+        addresses = rate_limited(token).call_list_method('crm.address.list', {
+            'filter': {'ENTITY_TYPE_ID': 4},
+            'select': ['ENTITY_ID', 'ADDRESS_1', 'CITY', 'REGION', 'PROVINCE', 'COUNTRY']
+        })
+
+        queries = list(dict.fromkeys(filter(None, (address_query(address) for address in addresses))))
+        self.stdout.write(f"Адресов компаний: {len(addresses)}, уникальных: {len(queries)}")
+
+        geocoder = get_geocoder()
+        totals = {'known': 0, 'resolved': 0, 'unresolved': 0}
+
+        batch_size = options['batch_size']
+        for start in range(0, len(queries), batch_size):
+            report = geocoder.prewarm(queries[start:start + batch_size])
+            for key, value in report.items():
+                totals[key] += value
+
+            self.stdout.write(f"Обработано {min(start + batch_size, len(queries))} из {len(queries)}")
+
+        self.stdout.write(
+            f"Уже известно: {totals['known']}, получено координат: {totals['resolved']}, "
+            f"без координат: {totals['unresolved']}"
+        )
@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from integration_utils.bitrix24.models import BitrixUserToken
+
+from deals.services.company_map import CompanyMapSnapshot
+
+
+class Command(BaseCommand):
+    help = 'Обновление снимка карты компаний портала'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, default=None,
+                            help='ID пользователя Bitrix24, чей токен используется (по умолчанию последний активный)')
+        parser.add_argument('--full', action='store_true',
+                            help='Полное обновление: все компании портала и удаление отсутствующих')
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Повторять обновление каждые N секунд вместо однократного запуска')
+
+    def handle(self, *args, **options):
+        full = options['full']
+
+        while True:
+            close_old_connections()
+            self.refresh(options['user'], full)
+
+            if not options['interval']:
+                break
+            full = False
+            time.sleep(options['interval'])
+
+    def refresh(self, user_id, full):
+        tokens = BitrixUserToken.objects.filter(is_active=True)
+        if user_id:
+            tokens = tokens.filter(user_id=user_id)
+
+        token = tokens.order_by('-id').first()
+        if token is None:
+            raise CommandError('Нет активного токена Bitrix24')
+
+        snapshot = CompanyMapSnapshot(token)
+        report = snapshot.refresh(full=full)
+        geocoded = snapshot.geocode_all()
+
+        if report is None:
+            self.stdout.write(
+                f"Снимок портала {snapshot.portal} свежий или обновляется другим процессом, "
+                f"дописано координат {geocoded}, ожидают геокодирования {snapshot.pending_count()}"
+            )
+            return
+
+        self.stdout.write(
+            f"Портал {snapshot.portal}: {'полное' if report['full'] else 'частичное'} обновление, "
+            f"изменено компаний {report['changed']}, сохранено точек {report['saved']}, "
+            f"удалено {report['removed']}, дописано координат и логотипов {report['filled'] + geocoded}, "
+            f"ожидают геокодирования {snapshot.pending_count()}"
+        )
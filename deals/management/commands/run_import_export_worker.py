@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from deals.services.job_runner import JobRunner
+
+
+class Command(BaseCommand):
+    help = 'Обработчик очереди задач импорта/экспорта контактов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help='Количество параллельных обработчиков')
+        parser.add_argument('--poll-interval', type=float, default=None,
+                            help='Интервал опроса очереди в секундах')
+
+    def handle(self, *args, **options):
+        runner = JobRunner(
+            concurrency=options['concurrency'],
+            poll_interval=options['poll_interval']
+        )
+        self.stdout.write(f"Обработчиков: {runner.concurrency}, интервал опроса: {runner.poll_interval} с")
+        runner.run_forever()
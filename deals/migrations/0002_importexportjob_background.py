@@ -0,0 +1,27 @@
+import django.core.files.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importexportjob',
+            name='source_file',
+            field=models.FileField(blank=True, null=True, storage=django.core.files.storage.FileSystemStorage(location='media/import_files'), upload_to='import_files/'),
+        ),
+        migrations.AddField(
+            model_name='importexportjob',
+            name='attempts',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='importexportjob',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
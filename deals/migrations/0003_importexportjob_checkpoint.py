@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0002_importexportjob_background'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importexportjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='importexportjob',
+            name='checkpoint_index',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
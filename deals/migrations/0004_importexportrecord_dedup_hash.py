@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0003_importexportjob_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importexportrecord',
+            name='phone_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=40),
+        ),
+        migrations.AddField(
+            model_name='importexportrecord',
+            name='email_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=40),
+        ),
+    ]
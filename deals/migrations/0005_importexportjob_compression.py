@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0004_importexportrecord_dedup_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importexportjob',
+            name='compression',
+            field=models.CharField(blank=True, choices=[('', 'Без сжатия'), ('gzip', 'GZIP'), ('zip', 'ZIP частями')], default='', max_length=10),
+        ),
+    ]
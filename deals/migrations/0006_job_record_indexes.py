@@ -0,0 +1,42 @@
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_records(apps, schema_editor):
+    """Удаление повторных строк журнала (job, record_index) перед уникальным ограничением"""
+    ImportExportRecord = apps.get_model('deals', 'ImportExportRecord')
+
+    duplicates = (
+        ImportExportRecord.objects.values('job_id', 'record_index')
+        .annotate(count=Count('id'), first_id=Min('id'))
+        .filter(count__gt=1)
+        .order_by()
+    )
+    for duplicate in duplicates.iterator():
+        ImportExportRecord.objects.filter(
+            job_id=duplicate['job_id'],
+            record_index=duplicate['record_index']
+        ).exclude(id=duplicate['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0005_importexportjob_compression'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='importexportjob',
+            index=models.Index(fields=['created_by', '-created_at'], name='deals_job_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='importexportjob',
+            index=models.Index(fields=['status', 'created_at'], name='deals_job_status_created_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_records, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='importexportrecord',
+            constraint=models.UniqueConstraint(fields=['job', 'record_index'], name='deals_record_job_index_uniq'),
+        ),
+    ]
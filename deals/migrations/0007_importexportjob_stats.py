@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0006_job_record_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importexportjob',
+            name='stats',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0007_importexportjob_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodedAddress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address_hash', models.CharField(max_length=40, unique=True)),
+                ('address', models.TextField()),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('source', models.CharField(default='yandex', max_length=20)),
+                ('fetched_at', models.DateTimeField()),
+            ],
+        ),
+    ]
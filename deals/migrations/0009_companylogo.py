@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0008_geocodedaddress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanyLogo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('company_id', models.IntegerField(unique=True)),
+                ('file_id', models.CharField(max_length=50)),
+                ('content_hash', models.CharField(db_index=True, max_length=40)),
+                ('file_name', models.CharField(max_length=255)),
+                ('thumbnail_name', models.CharField(blank=True, max_length=255)),
+                ('synced_at', models.DateTimeField()),
+            ],
+        ),
+    ]
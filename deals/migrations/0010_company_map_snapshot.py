@@ -0,0 +1,44 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0009_companylogo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanyMapPoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('portal', models.CharField(max_length=255)),
+                ('company_id', models.IntegerField()),
+                ('title', models.CharField(max_length=255)),
+                ('description', models.TextField(blank=True)),
+                ('address', models.TextField()),
+                ('query', models.TextField()),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('logo_file_id', models.CharField(blank=True, max_length=50)),
+                ('logo_download_url', models.TextField(blank=True)),
+                ('logo_url', models.TextField(blank=True)),
+                ('date_modify', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'constraints': [
+                    models.UniqueConstraint(fields=('portal', 'company_id'), name='deals_map_point_portal_company_uniq'),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name='CompanyMapState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('portal', models.CharField(max_length=255, unique=True)),
+                ('last_modified', models.DateTimeField(blank=True, null=True)),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True)),
+                ('full_refreshed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
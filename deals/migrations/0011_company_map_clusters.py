@@ -0,0 +1,34 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0010_company_map_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='companymappoint',
+            index=models.Index(fields=['portal', 'latitude', 'longitude'], name='deals_map_point_geo_idx'),
+        ),
+        migrations.CreateModel(
+            name='CompanyMapCluster',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('portal', models.CharField(max_length=255)),
+                ('zoom', models.PositiveSmallIntegerField()),
+                ('cell_x', models.IntegerField()),
+                ('cell_y', models.IntegerField()),
+                ('count', models.IntegerField()),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('company_id', models.IntegerField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['portal', 'zoom', 'latitude', 'longitude'], name='deals_map_cluster_geo_idx'),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0011_company_map_clusters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='companylogo',
+            name='file_id',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='companylogo',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=40),
+        ),
+        migrations.AlterField(
+            model_name='companylogo',
+            name='file_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='companylogo',
+            name='synced_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='companylogo',
+            name='failed_file_id',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='companylogo',
+            name='failed_url',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='companylogo',
+            name='failed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0012_companylogo_failure'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='companymappoint',
+            name='geocode_failed',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0013_companymappoint_geocode_failed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importexportjob',
+            name='run_after',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0014_importexportjob_run_after'),
+    ]
+
+    operations = [
+        # Индекс created_by_id дублирует префикс составного индекса deals_job_user_created_idx
+        migrations.AlterField(
+            model_name='importexportjob',
+            name='created_by',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE,
+                                    to='bitrix24.bitrixuser'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations, models
+
+
+def remove_unscoped_logos(apps, schema_editor):
+    """Строки без портала не сопоставить с компанией; файлы по хэшу остаются и переиспользуются"""
+    apps.get_model('deals', 'CompanyLogo').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0015_importexportjob_created_by_no_fk_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_unscoped_logos, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='companylogo',
+            name='portal',
+            field=models.CharField(default='', max_length=255),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='companylogo',
+            name='company_id',
+            field=models.IntegerField(),
+        ),
+        migrations.AddConstraint(
+            model_name='companylogo',
+            constraint=models.UniqueConstraint(fields=['portal', 'company_id'], name='deals_logo_portal_company_uniq'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0016_companylogo_portal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='companymapstate',
+            name='clusters_stale',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='companymapstate',
+            name='clustered_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deals', '0017_companymapstate_clusters_stale'),
+    ]
+
+    operations = [
+        # Индекс job_id дублирует префикс ограничения deals_record_job_index_uniq
+        migrations.AlterField(
+            model_name='importexportrecord',
+            name='job',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE,
+                                    related_name='records', to='deals.importexportjob'),
+        ),
+    ]
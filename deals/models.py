@@ -53,6 +53,15 @@ class ImportExportJob(models.Model):
         (FORMAT_XLSX, 'XLSX'),
     ]
 
+    COMPRESSION_NONE = ''
+    COMPRESSION_GZIP = 'gzip'
+    COMPRESSION_ZIP = 'zip'
+    COMPRESSION_CHOICES = [
+        (COMPRESSION_NONE, 'Без сжатия'),
+        (COMPRESSION_GZIP, 'GZIP'),
+        (COMPRESSION_ZIP, 'ZIP частями'),
+    ]
+
     STATUS_PENDING = 'pending'
     STATUS_PROCESSING = 'processing'
     STATUS_COMPLETED = 'completed'
@@ -67,8 +76,10 @@ class ImportExportJob(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     job_type = models.CharField(max_length=10, choices=JOB_TYPE_CHOICES)
     file_format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    compression = models.CharField(max_length=10, choices=COMPRESSION_CHOICES, default=COMPRESSION_NONE, blank=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
-    created_by = models.ForeignKey(BitrixUser, on_delete=models.CASCADE)
+    # Отдельный индекс внешнего ключа не нужен: его покрывает deals_job_user_created_idx
+    created_by = models.ForeignKey(BitrixUser, on_delete=models.CASCADE, db_index=False)
     created_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
     total_records = models.IntegerField(default=0)
@@ -84,9 +95,27 @@ class ImportExportJob(models.Model):
         blank=True,
         storage=FileSystemStorage(location='media/export_files')
     )
+    source_file = models.FileField(
+        upload_to='import_files/',
+        null=True,
+        blank=True,
+        storage=FileSystemStorage(location='media/import_files')
+    )
+    attempts = models.IntegerField(default=0)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    run_after = models.DateTimeField(null=True, blank=True)
+    checkpoint_index = models.IntegerField(null=True, blank=True)
+    stats = models.JSONField(null=True, blank=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # История пользователя: created_by = ? ORDER BY created_at DESC
+            models.Index(fields=['created_by', '-created_at'], name='deals_job_user_created_idx'),
+            # Очередь claim_job: status = 'pending' ORDER BY created_at
+            models.Index(fields=['status', 'created_at'], name='deals_job_status_created_idx'),
+        ]
 
     def get_job_type_display(self):
         """Отображаемое название типа задачи"""
@@ -98,14 +127,135 @@ class ImportExportJob(models.Model):
 
 
 class ImportExportRecord(models.Model):
-    job = models.ForeignKey(ImportExportJob, on_delete=models.CASCADE, related_name='records')
+    job = models.ForeignKey(ImportExportJob, on_delete=models.CASCADE, related_name='records', db_index=False)
     record_index = models.IntegerField()
     contact_data = models.JSONField()
     bitrix_contact_id = models.IntegerField(null=True, blank=True)
     status = models.CharField(max_length=20)
     error_message = models.TextField(blank=True)
+    phone_hash = models.CharField(max_length=40, blank=True, db_index=True)
+    email_hash = models.CharField(max_length=40, blank=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['record_index']
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'record_index'], name='deals_record_job_index_uniq'),
+        ]
+
+
+class GeocodedAddress(models.Model):
+    """Координаты адреса; запись без координат — адрес не найден геокодером"""
+    SOURCE_YANDEX = 'yandex'
+
+    address_hash = models.CharField(max_length=40, unique=True)
+    address = models.TextField()
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    source = models.CharField(max_length=20, default=SOURCE_YANDEX)
+    fetched_at = models.DateTimeField()
+
+    class Meta:
+        app_label = 'deals'
+
+    def __str__(self):
+        return self.address
+
+    @property
+    def coords(self):
+        if self.latitude is None or self.longitude is None:
+            return None
+        return [self.latitude, self.longitude]
+
+
+class CompanyLogo(models.Model):
+    """Зеркало логотипа компании Bitrix24; файл назван по хэшу содержимого.
+
+    failed_* — последняя неудачная загрузка: повторяется только после смены
+    файла логотипа или ссылки на него.
+    """
+    portal = models.CharField(max_length=255)
+    company_id = models.IntegerField()
+    file_id = models.CharField(max_length=50, blank=True)
+    content_hash = models.CharField(max_length=40, blank=True, db_index=True)
+    file_name = models.CharField(max_length=255, blank=True)
+    thumbnail_name = models.CharField(max_length=255, blank=True)
+    synced_at = models.DateTimeField(null=True, blank=True)
+    failed_file_id = models.CharField(max_length=50, blank=True)
+    failed_url = models.TextField(blank=True)
+    failed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        app_label = 'deals'
+        constraints = [
+            models.UniqueConstraint(fields=['portal', 'company_id'], name='deals_logo_portal_company_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.portal} {self.company_id}: {self.file_name}"
+
+
+class CompanyMapPoint(models.Model):
+    """Точка карты компаний: компания портала с адресом, координатами и логотипом"""
+    portal = models.CharField(max_length=255)
+    company_id = models.IntegerField()
+    title = models.CharField(max_length=255)
+    description = models.TextField(blank=True)
+    address = models.TextField()
+    query = models.TextField()
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    geocode_failed = models.BooleanField(default=False)
+    logo_file_id = models.CharField(max_length=50, blank=True)
+    logo_download_url = models.TextField(blank=True)
+    logo_url = models.TextField(blank=True)
+    date_modify = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        app_label = 'deals'
+        constraints = [
+            models.UniqueConstraint(fields=['portal', 'company_id'], name='deals_map_point_portal_company_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['portal', 'latitude', 'longitude'], name='deals_map_point_geo_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.title} ({self.portal})"
+
+
+class CompanyMapCluster(models.Model):
+    """Ячейка сетки кластеризации точек карты на уровне масштаба; при count = 1 — сама компания"""
+    portal = models.CharField(max_length=255)
+    zoom = models.PositiveSmallIntegerField()
+    cell_x = models.IntegerField()
+    cell_y = models.IntegerField()
+    count = models.IntegerField()
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    company_id = models.IntegerField(null=True, blank=True)
 
+    class Meta:
+        app_label = 'deals'
+        indexes = [
+            models.Index(fields=['portal', 'zoom', 'latitude', 'longitude'], name='deals_map_cluster_geo_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.portal} z{self.zoom} ({self.cell_x}, {self.cell_y}): {self.count}"
+
+
+class CompanyMapState(models.Model):
+    """Состояние снимка карты компаний портала"""
+    portal = models.CharField(max_length=255, unique=True)
+    last_modified = models.DateTimeField(null=True, blank=True)
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+    full_refreshed_at = models.DateTimeField(null=True, blank=True)
+    clusters_stale = models.BooleanField(default=False)
+    clustered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        app_label = 'deals'
+
+    def __str__(self):
+        return self.portal
@@ -0,0 +1,167 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from django.conf import settings
+
+from .rate_limiter import is_limit_error, rate_limited
+
+logger = logging.getLogger(__name__)
+
+BATCH_LIMIT = 50
+
+# Временные ошибки, по которым неизвестно, выполнилась ли команда: повторяются
+# только идемпотентные команды. Лимиты запросов (QUERY_LIMIT_EXCEEDED,
+# OPERATION_TIME_LIMIT) означают, что команда не выполнялась, и повторяются всегда
+UNCERTAIN_ERRORS = ('INTERNAL_SERVER_ERROR', 'TIMEOUT')
+
+
+def unwrap_batch_result(result):
+    """Результат команды batch: значение под ключом result или сам ответ"""
+    if isinstance(result, dict) and 'result' in result:
+        return result['result']
+    return result
+
+
+def chunked(items, size=BATCH_LIMIT):
+    """Список, разбитый на части не длиннее size"""
+    items = list(items)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def error_message(error) -> str:
+    """Текст ошибки Bitrix24 из ответа или исключения"""
+    if isinstance(error, dict):
+        code = error.get('error')
+        description = error.get('error_description')
+        if code and description:
+            return f"{code}: {description}"
+        return str(description or code or error)
+    return str(error)
+
+
+def parse_batch_response(response, keys) -> Dict[str, Tuple[bool, object, str]]:
+    """Разбор ответа call_batch в {ключ: (успех, результат, ошибка)}.
+
+    Поддерживаются как полный ответ batch с result/result_error,
+    так и словарь результатов по ключам команд.
+    """
+    results, errors = response, {}
+    for _ in range(2):
+        if (isinstance(results, dict) and not any(key in results for key in keys)
+                and isinstance(results.get('result'), dict)):
+            errors = results.get('result_error') or errors
+            results = results['result']
+
+    parsed = {}
+    for key in keys:
+        error = errors.get(key) if isinstance(errors, dict) else None
+        value = results.get(key) if isinstance(results, dict) else None
+
+        if error is None and isinstance(value, dict) and 'error' in value and 'result' not in value:
+            error = value
+
+        if error is not None:
+            parsed[key] = (False, None, error_message(error))
+        elif value is None:
+            parsed[key] = (False, None, 'Нет ответа на команду batch')
+        else:
+            parsed[key] = (True, unwrap_batch_result(value), None)
+
+    return parsed
+
+
+def is_uncertain_error(error: str) -> bool:
+    return any(code in (error or '') for code in UNCERTAIN_ERRORS)
+
+
+def can_retry(error: str, chunk_failed: bool, idempotent: bool) -> bool:
+    """Можно ли отправить неудачную команду повторно, не рискуя выполнить ее дважды"""
+    if is_limit_error(error or ''):
+        return True
+    return idempotent and (chunk_failed or is_uncertain_error(error))
+
+
+class BatchExecutor:
+    """Выполнение произвольного числа команд через call_batch.
+
+    Команды делятся на части по 50 (лимит batch Bitrix24), части выполняются
+    параллельно в пределах лимитера портала. Ошибки разбираются по каждой команде
+    из result_error, повторно отправляются только неудачные команды. Команды,
+    отклоненные по лимиту запросов, повторяются всегда; после внутренней
+    ошибки, таймаута или падения всего запроса batch — только для идемпотентных
+    методов, иначе можно создать записи дважды.
+    """
+
+    def __init__(self, bitrix_token, chunk_size=BATCH_LIMIT, concurrency=None, max_retries=None):
+        self.bitrix_token = rate_limited(bitrix_token)
+        self.chunk_size = min(chunk_size, BATCH_LIMIT)
+        self.concurrency = concurrency or getattr(settings, 'BITRIX_BATCH_CONCURRENCY', 2)
+        self.max_retries = max_retries if max_retries is not None else getattr(settings, 'BITRIX_BATCH_MAX_RETRIES', 2)
+
+    def execute(self, commands: List[Tuple[str, dict]], idempotent: bool = False) -> List[Dict]:
+        """Результаты команд [(метод, параметры)] в исходном порядке.
+
+        Каждый результат: {'success', 'result', 'error', 'original_index'}.
+        """
+        results = [None] * len(commands)
+        pending = list(range(len(commands)))
+        attempt = 0
+
+        while pending:
+            chunks = chunked(pending, self.chunk_size)
+
+            if len(chunks) > 1 and self.concurrency > 1:
+                with ThreadPoolExecutor(max_workers=min(self.concurrency, len(chunks))) as pool:
+                    chunk_results = list(pool.map(lambda chunk: self._run_chunk(commands, chunk), chunks))
+            else:
+                chunk_results = [self._run_chunk(commands, chunk) for chunk in chunks]
+
+            retry = []
+            for chunk_result in chunk_results:
+                for index, (success, result, error, chunk_failed) in chunk_result.items():
+                    results[index] = {
+                        'success': success,
+                        'result': result,
+                        'error': error,
+                        'original_index': index
+                    }
+                    if not success and attempt < self.max_retries and can_retry(error, chunk_failed, idempotent):
+                        retry.append(index)
+
+            if retry:
+                logger.warning(f"Повтор {len(retry)} команд batch, попытка {attempt + 2}")
+
+            pending = sorted(retry)
+            attempt += 1
+
+        return results
+
+    def _run_chunk(self, commands, indices) -> Dict[int, Tuple[bool, object, str, bool]]:
+        """Одна часть команд: {индекс: (успех, результат, ошибка, упал ли весь запрос)}"""
+        if not hasattr(self.bitrix_token, 'call_batch'):
+            return {index: self._run_single(*commands[index]) for index in indices}
+
+        batch_commands = {f"cmd_{index}": commands[index] for index in indices}
+
+        try:
+            response = self.bitrix_token.call_batch(batch_commands)
+        except Exception as e:
+            logger.error(f"Ошибка запроса batch из {len(indices)} команд: {e}")
+            return {index: (False, None, str(e), True) for index in indices}
+
+        parsed = parse_batch_response(response, list(batch_commands))
+        return {
+            index: parsed[f"cmd_{index}"] + (False,)
+            for index in indices
+        }
+
+    def _run_single(self, method, params) -> Tuple[bool, object, str, bool]:
+        try:
+            response = self.bitrix_token.call_api_method(method, params)
+        except Exception as e:
+            return False, None, str(e), True
+
+        if isinstance(response, dict) and 'error' in response and 'result' not in response:
+            return False, None, error_message(response), False
+        return True, unwrap_batch_result(response), None, False
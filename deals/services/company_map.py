@@ -0,0 +1,452 @@
+import logging
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, Max, Min, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from ..models import CompanyMapCluster, CompanyMapPoint, CompanyMapState
+from .geocoding import address_query, format_address, get_geocoder
+from .logo_store import get_logo_store, logo_file_id
+from .rate_limiter import get_portal_name, rate_limited
+
+logger = logging.getLogger(__name__)
+
+COMPANY_SELECT = ['ID', 'TITLE', 'LOGO', 'COMMENTS', 'DATE_MODIFY']
+ADDRESS_SELECT = ['ENTITY_ID', 'ADDRESS_1', 'CITY', 'REGION', 'PROVINCE', 'COUNTRY']
+ENTITY_TYPE_COMPANY = 4
+ADDRESS_FILTER_CHUNK = 50
+
+POINT_FIELDS = ['title', 'description', 'address', 'query', 'latitude', 'longitude', 'geocode_failed',
+                'logo_file_id', 'logo_download_url', 'logo_url', 'date_modify']
+MAP_POINT_FIELDS = ['company_id', 'title', 'description', 'address', 'latitude', 'longitude', 'logo_url']
+
+# Сетка кластеризации в пикселях тайловой проекции Меркатора
+TILE_SIZE = 256
+MAX_LATITUDE = 85.0511
+
+
+def world_pixel(latitude, longitude):
+    """Координаты точки в пикселях карты на масштабе 0"""
+    latitude = max(min(latitude, MAX_LATITUDE), -MAX_LATITUDE)
+    sin = math.sin(math.radians(latitude))
+    x = (longitude + 180) / 360 * TILE_SIZE
+    y = (0.5 - math.log((1 + sin) / (1 - sin)) / (4 * math.pi)) * TILE_SIZE
+    return x, y
+
+
+def map_point(row):
+    """Точка в формате company_map.js"""
+    return {
+        'TITLE': row['title'],
+        'DESCRIPTION': row['description'],
+        'ADDRESS': row['address'],
+        'GEOCODE': [row['latitude'], row['longitude']],
+        'LogoURL': row['logo_url'] or None,
+    }
+
+
+class CompanyMapSnapshot:
+    """Снимок точек карты компаний портала в CompanyMapPoint.
+
+    refresh запрашивает в Bitrix24 только компании, измененные с прошлого
+    обновления (фильтр по DATE_MODIFY), и их адреса; не чаще раза в
+    COMPANY_MAP_REFRESH_INTERVAL секунд на портал. Удаленные в Bitrix24
+    компании обнаруживаются полным обновлением раз в
+    COMPANY_MAP_FULL_REFRESH_HOURS. Координаты и логотипы берутся из
+    локальных хранилищ; недостающие запрашиваются в фоне и дописываются
+    в снимок при следующих обновлениях.
+
+    При изменении координат пересчитываются кластеры CompanyMapCluster для
+    масштабов до COMPANY_MAP_CLUSTER_MAX_ZOOM по сетке
+    COMPANY_MAP_CLUSTER_GRID пикселей; viewport отдает кластеры и точки
+    видимой области.
+    """
+
+    def __init__(self, bitrix_token):
+        self.bitrix_token = bitrix_token
+        self.portal = get_portal_name(bitrix_token)
+        self.refresh_interval = timedelta(seconds=getattr(settings, 'COMPANY_MAP_REFRESH_INTERVAL', 60))
+        self.full_refresh_interval = timedelta(hours=getattr(settings, 'COMPANY_MAP_FULL_REFRESH_HOURS', 24))
+        self.cluster_max_zoom = getattr(settings, 'COMPANY_MAP_CLUSTER_MAX_ZOOM', 15)
+        self.cluster_grid = getattr(settings, 'COMPANY_MAP_CLUSTER_GRID', 64)
+        self.points_limit = getattr(settings, 'COMPANY_MAP_POINTS_LIMIT', 2000)
+        self.geocode_batch = getattr(settings, 'COMPANY_MAP_GEOCODE_BATCH', 50)
+        self.cluster_rebuild_interval = timedelta(
+            seconds=getattr(settings, 'COMPANY_MAP_CLUSTER_REBUILD_INTERVAL', 30)
+        )
+
+    def points(self):
+        return CompanyMapPoint.objects.filter(portal=self.portal)
+
+    def refresh(self, full=False) -> Optional[dict]:
+        """Обновление снимка; None — снимок свежий или обновляется другим запросом"""
+        now = timezone.now()
+        state, _ = CompanyMapState.objects.get_or_create(portal=self.portal)
+
+        if not self._claim(state, now, force=full):
+            return None
+
+        full = (
+            full
+            or state.last_modified is None
+            or state.full_refreshed_at is None
+            or state.full_refreshed_at < now - self.full_refresh_interval
+        )
+
+        but = rate_limited(self.bitrix_token)
+        params = {'select': COMPANY_SELECT, 'order': {'DATE_MODIFY': 'ASC'}}
+        if not full:
+            # Нестрогое сравнение: DATE_MODIFY хранится с точностью до секунды
+            params['filter'] = {'>=DATE_MODIFY': state.last_modified.isoformat()}
+
+        companies = but.call_list_method('crm.company.list', params) or []
+        addresses = self._load_addresses(but, [company['ID'] for company in companies], full)
+
+        located = []
+        for company in companies:
+            address = addresses.get(str(company['ID']))
+            query = address_query(address) if address else ''
+            if query:
+                located.append((company, address, query))
+
+        geocodes, _ = get_geocoder().geocode_many([query for _, _, query in located], timeout=0)
+        logo_urls = get_logo_store().logo_urls(self.portal, (company for company, _, _ in located))
+
+        rows = []
+        for company, address, query in located:
+            logo = company.get('LOGO') or {}
+            geocode = geocodes.get(query) or (None, None)
+            rows.append(CompanyMapPoint(
+                portal=self.portal,
+                company_id=int(company['ID']),
+                title=company.get('TITLE') or '',
+                description=company.get('COMMENTS') or '',
+                address=format_address(address),
+                query=query,
+                latitude=geocode[0],
+                longitude=geocode[1],
+                logo_file_id=logo_file_id(company) or '',
+                logo_download_url=logo.get('downloadUrl') or '',
+                logo_url=logo_urls.get(str(company['ID']), ''),
+                date_modify=parse_datetime(company.get('DATE_MODIFY') or ''),
+            ))
+
+        stored_coords = {
+            company_id: (latitude, longitude)
+            for company_id, latitude, longitude in self.points().filter(
+                company_id__in=[row.company_id for row in rows]
+            ).values_list('company_id', 'latitude', 'longitude')
+        }
+        moved = sum(1 for row in rows if stored_coords.get(row.company_id) != (row.latitude, row.longitude))
+
+        CompanyMapPoint.objects.bulk_create(
+            rows,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=['portal', 'company_id'],
+            update_fields=POINT_FIELDS
+        )
+
+        located_ids = {row.company_id for row in rows}
+        if full:
+            removed = self.points().exclude(company_id__in=located_ids)
+        else:
+            removed = self.points().filter(
+                company_id__in=[int(company['ID']) for company in companies if int(company['ID']) not in located_ids]
+            )
+        removed_count, _ = removed.delete()
+
+        located, filled = self._fill_missing()
+
+        clustered = moved or removed_count or located or not CompanyMapCluster.objects.filter(portal=self.portal).exists()
+        if clustered:
+            self.rebuild_clusters()
+
+        modified = [parse_datetime(company.get('DATE_MODIFY') or '') for company in companies]
+        modified = [value for value in modified if value]
+        if state.last_modified:
+            modified.append(state.last_modified)
+
+        state.last_modified = max(modified, default=None)
+        state.refreshed_at = now
+        if full:
+            state.full_refreshed_at = now
+        state.save(update_fields=['last_modified', 'refreshed_at', 'full_refreshed_at'])
+
+        report = {'full': full, 'changed': len(companies), 'saved': len(rows), 'removed': removed_count,
+                  'filled': filled, 'clustered': bool(clustered)}
+        logger.info(f"Снимок карты компаний портала {self.portal} обновлен: {report}")
+        return report
+
+    def _claim(self, state, now, force):
+        """Захват обновления условным UPDATE: параллельные запросы читают текущий снимок"""
+        claimed = CompanyMapState.objects.filter(id=state.id)
+        if not force:
+            claimed = claimed.filter(Q(refreshed_at__isnull=True) | Q(refreshed_at__lt=now - self.refresh_interval))
+        return claimed.update(refreshed_at=now) == 1
+
+    def _load_addresses(self, but, company_ids, full):
+        """Адреса компаний {ID компании: адрес}; при частичном обновлении — только для company_ids"""
+        if full:
+            filters = [{'ENTITY_TYPE_ID': ENTITY_TYPE_COMPANY}]
+        else:
+            filters = [
+                {'ENTITY_TYPE_ID': ENTITY_TYPE_COMPANY, 'ENTITY_ID': company_ids[start:start + ADDRESS_FILTER_CHUNK]}
+                for start in range(0, len(company_ids), ADDRESS_FILTER_CHUNK)
+            ]
+
+        addresses = {}
+        for address_filter in filters:
+            for address in but.call_list_method('crm.address.list', {
+                'filter': address_filter,
+                'select': ADDRESS_SELECT
+            }) or []:
+                addresses[str(address['ENTITY_ID'])] = address
+
+        return addresses
+
+    def pending_count(self):
+        """Количество точек, координаты которых еще ожидаются от геокодера"""
+        return self.points().filter(latitude__isnull=True, geocode_failed=False).count()
+
+    def is_refreshing(self):
+        """Снимок строится: обновление запущено в этом процессе или еще ни разу не завершалось"""
+        with _refreshing_lock:
+            if self.portal in _refreshing:
+                return True
+        return not CompanyMapState.objects.filter(portal=self.portal, refreshed_at__isnull=False).exists()
+
+    def summary(self):
+        """Счетчики точек снимка и границы точек с координатами"""
+        counts = self.points().aggregate(
+            companies=Count('id'), geocoded=Count('latitude'),
+            south=Min('latitude'), west=Min('longitude'), north=Max('latitude'), east=Max('longitude')
+        )
+        bounds = [[counts['south'], counts['west']], [counts['north'], counts['east']]] if counts['geocoded'] else None
+        return {
+            'companies': counts['companies'],
+            'geocoded': counts['geocoded'],
+            'pending': self.pending_count(),
+            'refreshing': self.is_refreshing(),
+            'bounds': bounds,
+        }
+
+    def geocode_pending(self):
+        """Геокодирование порции адресов снимка без координат с ожиданием до GEOCODER_WAIT_TIMEOUT.
+
+        Запросы берутся только из адресов компаний портала в снимке, не из запроса
+        клиента. Кластеры пересчитываются не чаще COMPANY_MAP_CLUSTER_REBUILD_INTERVAL
+        и сразу, когда ожидающих адресов не осталось. Возвращает
+        (точек получили координаты, осталось ожидающих).
+        """
+        located, _ = self._fill_missing(timeout=None, limit=self.geocode_batch, logos=False)
+        if located:
+            self.mark_clusters_stale()
+
+        pending = self.pending_count()
+        self.rebuild_stale_clusters(force=not pending)
+        return located, pending
+
+    def geocode_all(self):
+        """Геокодирование всех адресов снимка без координат порциями по COMPANY_MAP_GEOCODE_BATCH.
+
+        Останавливается, когда порция не дала ни одной точки: оставшиеся запросы
+        продолжают выполняться в пуле геокодера и дописываются следующим вызовом.
+        """
+        located = 0
+        while True:
+            batch_located, batch_changed = self._fill_missing(timeout=None, limit=self.geocode_batch, logos=False)
+            located += batch_located
+            if not batch_changed or not self.pending_count():
+                break
+
+        if located:
+            self.mark_clusters_stale()
+        self.rebuild_stale_clusters(force=True)
+        return located
+
+    def mark_clusters_stale(self):
+        """Точки получили координаты: кластеры нужно пересчитать"""
+        CompanyMapState.objects.filter(portal=self.portal).update(clusters_stale=True)
+
+    def rebuild_stale_clusters(self, force=False):
+        """Пересчет устаревших кластеров, не чаще COMPANY_MAP_CLUSTER_REBUILD_INTERVAL на портал.
+
+        Право на пересчет захватывается одним UPDATE, поэтому из всех открытых
+        вкладок и фоновых обновлений портала пересчитывает только одно.
+        """
+        now = timezone.now()
+        due = CompanyMapState.objects.filter(portal=self.portal, clusters_stale=True)
+        if not force:
+            due = due.filter(Q(clustered_at__isnull=True) | Q(clustered_at__lte=now - self.cluster_rebuild_interval))
+
+        if not due.update(clusters_stale=False, clustered_at=now):
+            return False
+
+        try:
+            self.rebuild_clusters()
+        except Exception:
+            self.mark_clusters_stale()
+            raise
+        return True
+
+    def _fill_missing(self, timeout=0, limit=None, logos=True):
+        """Дописывает координаты и URL логотипов, появившиеся в локальных хранилищах.
+
+        Адрес, по которому геокодер ответил, что он не найден, помечается
+        geocode_failed и больше не ожидается до следующего изменения компании.
+        Возвращает (точек получили координаты, всего измененных точек).
+        """
+        condition = Q(latitude__isnull=True, geocode_failed=False)
+        if logos:
+            condition |= ~Q(logo_file_id='') & Q(logo_url='')
+
+        missing = self.points().filter(condition).only(
+            'id', 'company_id', 'query', 'latitude', 'longitude', 'geocode_failed',
+            'logo_file_id', 'logo_download_url', 'logo_url'
+        ).order_by('id')
+        missing = list(missing[:limit] if limit else missing)
+
+        if not missing:
+            return 0, 0
+
+        ungeocoded = [point for point in missing if point.latitude is None and not point.geocode_failed]
+        geocodes, pending = get_geocoder().geocode_many([point.query for point in ungeocoded], timeout=timeout)
+        pending = set(pending)
+        ungeocoded_ids = {point.id for point in ungeocoded}
+        logo_urls = get_logo_store().logo_urls(self.portal, [
+            {'ID': point.company_id, 'LOGO': {'id': point.logo_file_id, 'downloadUrl': point.logo_download_url}}
+            for point in missing if point.logo_file_id and not point.logo_url
+        ])
+
+        changed = []
+        located = 0
+        for point in missing:
+            geocode = geocodes.get(point.query) if point.id in ungeocoded_ids else None
+            failed = point.id in ungeocoded_ids and not geocode and point.query not in pending
+            logo_url = logo_urls.get(str(point.company_id)) if not point.logo_url else None
+
+            if geocode:
+                point.latitude, point.longitude = geocode
+                located += 1
+            if failed:
+                point.geocode_failed = True
+            if logo_url:
+                point.logo_url = logo_url
+            if geocode or failed or logo_url:
+                changed.append(point)
+
+        CompanyMapPoint.objects.bulk_update(
+            changed, ['latitude', 'longitude', 'geocode_failed', 'logo_url'], batch_size=500
+        )
+        return located, len(changed)
+
+    def rebuild_clusters(self):
+        """Пересчет кластеров всех масштабов по точкам с координатами"""
+        located = [
+            (company_id, latitude, longitude, *world_pixel(latitude, longitude))
+            for company_id, latitude, longitude in self.points().filter(
+                latitude__isnull=False
+            ).values_list('company_id', 'latitude', 'longitude').iterator()
+        ]
+
+        clusters = []
+        for zoom in range(self.cluster_max_zoom + 1):
+            cell_size = self.cluster_grid / 2 ** zoom
+            cells = {}
+
+            for company_id, latitude, longitude, x, y in located:
+                cell = cells.setdefault((int(x // cell_size), int(y // cell_size)), [0, 0.0, 0.0, company_id])
+                cell[0] += 1
+                cell[1] += latitude
+                cell[2] += longitude
+
+            clusters.extend(
+                CompanyMapCluster(
+                    portal=self.portal,
+                    zoom=zoom,
+                    cell_x=cell_x,
+                    cell_y=cell_y,
+                    count=count,
+                    latitude=latitude_sum / count,
+                    longitude=longitude_sum / count,
+                    company_id=company_id if count == 1 else None,
+                )
+                for (cell_x, cell_y), (count, latitude_sum, longitude_sum, company_id) in cells.items()
+            )
+
+        with transaction.atomic():
+            # Параллельные пересчеты портала выполняются по очереди, иначе кластеры задвоятся
+            CompanyMapState.objects.select_for_update().filter(portal=self.portal).first()
+            CompanyMapCluster.objects.filter(portal=self.portal).delete()
+            CompanyMapCluster.objects.bulk_create(clusters, batch_size=1000)
+
+        return len(clusters)
+
+    def viewport(self, south, west, north, east, zoom):
+        """Кластеры и точки в границах области; выше COMPANY_MAP_CLUSTER_MAX_ZOOM — только точки"""
+        bounds = Q(latitude__gte=south, latitude__lte=north)
+        if west <= east:
+            bounds &= Q(longitude__gte=west, longitude__lte=east)
+        else:
+            # Область пересекает 180-й меридиан
+            bounds &= Q(longitude__gte=west) | Q(longitude__lte=east)
+
+        if zoom > self.cluster_max_zoom:
+            rows = self.points().filter(bounds).values(*MAP_POINT_FIELDS)[:self.points_limit]
+            return {'clusters': [], 'points': [map_point(row) for row in rows]}
+
+        cells = list(CompanyMapCluster.objects.filter(bounds, portal=self.portal, zoom=zoom).values(
+            'count', 'latitude', 'longitude', 'company_id'
+        )[:self.points_limit])
+
+        single_ids = [cell['company_id'] for cell in cells if cell['count'] == 1]
+        points = self.points().filter(company_id__in=single_ids).values(*MAP_POINT_FIELDS) if single_ids else []
+
+        return {
+            'clusters': [
+                {'GEOCODE': [cell['latitude'], cell['longitude']], 'COUNT': cell['count']}
+                for cell in cells if cell['count'] > 1
+            ],
+            'points': [map_point(row) for row in points],
+        }
+
+
+_refresh_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='company-map')
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def schedule_refresh(bitrix_token):
+    """Фоновое обновление снимка портала без ожидания; False — обновление уже запущено"""
+    portal = get_portal_name(bitrix_token)
+
+    with _refreshing_lock:
+        if portal in _refreshing:
+            return False
+        _refreshing.add(portal)
+
+    _refresh_pool.submit(_run_refresh, portal, bitrix_token)
+    return True
+
+
+def _run_refresh(portal, bitrix_token):
+    try:
+        close_old_connections()
+        snapshot = CompanyMapSnapshot(bitrix_token)
+        snapshot.refresh()
+        # Адреса, которых не было в хранилище геокодера, дописываются сразу, а не по запросам карты
+        snapshot.geocode_all()
+    except Exception as e:
+        logger.error(f"Ошибка обновления снимка карты компаний портала {portal}: {e}")
+    finally:
+        close_old_connections()
+        with _refreshing_lock:
+            _refreshing.discard(portal)
@@ -0,0 +1,140 @@
+import hashlib
+import logging
+from typing import Dict, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .bitrix_batch import BatchExecutor, chunked
+from .rate_limiter import get_portal_name, rate_limited
+
+logger = logging.getLogger(__name__)
+
+
+class CompanyResolver:
+    """Сопоставление названий компаний с их ID в Bitrix24.
+
+    Названия разрешаются пачками: поиск через batch из crm.company.list,
+    недостающие компании создаются batch из crm.company.add.
+    Найденные ID хранятся в памяти на время задачи и в общем кэше
+    на COMPANY_CACHE_TIMEOUT секунд для следующих задач. Так же, пачками
+    и через кэш, разрешаются названия компаний по ID для экспорта.
+    """
+
+    TITLES_CHUNK = 50
+
+    def __init__(self, bitrix_token, cache_timeout=None):
+        self.bitrix_token = rate_limited(bitrix_token)
+        self.batch_executor = BatchExecutor(self.bitrix_token)
+        self.portal = get_portal_name(bitrix_token)
+        self.cache_timeout = cache_timeout or getattr(settings, 'COMPANY_CACHE_TIMEOUT', 60 * 60 * 24)
+        self._ids = {}
+        self._titles = {}
+
+    @staticmethod
+    def normalize_name(name) -> str:
+        return (name or '').strip()
+
+    def _cache_key(self, name: str) -> str:
+        digest = hashlib.sha1(name.lower().encode('utf-8')).hexdigest()
+        return f'company_id_{self.portal}_{digest}'
+
+    def _title_cache_key(self, company_id: str) -> str:
+        return f'company_title_{self.portal}_{company_id}'
+
+    def get(self, name: str) -> Optional[int]:
+        """ID компании из уже разрешенных названий"""
+        return self._ids.get(self.normalize_name(name))
+
+    def resolve(self, names: Iterable[str], create_missing: bool = True) -> Dict[str, int]:
+        """Разрешение названий в ID компаний, возвращает {название: ID}"""
+        names = {self.normalize_name(name) for name in names} - {''}
+        pending = [name for name in names if name not in self._ids]
+
+        if pending:
+            keys = {self._cache_key(name): name for name in pending}
+            for key, company_id in cache.get_many(list(keys)).items():
+                self._ids[keys[key]] = company_id
+
+            pending = [name for name in pending if name not in self._ids]
+
+        if pending:
+            looked_up = self._find_companies(pending)
+            found = {name: company_id for name, company_id in looked_up.items() if company_id}
+            # Создаются только те, чей поиск прошел успешно и ничего не нашел
+            missing = [name for name, company_id in looked_up.items() if company_id is None]
+
+            if missing and create_missing:
+                found.update(self._create_companies(missing))
+
+            self._ids.update(found)
+            cache.set_many({self._cache_key(name): company_id for name, company_id in found.items()},
+                           timeout=self.cache_timeout)
+
+        return {name: self._ids[name] for name in names if name in self._ids}
+
+    def titles(self, company_ids: Iterable) -> Dict[str, str]:
+        """Названия компаний {ID: название}; ошибка запроса не скрывается, а поднимается вызывающему"""
+        ids = {str(company_id) for company_id in company_ids} - {'', '0'}
+        pending = [company_id for company_id in ids if company_id not in self._titles]
+
+        if pending:
+            keys = {self._title_cache_key(company_id): company_id for company_id in pending}
+            for key, title in cache.get_many(list(keys)).items():
+                self._titles[keys[key]] = title
+
+            pending = [company_id for company_id in pending if company_id not in self._titles]
+
+        if pending:
+            commands = [
+                ('crm.company.list', {'filter': {'@ID': id_chunk}, 'select': ['ID', 'TITLE']})
+                for id_chunk in chunked(pending, self.TITLES_CHUNK)
+            ]
+
+            found = {}
+            for result in self.batch_executor.execute(commands, idempotent=True):
+                if not result['success']:
+                    raise ValueError(f"Ошибка crm.company.list: {result['error']}")
+                for company in result['result'] or []:
+                    found[str(company['ID'])] = company.get('TITLE') or ''
+
+            # Удаленные компании запоминаются только на время задачи
+            self._titles.update({company_id: '' for company_id in pending})
+            self._titles.update(found)
+            cache.set_many({self._title_cache_key(company_id): title for company_id, title in found.items()},
+                           timeout=self.cache_timeout)
+            for company_id, title in found.items():
+                self._ids.setdefault(self.normalize_name(title), int(company_id))
+
+        return {company_id: self._titles[company_id] for company_id in ids if self._titles.get(company_id)}
+
+    def _call(self, method: str, params_by_name: Dict[str, dict], idempotent: bool) -> Dict[str, object]:
+        """Вызов метода для каждого названия, неудачные команды не попадают в ответ"""
+        names = list(params_by_name)
+        commands = [(method, params_by_name[name]) for name in names]
+
+        results = {}
+        for name, result in zip(names, self.batch_executor.execute(commands, idempotent=idempotent)):
+            if result['success']:
+                results[name] = result['result']
+            else:
+                logger.error(f"Ошибка {method} для компании {name}: {result['error']}")
+
+        return results
+
+    def _find_companies(self, names) -> Dict[str, Optional[int]]:
+        """ID найденных компаний; None для отсутствующих, неудачные запросы не попадают в ответ"""
+        results = self._call('crm.company.list', {
+            name: {'filter': {'=TITLE': name}, 'select': ['ID']} for name in names
+        }, idempotent=True)
+        return {
+            name: int(companies[0]['ID']) if companies else None
+            for name, companies in results.items()
+            if isinstance(companies, list)
+        }
+
+    def _create_companies(self, names) -> Dict[str, int]:
+        results = self._call('crm.company.add', {
+            name: {'fields': {'TITLE': name}} for name in names
+        }, idempotent=False)
+        return {name: int(company_id) for name, company_id in results.items() if str(company_id).isdigit()}
@@ -0,0 +1,209 @@
+import hashlib
+import logging
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from django.conf import settings
+from django.db.models import Q
+
+from ..models import ImportExportJob, ImportExportRecord
+from .bitrix_batch import chunked
+from .normalization import normalize_phone
+
+logger = logging.getLogger(__name__)
+
+DEDUP_SKIP = 'skip'
+DEDUP_UPDATE = 'update'
+DEDUP_CREATE = 'create'
+DEDUP_MODES = (DEDUP_SKIP, DEDUP_UPDATE, DEDUP_CREATE)
+
+COMM_PHONE = 'PHONE'
+COMM_EMAIL = 'EMAIL'
+
+
+def dedup_hash(value: str) -> str:
+    """Хеш нормализованного значения для локального индекса"""
+    return hashlib.sha1(value.encode('utf-8')).hexdigest() if value else ''
+
+
+class ContactDeduplicator:
+    """Поиск уже существующих контактов для строк импорта.
+
+    Телефоны и email строк нормализуются и проверяются пачками: сначала по
+    локальному индексу хешей строк, ранее импортированных тем же владельцем
+    задачи (owner_id), в ImportExportRecord (найденные ID сверяются с Bitrix24,
+    удаленные контакты отбрасываются),
+    остальные значения — через crm.duplicate.findbycomm по FINDBYCOMM_CHUNK
+    значений в команде. Ответ findbycomm не говорит, какое значение совпало,
+    поэтому части с совпадениями переспрашиваются по одному значению.
+    """
+
+    FINDBYCOMM_CHUNK = 20
+
+    def __init__(self, contact_service, mode=None, owner_id=None):
+        mode = mode or getattr(settings, 'CONTACT_DEDUP_MODE', DEDUP_SKIP)
+        if mode not in DEDUP_MODES:
+            raise ValueError(f"Неизвестный режим дедупликации: {mode}")
+
+        self.mode = mode
+        self.owner_id = owner_id
+        self.contact_service = contact_service
+        self.batch_executor = contact_service.batch_executor
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != DEDUP_CREATE
+
+    def comm_values(self, contact: Dict) -> Dict[str, str]:
+        """Нормализованные телефон и email строки {'PHONE': ..., 'EMAIL': ...}"""
+        values = {}
+
+        phone = normalize_phone((contact.get('phone') or '').strip())
+        if phone:
+            values[COMM_PHONE] = phone
+
+        email = (contact.get('email') or '').strip().lower()
+        if email:
+            values[COMM_EMAIL] = email
+
+        return values
+
+    def hashes(self, contact: Dict) -> Dict[str, str]:
+        """Хеши строки для полей phone_hash и email_hash журнала"""
+        values = self.comm_values(contact)
+        return {
+            'phone_hash': dedup_hash(values.get(COMM_PHONE, '')),
+            'email_hash': dedup_hash(values.get(COMM_EMAIL, '')),
+        }
+
+    def find_duplicates(self, contacts: List[Tuple[int, Dict]],
+                        local_only: bool = False) -> Dict[int, Tuple[int, List[str]]]:
+        """Существующие контакты строк {индекс: (ID контакта, совпавшие типы связи)}.
+
+        При local_only проверяется только локальный индекс, без запросов к Bitrix24.
+        """
+        if not self.enabled:
+            return {}
+
+        values_by_index = {index: self.comm_values(contact) for index, contact in contacts}
+        wanted = {item for values in values_by_index.values() for item in values.items()}
+        if not wanted:
+            return {}
+
+        found = self._find_local(wanted, verify=not local_only)
+        if not local_only:
+            found.update(self._find_in_bitrix(wanted - set(found)))
+
+        duplicates = {}
+        for index, values in values_by_index.items():
+            matches = [(found[item], item[0]) for item in values.items() if item in found]
+            if matches:
+                contact_id = min(match_id for match_id, _ in matches)
+                duplicates[index] = (contact_id, [comm_type for match_id, comm_type in matches
+                                                  if match_id == contact_id])
+
+        return duplicates
+
+    def find_repeated(self, contacts: List[Tuple[int, Dict]], first_seen: Dict = None) -> Dict[int, int]:
+        """Строки, повторяющие телефон или email более ранней строки {индекс: индекс первой}.
+
+        first_seen можно передавать между пачками, чтобы искать повторы по всему файлу.
+        """
+        if not self.enabled:
+            return {}
+
+        first_seen = {} if first_seen is None else first_seen
+        repeated = {}
+        for index, contact in contacts:
+            items = list(self.comm_values(contact).items())
+            first = next((first_seen[item] for item in items if item in first_seen), None)
+            if first is not None:
+                repeated[index] = first
+            else:
+                for item in items:
+                    first_seen[item] = index
+
+        return repeated
+
+    def _find_local(self, wanted, verify=True) -> Dict[Tuple[str, str], int]:
+        """Совпадения по журналу строк, ранее импортированных владельцем задачи"""
+        if self.owner_id is None:
+            # Без владельца журнал не с чем ограничить: контакты других порталов не подходят
+            return {}
+
+        by_hash = {
+            COMM_PHONE: {dedup_hash(value): (comm_type, value) for comm_type, value in wanted if comm_type == COMM_PHONE},
+            COMM_EMAIL: {dedup_hash(value): (comm_type, value) for comm_type, value in wanted if comm_type == COMM_EMAIL},
+        }
+
+        rows = ImportExportRecord.objects.filter(
+            job__job_type=ImportExportJob.JOB_TYPE_IMPORT,
+            job__created_by_id=self.owner_id,
+            bitrix_contact_id__isnull=False
+        ).filter(
+            Q(phone_hash__in=list(by_hash[COMM_PHONE])) | Q(email_hash__in=list(by_hash[COMM_EMAIL]))
+        ).values_list('phone_hash', 'email_hash', 'bitrix_contact_id')
+
+        found = {}
+        for phone_hash, email_hash, contact_id in rows:
+            for item in (by_hash[COMM_PHONE].get(phone_hash), by_hash[COMM_EMAIL].get(email_hash)):
+                if item and (item not in found or contact_id < found[item]):
+                    found[item] = contact_id
+
+        if not found or not verify:
+            return found
+
+        try:
+            existing = {
+                int(contact['ID'])
+                for contact in self.contact_service._list_by_ids('crm.contact.list', sorted(set(found.values())), ['ID'])
+            }
+        except ValueError as e:
+            logger.warning(f"Не удалось проверить контакты из локального индекса: {e}")
+            return {}
+
+        return {item: contact_id for item, contact_id in found.items() if contact_id in existing}
+
+    def _find_in_bitrix(self, wanted) -> Dict[Tuple[str, str], int]:
+        """Совпадения через crm.duplicate.findbycomm"""
+        values_by_type = defaultdict(list)
+        for comm_type, value in sorted(wanted):
+            values_by_type[comm_type].append(value)
+
+        chunks = [
+            (comm_type, chunk)
+            for comm_type, values in values_by_type.items()
+            for chunk in chunked(values, self.FINDBYCOMM_CHUNK)
+        ]
+
+        found = {}
+        while chunks:
+            commands = [
+                ('crm.duplicate.findbycomm', {'entity_type': 'CONTACT', 'type': comm_type, 'values': chunk})
+                for comm_type, chunk in chunks
+            ]
+
+            refine = []
+            for (comm_type, chunk), result in zip(chunks, self.batch_executor.execute(commands, idempotent=True)):
+                if not result['success']:
+                    raise ValueError(f"Ошибка поиска дубликатов: {result['error']}")
+
+                contact_ids = self._contact_ids(result['result'])
+                if not contact_ids:
+                    continue
+
+                if len(chunk) == 1:
+                    found[(comm_type, chunk[0])] = min(contact_ids)
+                else:
+                    refine.extend((comm_type, [value]) for value in chunk)
+
+            chunks = refine
+
+        return found
+
+    @staticmethod
+    def _contact_ids(result) -> List[int]:
+        """ID контактов из ответа findbycomm ({'CONTACT': [...]} или пустой список)"""
+        if not isinstance(result, dict):
+            return []
+        return [int(contact_id) for contact_id in result.get('CONTACT') or []]
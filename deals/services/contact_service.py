@@ -1,7 +1,14 @@
 import logging
-import re
-from typing import List, Dict, Any
-import time
+from collections import defaultdict
+from typing import List, Dict, Any, Iterator, Tuple
+
+from django.conf import settings
+
+from .bitrix_batch import BATCH_LIMIT, BatchExecutor, chunked
+from .company_resolver import CompanyResolver
+from .contact_dedup import ContactDeduplicator, DEDUP_UPDATE
+from .normalization import is_valid_email, normalize_phone, validate_contacts
+from .rate_limiter import rate_limited
 
 logger = logging.getLogger(__name__)
 
@@ -9,8 +16,14 @@ logger = logging.getLogger(__name__)
 class ContactService:
     """Сервис для работы с контактами Bitrix24"""
 
-    def __init__(self, bitrix_token):
-        self.bitrix_token = bitrix_token
+    PAGE_SIZE = 50
+    BATCH_LIMIT = BATCH_LIMIT
+
+    def __init__(self, bitrix_token, dedup_mode=None, owner_id=None):
+        self.bitrix_token = rate_limited(bitrix_token)
+        self.batch_executor = BatchExecutor(self.bitrix_token)
+        self.company_resolver = CompanyResolver(self.bitrix_token)
+        self.deduplicator = ContactDeduplicator(self, dedup_mode, owner_id=owner_id)
         self._check_batch_capabilities()
 
     def _check_batch_capabilities(self):
@@ -36,85 +49,133 @@ class ContactService:
             return results
 
         validated_contacts = []
-        for i, contact in enumerate(contacts_data):
-            validated_contact = self._validate_contact(contact)
+        for i, (validated_contact, reasons) in enumerate(validate_contacts(contacts_data)):
             if validated_contact:
                 validated_contacts.append((i, validated_contact))
             else:
                 results.append({
                     'success': False,
-                    'error': 'Невалидные данные контакта',
+                    'contact_id': None,
+                    'error': 'Невалидные данные контакта: ' + '; '.join(reasons),
                     'original_index': i
                 })
 
         if not validated_contacts:
             return results
 
+        self.company_resolver.resolve(contact.get('company_name', '') for _, contact in validated_contacts)
+
+        duplicates = self.deduplicator.find_duplicates(validated_contacts)
+        repeated = self.deduplicator.find_repeated(
+            [(i, contact) for i, contact in validated_contacts if i not in duplicates]
+        )
+        new_contacts = [(i, contact) for i, contact in validated_contacts
+                        if i not in duplicates and i not in repeated]
+
         if hasattr(self.bitrix_token, 'call_batch'):
-            return self._create_contacts_with_batch(validated_contacts)
+            created = self._create_contacts_with_batch(new_contacts)
         else:
-            return self._create_contacts_sequential(validated_contacts)
+            created = self._create_contacts_sequential(new_contacts)
+
+        results.extend(created)
+        results.extend(self._apply_duplicates(validated_contacts, duplicates))
+
+        created_ids = {result['original_index']: result['contact_id'] for result in created}
+        for i, first_index in repeated.items():
+            contact_id = created_ids.get(first_index)
+            results.append({
+                'success': bool(contact_id),
+                'contact_id': contact_id,
+                'status': 'skipped',
+                'error': None if contact_id else f'Дубликат строки {first_index + 1}, которая не импортирована',
+                'original_index': i
+            })
 
-    def _create_contacts_with_batch(self, validated_contacts: List[tuple]) -> List[Dict]:
-        """Создание контактов через batch API"""
-        results = []
+        results.sort(key=lambda result: result['original_index'])
+        return results
 
-        try:
-            commands = {}
+    def _contact_fields(self, contact: Dict, exclude: List[str] = ()) -> Dict:
+        """Поля crm.contact.add/update из проверенной строки импорта"""
+        fields = {
+            'NAME': contact.get('first_name', ''),
+            'LAST_NAME': contact.get('last_name', ''),
+        }
+
+        # Телефон и email уже нормализованы и проверены в validate_contacts
+        if contact.get('phone') and 'PHONE' not in exclude:
+            fields['PHONE'] = [{'VALUE': contact['phone'], 'VALUE_TYPE': 'WORK'}]
+
+        if contact.get('email') and 'EMAIL' not in exclude:
+            fields['EMAIL'] = [{'VALUE': contact['email'], 'VALUE_TYPE': 'WORK'}]
+
+        company_id = self.company_resolver.get(contact.get('company_name', ''))
+        if company_id:
+            fields['COMPANY_ID'] = company_id
+
+        return fields
+
+    def _apply_duplicates(self, validated_contacts: List[tuple], duplicates: Dict[int, tuple]) -> List[Dict]:
+        """Строки с найденным контактом: пропуск или обновление по режиму дедупликации"""
+        rows = [(i, contact) + duplicates[i] for i, contact in validated_contacts if i in duplicates]
+        if not rows:
+            return []
+
+        if self.deduplicator.mode != DEDUP_UPDATE:
+            return [{
+                'success': True,
+                'contact_id': contact_id,
+                'status': 'skipped',
+                'error': None,
+                'original_index': i
+            } for i, contact, contact_id, matched in rows]
+
+        # Совпавшие телефон/email не передаются: множественные поля в update добавляют значения
+        commands = [
+            ('crm.contact.update', {'id': contact_id, 'fields': self._contact_fields(contact, exclude=matched)})
+            for i, contact, contact_id, matched in rows
+        ]
 
-            for original_index, contact in validated_contacts:
-                cmd_id = f"contact_{original_index}"
+        results = []
+        for (i, contact, contact_id, matched), result in zip(rows, self.batch_executor.execute(commands, idempotent=True)):
+            if not result['success']:
+                logger.error(f"Ошибка обновления контакта {contact_id}: {result['error']}")
+
+            results.append({
+                'success': result['success'],
+                'contact_id': contact_id if result['success'] else None,
+                'status': 'updated',
+                'error': result['error'],
+                'original_index': i
+            })
 
-                fields = {
-                    'NAME': contact.get('first_name', ''),
-                    'LAST_NAME': contact.get('last_name', ''),
-                }
+        return results
 
-                if contact.get('phone'):
-                    phone = self._normalize_phone(contact['phone'])
-                    if phone:
-                        fields['PHONE'] = [{'VALUE': phone, 'VALUE_TYPE': 'WORK'}]
-
-                if contact.get('email'):
-                    email = contact['email'].strip()
-                    if self._is_valid_email(email):
-                        fields['EMAIL'] = [{'VALUE': email, 'VALUE_TYPE': 'WORK'}]
-
-
-                company_name = contact.get('company_name', '').strip()
-                if company_name:
-                    fields['COMPANY_NAME'] = company_name
-
-                commands[cmd_id] = ('crm.contact.add', {'fields': fields})
-
-            batch_results = self.bitrix_token.call_batch(commands)
-
-            for cmd_id, result in batch_results.items():
-                original_index = int(cmd_id.split('_')[1])
-
-                if result and 'result' in result and result['result']:
-                    contact_id = result['result']
-                    results.append({
-                        'success': True,
-                        'contact_id': contact_id,
-                        'error': None,
-                        'original_index': original_index
-                    })
-                else:
-                    error_msg = result.get('error_description',
-                                           result.get('error',
-                                                      str(result) if result else 'Unknown error'))
-                    results.append({
-                        'success': False,
-                        'contact_id': None,
-                        'error': error_msg,
-                        'original_index': original_index
-                    })
+    def _create_contacts_with_batch(self, validated_contacts: List[tuple]) -> List[Dict]:
+        """Создание контактов через batch API"""
+        commands = [
+            ('crm.contact.add', {'fields': self._contact_fields(contact)})
+            for original_index, contact in validated_contacts
+        ]
 
-        except Exception as e:
-            logger.error(f"Ошибка batch создания контактов: {e}")
+        # crm.contact.add не идемпотентен: упавший целиком batch не повторяется
+        batch_results = self.batch_executor.execute(commands, idempotent=False)
 
-            results = self._create_contacts_sequential(validated_contacts)
+        results = []
+        for (original_index, contact), result in zip(validated_contacts, batch_results):
+            contact_id = result['result'] if result['success'] else None
+            if result['success'] and not contact_id:
+                result['success'] = False
+                result['error'] = 'Пустой ответ crm.contact.add'
+
+            if not result['success']:
+                logger.error(f"Ошибка создания контакта {original_index}: {result['error']}")
+
+            results.append({
+                'success': result['success'],
+                'contact_id': contact_id,
+                'error': result['error'],
+                'original_index': original_index
+            })
 
         return results
 
@@ -128,9 +189,6 @@ class ContactService:
                 result['original_index'] = original_index
                 results.append(result)
 
-
-                time.sleep(0.1)
-
             except Exception as single_error:
                 logger.error(f"Ошибка создания контакта {original_index}: {single_error}")
                 results.append({
@@ -147,29 +205,7 @@ class ContactService:
         try:
             logger.info(f"Создание контакта: {contact_data.get('first_name')} {contact_data.get('last_name')}")
 
-            fields = {
-                'NAME': contact_data.get('first_name', ''),
-                'LAST_NAME': contact_data.get('last_name', ''),
-            }
-
-
-            if contact_data.get('phone'):
-                phone = self._normalize_phone(contact_data['phone'])
-                if phone:
-                    fields['PHONE'] = [{'VALUE': phone, 'VALUE_TYPE': 'WORK'}]
-
-
-            if contact_data.get('email'):
-                email = contact_data['email'].strip()
-                if self._is_valid_email(email):
-                    fields['EMAIL'] = [{'VALUE': email, 'VALUE_TYPE': 'WORK'}]
-
-
-            company_name = contact_data.get('company_name', '').strip()
-            if company_name:
-                company_id = self._find_or_create_company(company_name)
-                if company_id:
-                    fields['COMPANY_ID'] = company_id
+            fields = self._contact_fields(contact_data)
 
             if hasattr(self.bitrix_token, 'call_api_method'):
                 result = self.bitrix_token.call_api_method('crm.contact.add', {
@@ -206,195 +242,129 @@ class ContactService:
 
     def _validate_contact(self, contact_data: Dict) -> Dict:
         """Валидация и очистка данных контакта"""
-        if not contact_data:
-            return None
-
-        validated = {}
-
-
-        first_name = contact_data.get('first_name', '').strip()
-        last_name = contact_data.get('last_name', '').strip()
-
-        if not first_name and not last_name:
-            return None
-
-        validated['first_name'] = first_name
-        validated['last_name'] = last_name
-
-
-        phone = contact_data.get('phone', '').strip()
-        if phone:
-            validated['phone'] = phone
-
-        email = contact_data.get('email', '').strip()
-        if email and self._is_valid_email(email):
-            validated['email'] = email
-
-        company_name = contact_data.get('company_name', '').strip()
-        if company_name:
-            validated['company_name'] = company_name
-
-        return validated
+        return validate_contacts([contact_data])[0][0]
 
     def _normalize_phone(self, phone: str) -> str:
         """Нормализация номера телефона"""
-        if not phone:
-            return ''
-
-
-        phone = re.sub(r'[^\d+]', '', phone)
-
-        if not phone:
-            return ''
-
-
-        if phone.startswith('8') and len(phone) == 11:
-            phone = '+7' + phone[1:]
-        elif phone.startswith('7') and len(phone) == 11:
-            phone = '+' + phone
-        elif len(phone) == 10:
-            phone = '+7' + phone
-        elif not phone.startswith('+') and len(phone) > 10:
-            phone = '+' + phone
-
-        return phone if len(phone) >= 11 else ''
+        return normalize_phone(phone)
 
     def _is_valid_email(self, email: str) -> bool:
         """Проверка валидности email"""
-        if not email:
-            return False
-
-        pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        return bool(re.match(pattern, email))
+        return is_valid_email(email)
 
     def _find_or_create_company(self, company_name: str) -> int:
         """Поиск или создание компании"""
         if not company_name:
             return None
 
-        try:
-
-            result = self.bitrix_token.call_api_method('crm.company.list', {
-                'filter': {'=TITLE': company_name},
-                'select': ['ID']
-            })
-
-            if result.get('result') and len(result['result']) > 0:
-                return result['result'][0]['ID']
-
-
-            result = self.bitrix_token.call_api_method('crm.company.add', {
-                'fields': {'TITLE': company_name}
-            })
-
-            if result.get('result'):
-                return result['result']
-
-        except Exception as e:
-            logger.error(f"Ошибка работы с компанией {company_name}: {e}")
-
-        return None
+        return self.company_resolver.resolve([company_name]).get(company_name.strip())
 
     def get_contacts(self, filters: Dict = None) -> List[Dict]:
         """Получение контактов с фильтрами через batch"""
-        if filters is None:
-            filters = {}
-
         contacts = []
-        start = 0
-        limit = 50
 
-        while True:
-            try:
-                result = self.bitrix_token.call_api_method('crm.contact.list', {
-                    'filter': filters,
-                    'select': ['ID', 'NAME', 'LAST_NAME', 'PHONE', 'EMAIL', 'COMPANY_ID', 'DATE_CREATE'],
-                    'order': {'DATE_CREATE': 'DESC'},
-                    'start': start
-                })
+        try:
+            total, pages = self.fetch_contact_pages(filters)
+            for page in pages:
+                contacts.extend(page)
+        except Exception as e:
+            logger.error(f"Ошибка получения контактов: {e}")
 
-                if not result or 'result' not in result or not result['result']:
-                    break
+        return contacts
 
-                batch_contacts = result['result']
-                contacts.extend(batch_contacts)
+    def fetch_contact_pages(self, filters: Dict = None, pages_per_batch: int = None) -> Tuple[int, Iterator[List[Dict]]]:
+        """Общее количество контактов и итератор их страниц по порядку.
 
-                if len(batch_contacts) < limit:
-                    break
+        Первая страница запрашивается сразу и сообщает total, остальные смещения
+        start отправляются пачками по pages_per_batch команд crm.contact.list в call_batch.
+        """
+        params = {
+            'filter': filters or {},
+            'select': ['ID', 'NAME', 'LAST_NAME', 'PHONE', 'EMAIL', 'COMPANY_ID', 'DATE_CREATE'],
+            'order': {'DATE_CREATE': 'DESC'},
+        }
 
-                start += limit
+        result = self.bitrix_token.call_api_method('crm.contact.list', {**params, 'start': 0})
+        first_page = result.get('result') or [] if result else []
+        total = int(result.get('total') or len(first_page)) if result else 0
 
+        return total, self._iter_contact_pages(params, first_page, total, pages_per_batch)
 
-                time.sleep(0.1)
+    def _iter_contact_pages(self, params: Dict, first_page: List[Dict], total: int,
+                            pages_per_batch: int = None) -> Iterator[List[Dict]]:
+        if not first_page:
+            return
 
-            except Exception as e:
-                logger.error(f"Ошибка получения контактов: {e}")
-                break
+        yield first_page
 
-        return contacts
+        offsets = list(range(self.PAGE_SIZE, total, self.PAGE_SIZE))
+        if not offsets:
+            return
 
-    def get_contact_companies(self, contact_ids: List[int]) -> Dict[int, str]:
-        """Получение названий компаний для контактов через batch"""
-        if not contact_ids:
-            return {}
+        pages_per_batch = min(pages_per_batch or getattr(settings, 'BITRIX_LIST_PAGES_PER_BATCH', 50),
+                              self.BATCH_LIMIT)
+        group_size = pages_per_batch * self.batch_executor.concurrency
 
-        company_names = {}
+        executor = BatchExecutor(self.bitrix_token, chunk_size=pages_per_batch)
 
-        try:
+        for offsets_group in chunked(offsets, group_size):
+            commands = [('crm.contact.list', {**params, 'start': start}) for start in offsets_group]
 
-            if hasattr(self.bitrix_token, 'call_batch') and len(contact_ids) > 1:
+            for start, result in zip(offsets_group, executor.execute(commands, idempotent=True)):
+                if not result['success']:
+                    raise ValueError(f"Не удалось получить контакты со смещения {start}: {result['error']}")
+                if result['result']:
+                    yield result['result']
 
-                contact_commands = {}
-                for i, contact_id in enumerate(contact_ids):
-                    contact_commands[f"contact_{i}"] = ('crm.contact.get', {'id': contact_id})
+    def get_contact_companies(self, contacts: List) -> Dict[int, str]:
+        """Названия компаний контактов {ID контакта: название}.
 
-                contact_results = self.bitrix_token.call_batch(contact_commands)
+        Принимает контакты с уже выбранным COMPANY_ID или их ID. Названия
+        разрешаются через CompanyResolver; ошибки запросов поднимаются,
+        чтобы задача экспорта завершилась ошибкой, а не выгрузила пустые компании.
+        """
+        if not contacts:
+            return {}
 
-                company_ids = set()
-                contact_company_map = {}
+        if not isinstance(contacts[0], dict):
+            contacts = self._get_contacts_company_ids(contacts)
 
-                for key, result in contact_results.items():
-                    if result and result.get('result') and result['result'].get('COMPANY_ID'):
-                        contact_index = int(key.split('_')[1])
-                        contact_id = contact_ids[contact_index]
-                        company_id = result['result']['COMPANY_ID']
-                        company_ids.add(company_id)
-                        contact_company_map[contact_id] = company_id
+        contacts_by_company = defaultdict(list)
+        for contact in contacts:
+            company_id = str(contact.get('COMPANY_ID') or '')
+            if company_id and company_id != '0':
+                contacts_by_company[company_id].append(contact['ID'])
 
-                if company_ids:
-                    company_commands = {}
-                    company_list = list(company_ids)
+        titles = self.get_company_titles(contacts_by_company)
 
-                    for i, company_id in enumerate(company_list):
-                        company_commands[f"company_{i}"] = ('crm.company.get', {'id': company_id})
+        company_names = {}
+        for company_id, contact_ids in contacts_by_company.items():
+            if company_id in titles:
+                for contact_id in contact_ids:
+                    company_names[contact_id] = titles[company_id]
 
-                    company_results = self.bitrix_token.call_batch(company_commands)
+        return company_names
 
-                    for key, result in company_results.items():
-                        if result and result.get('result'):
-                            company_index = int(key.split('_')[1])
-                            company_id = company_list[company_index]
-                            company_name = result['result'].get('TITLE', '')
+    def get_company_titles(self, company_ids) -> Dict[str, str]:
+        """Названия компаний {ID: TITLE} пачками и через кэш CompanyResolver"""
+        return self.company_resolver.titles(company_ids)
 
+    def _get_contacts_company_ids(self, contact_ids: List[int]) -> List[Dict]:
+        """ID компаний для контактов, известных только по ID"""
+        return self._list_by_ids('crm.contact.list', contact_ids, ['ID', 'COMPANY_ID'])
 
-                            for contact_id, comp_id in contact_company_map.items():
-                                if comp_id == company_id:
-                                    company_names[contact_id] = company_name
-            else:
-                for contact_id in contact_ids:
-                    try:
-                        result = self.bitrix_token.call_api_method('crm.contact.get', {'id': contact_id})
-                        if result.get('result') and result['result'].get('COMPANY_ID'):
-                            company_id = result['result']['COMPANY_ID']
-                            company_result = self.bitrix_token.call_api_method('crm.company.get', {'id': company_id})
-                            if company_result.get('result'):
-                                company_name = company_result['result'].get('TITLE', '')
-                                company_names[contact_id] = company_name
-                    except Exception as e:
-                        logger.error(f"Ошибка получения компании для контакта {contact_id}: {e}")
-                        continue
+    def _list_by_ids(self, method: str, ids: List, select: List[str]) -> List[Dict]:
+        """Элементы списочного метода по ID: фильтр @ID частями по PAGE_SIZE"""
+        commands = [
+            (method, {'filter': {'@ID': id_chunk}, 'select': select})
+            for id_chunk in chunked(ids, self.PAGE_SIZE)
+        ]
 
-        except Exception as e:
-            logger.error(f"Ошибка получения компаний: {e}")
+        items = []
+        for result in self.batch_executor.execute(commands, idempotent=True):
+            if not result['success']:
+                raise ValueError(f"Ошибка {method}: {result['error']}")
+            if isinstance(result['result'], list):
+                items.extend(result['result'])
 
-        return company_names
\ No newline at end of file
+        return items
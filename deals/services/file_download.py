@@ -0,0 +1,199 @@
+import gzip
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_etags
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'zip': 'application/zip',
+}
+DEFAULT_CONTENT_TYPE = 'application/octet-stream'
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+OFFLOAD_ACCEL = 'x-accel'
+OFFLOAD_SENDFILE = 'x-sendfile'
+
+
+def export_etag(job, size, encoding='') -> str:
+    """ETag файла экспорта: задача, время завершения, размер и кодирование ответа"""
+    completed = int(job.completed_at.timestamp()) if job.completed_at else 0
+    suffix = f'-{encoding}' if encoding else ''
+    return f'"{job.id.hex}-{completed}-{size}{suffix}"'
+
+
+def accepts_gzip(request) -> bool:
+    """Клиент принимает Content-Encoding: gzip"""
+    for coding in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, *params = coding.split(';')
+        if name.strip().lower() not in ('gzip', '*'):
+            continue
+
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        return quality > 0
+    return False
+
+
+def parse_range(header, size):
+    """Диапазон (start, end) включительно из заголовка Range.
+
+    None — отдать файл целиком (нет заголовка или несколько диапазонов),
+    False — диапазон невыполним (ответ 416).
+    """
+    match = RANGE_RE.match((header or '').strip())
+    if not match:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+
+    if not start:
+        length = int(end)
+        if not length:
+            return False
+        return max(0, size - length), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+
+    return start, end
+
+
+def iter_file_range(file, start, length, chunk_size):
+    """Чтение length байт файла начиная со start частями по chunk_size"""
+    try:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def iter_gzip_file(file, chunk_size):
+    """Распакованное содержимое gzip-файла частями по chunk_size"""
+    try:
+        with gzip.GzipFile(fileobj=file, mode='rb') as decompressed:
+            while True:
+                chunk = decompressed.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        file.close()
+
+
+def serve_export_file(request, job):
+    """Ответ со скачиванием файла экспорта.
+
+    Поддерживаются условные запросы (ETag/Last-Modified), Range с одним
+    диапазоном и передача отдачи веб-серверу через X-Accel-Redirect (nginx)
+    или X-Sendfile (Apache/lighttpd) по настройке EXPORT_DOWNLOAD_OFFLOAD.
+    Сжатый .gz отдается как есть с Content-Encoding: gzip, если клиент его
+    принимает, иначе распаковывается на лету.
+    """
+    path = job.export_file.path
+    size = os.path.getsize(path)
+    last_modified = job.completed_at.timestamp() if job.completed_at else os.path.getmtime(path)
+
+    name = job.export_file.name
+    gzipped = name.endswith('.gz')
+    if gzipped:
+        name = name[:-len('.gz')]
+    encoding = 'gzip' if gzipped and accepts_gzip(request) else ''
+    etag = export_etag(job, size, encoding or ('identity' if gzipped else ''))
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        if gzipped:
+            not_modified['Vary'] = 'Accept-Encoding'
+        return not_modified
+
+    file_format = os.path.splitext(name)[1].lstrip('.').lower()
+    content_type = CONTENT_TYPES.get(file_format, DEFAULT_CONTENT_TYPE)
+
+    offload = getattr(settings, 'EXPORT_DOWNLOAD_OFFLOAD', None)
+    if gzipped and not encoding:
+        # Клиент без поддержки gzip получает файл, распакованный на лету
+        chunk_size = getattr(settings, 'EXPORT_DOWNLOAD_CHUNK_SIZE', 64 * 1024)
+        response = StreamingHttpResponse(
+            iter_gzip_file(job.export_file.open('rb'), chunk_size),
+            content_type=content_type
+        )
+        response['Accept-Ranges'] = 'none'
+    elif offload:
+        response = HttpResponse(content_type=content_type)
+        if offload == OFFLOAD_ACCEL:
+            prefix = getattr(settings, 'EXPORT_ACCEL_REDIRECT_PREFIX', '/protected/export_files/')
+            response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(job.export_file.name)
+        else:
+            response['X-Sendfile'] = path
+    else:
+        response = _file_response(request, job.export_file.open('rb'), size, etag, content_type)
+
+    if gzipped:
+        response['Vary'] = 'Accept-Encoding'
+        if encoding:
+            response['Content-Encoding'] = encoding
+
+    response['Content-Disposition'] = content_disposition_header(True, job.file_name)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def _file_response(request, file, size, etag, content_type):
+    """Файл целиком через FileResponse или запрошенный диапазон"""
+    chunk_size = getattr(settings, 'EXPORT_DOWNLOAD_CHUNK_SIZE', 64 * 1024)
+
+    byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+
+    # If-Range с другим ETag означает, что у клиента устаревшая часть: отдается весь файл
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if byte_range and if_range and etag not in parse_etags(if_range):
+        byte_range = None
+
+    if byte_range is False:
+        file.close()
+        response = HttpResponse(status=416, content_type=content_type)
+        response['Content-Range'] = f'bytes */{size}'
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+        response.block_size = chunk_size
+        response['Content-Length'] = size
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    start, end = byte_range
+    length = end - start + 1
+    response = StreamingHttpResponse(
+        iter_file_range(file, start, length, chunk_size),
+        status=206,
+        content_type=content_type
+    )
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = length
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,247 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import requests
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from ..models import GeocodedAddress
+
+logger = logging.getLogger(__name__)
+
+GEOCODER_URL = 'https://geocode-maps.yandex.ru/1.x/'
+ADDRESS_FIELDS = ('ADDRESS_1', 'CITY', 'REGION', 'PROVINCE', 'COUNTRY')
+
+
+def address_query(address_data) -> str:
+    """Строка запроса к геокодеру из адреса Bitrix24"""
+    return ' '.join(filter(None, (address_data.get(field) for field in ADDRESS_FIELDS)))
+
+
+def format_address(address_data) -> str:
+    """Адрес Bitrix24 в читаемом виде"""
+    return ', '.join(filter(None, (address_data.get(field) for field in ADDRESS_FIELDS)))
+
+
+def normalize_address(query: str) -> str:
+    """Адрес без различий в регистре и пробелах"""
+    return ' '.join(query.lower().split())
+
+
+def address_digest(address: str) -> str:
+    """Ключ нормализованного адреса, одинаковый во всех процессах"""
+    return hashlib.sha1(address.encode('utf-8')).hexdigest()
+
+
+class GeocodeLRU:
+    """Потокобезопасный LRU-кэш {ключ адреса: (координаты или None, время получения)}"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def set(self, key, coords, fetched_at):
+        with self._lock:
+            self._items[key] = (coords, fetched_at)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+
+class Geocoder:
+    """Пакетное геокодирование адресов через Яндекс.Геокодер.
+
+    Адрес ищется в LRU процесса, затем в таблице GeocodedAddress и только
+    потом запрашивается у геокодера; ответ сохраняется в таблицу, включая
+    отрицательный — такой адрес повторно запрашивается не раньше чем через
+    GEOCODE_NEGATIVE_TTL_DAYS. Одинаковые адреса запрашиваются один раз,
+    промахи разрешаются параллельно ограниченным пулом потоков с общей
+    HTTP-сессией. geocode_many ждет не дольше timeout: незавершенные запросы
+    продолжают выполняться в пуле и сохраняются для следующего обращения.
+    """
+
+    def __init__(self, concurrency=None):
+        self.concurrency = concurrency or getattr(settings, 'GEOCODER_CONCURRENCY', 8)
+        self.api_key = os.environ.get('YANDEX_API_KEY', '398bf0ac-876c-44ac-a830-0b7e29f5f4f9')
+        self.negative_ttl = timedelta(days=getattr(settings, 'GEOCODE_NEGATIVE_TTL_DAYS', 7))
+        self.lru = GeocodeLRU(getattr(settings, 'GEOCODE_LRU_SIZE', 10000))
+        self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='geocoder')
+        self._in_flight = {}
+        # Колбэк уже завершенной задачи вызывается сразу, внутри _submit
+        self._lock = threading.RLock()
+        self._local = threading.local()
+
+    def _session(self):
+        """HTTP-сессия потока пула: соединения с геокодером переиспользуются"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            self._local.session = session
+        return session
+
+    def geocode_many(self, queries: Iterable[str], timeout: float = None) -> Tuple[Dict[str, List[float]], List[str]]:
+        """Координаты адресов {запрос: [широта, долгота]} и запросы, ответ на которые еще не получен"""
+        timeout = getattr(settings, 'GEOCODER_WAIT_TIMEOUT', 3) if timeout is None else timeout
+
+        results, misses = self.lookup(queries)
+        futures = {query: self._submit(key, address) for query, (key, address) in misses.items()}
+        if futures:
+            wait(futures.values(), timeout=timeout)
+
+        pending = []
+        for query, future in futures.items():
+            if not future.done():
+                pending.append(query)
+            elif future.exception() is None and future.result():
+                results[query] = future.result()
+
+        return results, pending
+
+    def lookup(self, queries: Iterable[str]):
+        """Известные координаты {запрос: координаты} и промахи {запрос: (ключ, адрес)}.
+
+        Адреса с действующим отрицательным ответом не попадают ни в результат, ни в промахи.
+        """
+        keys = {}
+        for query in queries:
+            address = normalize_address(query) if query else ''
+            if address and query not in keys:
+                keys[query] = (address_digest(address), address)
+
+        results = {}
+        unknown = {}
+        for query, (key, address) in keys.items():
+            item = self.lru.get(key)
+            if item is None or self._expired(*item):
+                unknown[query] = (key, address)
+            elif item[0]:
+                results[query] = item[0]
+
+        misses = {}
+        if unknown:
+            stored = GeocodedAddress.objects.filter(
+                address_hash__in={key for key, _ in unknown.values()}
+            ).only('address_hash', 'latitude', 'longitude', 'fetched_at')
+
+            for row in stored:
+                self.lru.set(row.address_hash, row.coords, row.fetched_at)
+
+        for query, (key, address) in unknown.items():
+            item = self.lru.get(key)
+            if item is None or self._expired(*item):
+                misses[query] = (key, address)
+            elif item[0]:
+                results[query] = item[0]
+
+        return results, misses
+
+    def prewarm(self, queries: Iterable[str]) -> Dict[str, int]:
+        """Геокодирование всех неизвестных адресов с ожиданием ответов, возвращает счетчики"""
+        results, misses = self.lookup(queries)
+        futures = {self._submit(key, address) for key, address in misses.values()}
+        wait(futures)
+
+        resolved = sum(1 for future in futures if future.result())
+        return {
+            'known': len(results),
+            'resolved': resolved,
+            'unresolved': len(futures) - resolved,
+        }
+
+    def _expired(self, coords, fetched_at):
+        return coords is None and fetched_at < timezone.now() - self.negative_ttl
+
+    def _submit(self, key: str, address: str):
+        """Запрос в пул; один и тот же адрес не запрашивается параллельно дважды"""
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is None:
+                future = self._pool.submit(self._resolve, key, address)
+                self._in_flight[key] = future
+                future.add_done_callback(lambda _: self._forget(key))
+            return future
+
+    def _forget(self, key: str):
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+    def _resolve(self, key: str, address: str) -> Optional[List[float]]:
+        """Запрос к геокодеру с сохранением ответа; при ошибке запроса ничего не сохраняется"""
+        try:
+            coords = self._fetch(address)
+        except Exception as e:
+            logger.warning(f"Ошибка геокодирования адреса: {e}")
+            return None
+
+        fetched_at = timezone.now()
+        try:
+            close_old_connections()
+            GeocodedAddress.objects.update_or_create(
+                address_hash=key,
+                defaults={
+                    'address': address,
+                    'latitude': coords[0] if coords else None,
+                    'longitude': coords[1] if coords else None,
+                    'source': GeocodedAddress.SOURCE_YANDEX,
+                    'fetched_at': fetched_at,
+                }
+            )
+        except Exception as e:
+            logger.error(f"Ошибка сохранения координат адреса: {e}")
+        finally:
+            close_old_connections()
+
+        self.lru.set(key, coords, fetched_at)
+        return coords
+
+    def _fetch(self, address: str) -> Optional[List[float]]:
+        response = self._session().get(
+            GEOCODER_URL,
+            params={
+                'apikey': self.api_key,
+                'geocode': address,
+                'format': 'json'
+            },
+            timeout=10
+        )
+        response.raise_for_status()
+        data = response.json()
+
+        feature_member = data['response']['GeoObjectCollection']['featureMember']
+        if not feature_member:
+            return None
+
+        pos = feature_member[0]['GeoObject']['Point']['pos']
+        longitude, latitude = map(float, pos.split(' '))
+        return [latitude, longitude]
+
+
+_geocoder = None
+_geocoder_lock = threading.Lock()
+
+
+def get_geocoder():
+    """Общий для процесса геокодер"""
+    global _geocoder
+
+    with _geocoder_lock:
+        if _geocoder is None:
+            _geocoder = Geocoder()
+        return _geocoder
@@ -0,0 +1,402 @@
+import logging
+import time
+from collections import Counter
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from ..file_handlers.base_handler import EMPTY_RECORD, EXPORT_COLUMNS, FileHandlerFactory
+from ..models import ImportExportJob, ImportExportRecord
+from .contact_service import ContactService
+from .normalization import validate_contacts
+
+logger = logging.getLogger(__name__)
+
+# Колонки задач для истории пользователя: без filter_params, stats и путей к файлам
+HISTORY_FIELDS = (
+    'id', 'job_type', 'file_format', 'status', 'total_records', 'processed_records',
+    'failed_records', 'created_at', 'file_name'
+)
+
+
+class RecordJournal:
+    """Буферизованная запись журнала ImportExportRecord через bulk_create.
+
+    Каждая порция строк сохраняется в одной транзакции вместе со счетчиками
+    прогресса задачи и контрольной точкой checkpoint_index, поэтому
+    get_job_status не видит расхождений, а импорт можно продолжить после сбоя.
+    """
+
+    def __init__(self, job, chunk_size=None):
+        self.job = job
+        self.chunk_size = chunk_size or getattr(settings, 'IMPORT_EXPORT_JOURNAL_CHUNK_SIZE', 500)
+        self.processed = job.processed_records
+        self.failed = job.failed_records
+        self.checkpoint = job.checkpoint_index
+        self._buffer = []
+
+    def add(self, record_index, contact_data, status, bitrix_contact_id=None, error_message='', failed=False,
+            phone_hash='', email_hash=''):
+        self._buffer.append(ImportExportRecord(
+            job=self.job,
+            record_index=record_index,
+            contact_data=contact_data,
+            status=status,
+            error_message=error_message,
+            bitrix_contact_id=bitrix_contact_id,
+            phone_hash=phone_hash,
+            email_hash=email_hash
+        ))
+        self.processed += 1
+        if failed:
+            self.failed += 1
+        if self.checkpoint is None or record_index > self.checkpoint:
+            self.checkpoint = record_index
+
+        if len(self._buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        with transaction.atomic():
+            if self._buffer:
+                ImportExportRecord.objects.bulk_create(self._buffer, batch_size=self.chunk_size)
+
+            self.job.processed_records = self.processed
+            self.job.failed_records = self.failed
+            self.job.checkpoint_index = self.checkpoint
+            self.job.heartbeat_at = timezone.now()
+            self.job.save(update_fields=['processed_records', 'failed_records', 'checkpoint_index', 'heartbeat_at'])
+
+        self._buffer = []
+
+
+def process_import_file(job, bitrix_token):
+    """Обработка импорта контактов с использованием batch.
+
+    Если задача уже выполнялась, строки с созданным контактом пропускаются,
+    а строки с ошибками обрабатываются заново.
+    """
+    import_params = job.filter_params or {}
+    if import_params.get('dry_run'):
+        return process_import_dry_run(job, bitrix_token)
+
+    contact_service = ContactService(
+        bitrix_token, dedup_mode=import_params.get('dedup_mode'), owner_id=job.created_by_id
+    )
+
+    handler = FileHandlerFactory.get_handler(
+        job.file_format,
+        column_mapping=import_params.get('column_mapping'),
+        aliases=import_params.get('aliases')
+    )
+    batch_size = 50
+
+    done_indices = set(
+        job.records.filter(bitrix_contact_id__isnull=False).values_list('record_index', flat=True)
+    )
+    job.records.filter(bitrix_contact_id__isnull=True).delete()
+    job.processed_records = len(done_indices)
+    job.failed_records = 0
+
+    if done_indices:
+        logger.info(f"Продолжение импорта {job.id} с контрольной точки {job.checkpoint_index}, "
+                    f"уже создано {len(done_indices)} контактов")
+
+    success_count = len(done_indices)
+    fail_count = 0
+    status_counts = Counter()
+
+    with job.source_file.open('rb') as file:
+        # Предварительный проход считает строки для прогресса и собирает компании
+        total_records = 0
+        company_names = set()
+        for index, record in enumerate(handler.iter_records(file)):
+            total_records += 1
+            if record['company_name'] and index not in done_indices:
+                company_names.add(record['company_name'])
+
+        if not total_records:
+            job.status = ImportExportJob.STATUS_FAILED
+            job.error_message = "Файл не содержит валидных данных"
+            job.save()
+            return False
+
+        job.total_records = total_records
+        job.heartbeat_at = timezone.now()
+        job.save()
+
+        contact_service.company_resolver.resolve(company_names)
+
+        pending = (
+            (index, record)
+            for index, record in enumerate(handler.iter_records(file))
+            if index not in done_indices
+        )
+        journal = RecordJournal(job)
+
+        while True:
+            batch = list(islice(pending, batch_size))
+            if not batch:
+                break
+
+            indices = [index for index, _ in batch]
+            contacts = [record for _, record in batch]
+            results = contact_service.batch_create_contacts(contacts)
+
+            for j, result in enumerate(results):
+                position = result.get('original_index', j)
+                status = result.get('status', 'success') if result.get('success') else 'failed'
+
+                journal.add(
+                    record_index=indices[position],
+                    contact_data=contacts[position],
+                    status=status,
+                    error_message=str(result.get('error') or '')[:500],
+                    bitrix_contact_id=result.get('contact_id'),
+                    failed=not result.get('success'),
+                    **contact_service.deduplicator.hashes(contacts[position])
+                )
+
+                status_counts[status] += 1
+                if result.get('success'):
+                    success_count += 1
+                else:
+                    fail_count += 1
+
+            # Контакты пакета уже созданы в Bitrix24, журнал и контрольная точка фиксируются сразу
+            journal.flush()
+
+    job.status = ImportExportJob.STATUS_COMPLETED
+    job.completed_at = timezone.now()
+    job.save()
+
+    logger.info(f"Импорт завершен: {success_count} успешно (создано {status_counts['success']}, "
+                f"обновлено {status_counts['updated']}, пропущено дубликатов {status_counts['skipped']}), "
+                f"{fail_count} с ошибками")
+    return True
+
+
+DRY_RUN_STAGES = ('parse', 'validate', 'dedup')
+
+
+def process_import_dry_run(job, bitrix_token):
+    """Проверка файла импорта без создания контактов.
+
+    Файл читается, строки проверяются и нормализуются, дубликаты ищутся
+    по локальному индексу и внутри файла — без запросов к Bitrix24.
+    Вердикт по каждой непустой строке, включая строки без имени, пишется
+    в журнал (valid, failed, duplicate) с номером строки файла в record_index,
+    в job.stats сохраняется время и скорость каждого этапа.
+    """
+    import_params = job.filter_params or {}
+    contact_service = ContactService(
+        bitrix_token, dedup_mode=import_params.get('dedup_mode'), owner_id=job.created_by_id
+    )
+    deduplicator = contact_service.deduplicator
+    handler = FileHandlerFactory.get_handler(
+        job.file_format,
+        column_mapping=import_params.get('column_mapping'),
+        aliases=import_params.get('aliases')
+    )
+    batch_size = 500
+
+    job.records.all().delete()
+    job.processed_records = 0
+    job.failed_records = 0
+    job.checkpoint_index = None
+
+    seconds = dict.fromkeys(DRY_RUN_STAGES, 0.0)
+    verdicts = Counter()
+    first_seen = {}
+    journal = RecordJournal(job)
+
+    with job.source_file.open('rb') as file:
+        records = handler.iter_rows(file)
+
+        while True:
+            started = time.perf_counter()
+            batch = list(islice(records, batch_size))
+            seconds['parse'] += time.perf_counter() - started
+            if not batch:
+                break
+
+            started = time.perf_counter()
+            checked = validate_contacts([record for _, record in batch])
+            valid = [(index, contact) for (index, _), (contact, _) in zip(batch, checked) if contact]
+            seconds['validate'] += time.perf_counter() - started
+
+            started = time.perf_counter()
+            duplicates = deduplicator.find_duplicates(valid, local_only=True)
+            repeated = deduplicator.find_repeated(
+                [(index, contact) for index, contact in valid if index not in duplicates],
+                first_seen=first_seen
+            )
+            seconds['dedup'] += time.perf_counter() - started
+
+            for (index, record), (contact, reasons) in zip(batch, checked):
+                if not contact:
+                    status, message = 'failed', '; '.join(reasons)
+                elif index in duplicates:
+                    status, message = 'duplicate', f"Контакт уже есть в Bitrix24, ID {duplicates[index][0]}"
+                elif index in repeated:
+                    status, message = 'duplicate', f"Повторяет строку {repeated[index]}"
+                else:
+                    status, message = 'valid', '; '.join(reasons)
+
+                verdicts[status] += 1
+                journal.add(
+                    record_index=index,
+                    contact_data=record,
+                    status=status,
+                    error_message=message[:500],
+                    failed=status == 'failed'
+                )
+
+    journal.flush()
+
+    rows = journal.processed
+    job.total_records = rows
+    job.stats = {
+        'dry_run': True,
+        'rows': rows,
+        'verdicts': dict(verdicts),
+        'stages': {
+            stage: {
+                'seconds': round(seconds[stage], 3),
+                'rows_per_second': round(rows / seconds[stage]) if seconds[stage] else None,
+            }
+            for stage in DRY_RUN_STAGES
+        },
+    }
+    job.status = ImportExportJob.STATUS_COMPLETED if rows else ImportExportJob.STATUS_FAILED
+    job.error_message = '' if rows else "Файл не содержит валидных данных"
+    job.completed_at = timezone.now()
+    job.save()
+
+    logger.info(f"Проверка импорта {job.id}: {rows} строк, {dict(verdicts)}, этапы {job.stats['stages']}")
+    return bool(rows)
+
+
+FAILED_REPORT_COLUMNS = EXPORT_COLUMNS + [('Ошибка', 'error')]
+
+
+def iter_failed_records(job, chunk_size=None):
+    """Строки импорта с ошибками по порядку через серверный курсор"""
+    chunk_size = chunk_size or getattr(settings, 'IMPORT_EXPORT_JOURNAL_CHUNK_SIZE', 500)
+    rows = job.records.filter(status='failed').order_by('record_index').values_list('contact_data', 'error_message')
+
+    for contact_data, error_message in rows.iterator(chunk_size=chunk_size):
+        yield {**EMPTY_RECORD, **(contact_data or {}), 'error': error_message}
+
+
+def write_failed_records(job, file):
+    """Отчет по строкам импорта с ошибками в формате исходного файла с колонкой ошибки"""
+    handler = FileHandlerFactory.get_handler(job.file_format)
+    return handler.write_records_to(file, iter_failed_records(job), columns=FAILED_REPORT_COLUMNS)
+
+
+def process_export(job, bitrix_token):
+    """Обработка экспорта контактов с использованием batch"""
+    contact_service = ContactService(bitrix_token)
+
+    # Экспорт повторяется с нуля, журнал прошлой попытки не нужен
+    job.records.all().delete()
+    job.processed_records = 0
+    job.failed_records = 0
+    job.checkpoint_index = None
+
+    total, pages = contact_service.fetch_contact_pages(job.filter_params or {})
+
+    if not total:
+        job.status = ImportExportJob.STATUS_COMPLETED
+        job.total_records = 0
+        job.processed_records = 0
+        job.completed_at = timezone.now()
+        job.save()
+        return True
+
+    job.total_records = total
+    job.save()
+
+    handler = FileHandlerFactory.get_handler(job.file_format)
+    file_name = f"export_files/export_{job.id}{export_file_suffix(job)}"
+    handler.write_records_to_path(
+        job.export_file.storage.path(file_name),
+        _iter_export_records(job, contact_service, pages),
+        compression=job.compression or None,
+        part_name=f"contacts_export_{{number:03d}}.{job.file_format}",
+        split_rows=getattr(settings, 'EXPORT_SPLIT_ROWS', 500_000)
+    )
+    job.export_file.name = file_name
+
+    # total из первой страницы мог устареть, пока шла выгрузка
+    job.total_records = job.processed_records
+    job.status = ImportExportJob.STATUS_COMPLETED
+    job.completed_at = timezone.now()
+    job.save()
+
+    return True
+
+
+def export_file_suffix(job):
+    """Расширение файла экспорта с учетом сжатия"""
+    if job.compression == ImportExportJob.COMPRESSION_ZIP:
+        return '.zip'
+    if job.compression == ImportExportJob.COMPRESSION_GZIP:
+        return f'.{job.file_format}.gz'
+    return f'.{job.file_format}'
+
+
+def _iter_export_records(job, contact_service, pages):
+    """Записи файла экспорта по страницам контактов с журналированием в ImportExportRecord"""
+    journal = RecordJournal(job)
+    i = 0
+
+    for page in pages:
+        company_names = contact_service.get_contact_companies(page)
+
+        for contact in page:
+            record_data = _export_record(contact, company_names)
+
+            journal.add(
+                record_index=i,
+                contact_data=record_data,
+                status='exported',
+                bitrix_contact_id=contact['ID']
+            )
+            i += 1
+
+            yield record_data
+
+    journal.flush()
+
+
+def _export_record(contact, company_names):
+    """Запись файла экспорта из контакта Bitrix24"""
+    phone = ''
+    if contact.get('PHONE'):
+        phones = contact['PHONE']
+        if isinstance(phones, list) and phones:
+            phone = phones[0].get('VALUE', '')
+        elif isinstance(phones, dict):
+            phone = phones.get('VALUE', '')
+
+    email = ''
+    if contact.get('EMAIL'):
+        emails = contact['EMAIL']
+        if isinstance(emails, list) and emails:
+            email = emails[0].get('VALUE', '')
+        elif isinstance(emails, dict):
+            email = emails.get('VALUE', '')
+
+    company_name = company_names.get(contact['ID'], '')
+
+    return {
+        'first_name': contact.get('NAME', ''),
+        'last_name': contact.get('LAST_NAME', ''),
+        'phone': phone,
+        'email': email,
+        'company_name': company_name
+    }
@@ -0,0 +1,318 @@
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from integration_utils.bitrix24.models import BitrixUserToken
+
+from ..models import ImportExportJob
+from .import_export_service import process_import_file, process_export
+from .job_status import forget_job_status
+
+logger = logging.getLogger(__name__)
+
+JOB_HANDLERS = {
+    ImportExportJob.JOB_TYPE_IMPORT: process_import_file,
+    ImportExportJob.JOB_TYPE_EXPORT: process_export,
+}
+
+
+def get_job_token(job):
+    """Токен Bitrix24 автора задачи для выполнения вне запроса"""
+    token = BitrixUserToken.objects.filter(
+        user=job.created_by,
+        is_active=True
+    ).order_by('-id').first()
+
+    if not token:
+        raise ValueError(f"Нет активного токена Bitrix24 для пользователя {job.created_by_id}")
+
+    return token
+
+
+def claim_job(job_id=None):
+    """Захват ожидающей задачи через SELECT ... FOR UPDATE SKIP LOCKED.
+
+    Из очереди берутся только задачи, у которых истекла пауза перед повтором
+    run_after; задача, указанная явно, захватывается без учета паузы.
+    """
+    with transaction.atomic():
+        queryset = ImportExportJob.objects.select_for_update(skip_locked=True).filter(
+            status=ImportExportJob.STATUS_PENDING
+        )
+        if job_id:
+            queryset = queryset.filter(id=job_id)
+        else:
+            queryset = queryset.filter(Q(run_after__isnull=True) | Q(run_after__lte=timezone.now()))
+
+        job = queryset.order_by('created_at').first()
+        if job is None:
+            return None
+
+        job.status = ImportExportJob.STATUS_PROCESSING
+        job.attempts += 1
+        job.started_at = job.heartbeat_at = timezone.now()
+        job.run_after = None
+        job.error_message = ''
+        job.save(update_fields=['status', 'attempts', 'started_at', 'heartbeat_at', 'run_after', 'error_message'])
+
+    return job
+
+
+def retry_delay(attempts):
+    """Пауза перед повтором: BACKGROUND_TASK_RETRY_DELAY, удваиваемая с каждой попыткой"""
+    delay = getattr(settings, 'BACKGROUND_TASK_RETRY_DELAY', 30) * 2 ** max(attempts - 1, 0)
+    return timedelta(seconds=min(delay, getattr(settings, 'BACKGROUND_TASK_RETRY_MAX_DELAY', 60 * 10)))
+
+
+class JobHeartbeat:
+    """Отметка heartbeat_at по таймеру, пока задача выполняется.
+
+    Журнал отмечает задачу только при сбросе порции, а медленная порция
+    может идти дольше BACKGROUND_TASK_STALE_TIMEOUT; без таймера такую
+    задачу requeue_stale_jobs вернул бы в очередь, и она выполнялась бы дважды.
+    """
+
+    def __init__(self, job_id, interval=None):
+        self.job_id = job_id
+        self.interval = interval or getattr(settings, 'BACKGROUND_TASK_HEARTBEAT_INTERVAL', 60)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name=f'job-heartbeat-{job_id}', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+
+    def _loop(self):
+        try:
+            while not self._stopped.wait(self.interval):
+                try:
+                    ImportExportJob.objects.filter(
+                        id=self.job_id,
+                        status=ImportExportJob.STATUS_PROCESSING
+                    ).update(heartbeat_at=timezone.now())
+                except Exception as e:
+                    logger.error(f"Ошибка отметки задачи {self.job_id}: {e}")
+        finally:
+            connection.close()
+
+
+def run_job(job, bitrix_token=None):
+    """Выполнение захваченной задачи с учетом BACKGROUND_TASK_MAX_ATTEMPTS.
+
+    Неудачная задача возвращается в очередь с паузой run_after, растущей с каждой попыткой.
+    """
+    handler = JOB_HANDLERS[job.job_type]
+
+    try:
+        with JobHeartbeat(job.id):
+            handler(job, bitrix_token or get_job_token(job))
+
+    except Exception as e:
+        logger.error(f"Ошибка выполнения задачи {job.id} (попытка {job.attempts}): {e}")
+
+        # Повтор импорта продолжается с контрольной точки, созданные контакты не дублируются
+        max_attempts = getattr(settings, 'BACKGROUND_TASK_MAX_ATTEMPTS', 3)
+        can_retry = job.attempts < max_attempts
+
+        job.status = ImportExportJob.STATUS_PENDING if can_retry else ImportExportJob.STATUS_FAILED
+        job.run_after = timezone.now() + retry_delay(job.attempts) if can_retry else None
+        job.error_message = str(e)
+        job.save()
+
+
+def _stale_before():
+    """Граница heartbeat_at, раньше которой задача считается брошенной"""
+    timeout = getattr(settings, 'BACKGROUND_TASK_STALE_TIMEOUT', 60 * 10)
+    return timezone.now() - timedelta(seconds=timeout)
+
+
+def requeue_stale_jobs():
+    """Возврат в очередь задач, обработчик которых перестал отмечаться (процесс упал).
+
+    Задача, исчерпавшая BACKGROUND_TASK_MAX_ATTEMPTS, помечается ошибкой: если
+    она сама роняет процесс (нехватка памяти на большом файле), повторять ее
+    бесконечно бессмысленно.
+    """
+    max_attempts = getattr(settings, 'BACKGROUND_TASK_MAX_ATTEMPTS', 3)
+    stale = ImportExportJob.objects.filter(
+        status=ImportExportJob.STATUS_PROCESSING,
+        heartbeat_at__lt=_stale_before()
+    )
+
+    failed = stale.filter(attempts__gte=max_attempts).update(
+        status=ImportExportJob.STATUS_FAILED,
+        error_message='Обработчик задачи перестал отвечать, попытки исчерпаны'
+    )
+    count = stale.filter(attempts__lt=max_attempts).update(status=ImportExportJob.STATUS_PENDING)
+
+    if failed:
+        logger.error(f"Помечено ошибкой {failed} зависших задач, исчерпавших попытки")
+    if count:
+        logger.warning(f"Возвращено в очередь {count} зависших задач")
+    return count
+
+
+def resume_job(job):
+    """Продолжение прерванного или завершившегося ошибкой импорта с контрольной точки"""
+    if job.job_type != ImportExportJob.JOB_TYPE_IMPORT:
+        raise ValueError("Продолжить можно только импорт")
+    if job.status == ImportExportJob.STATUS_COMPLETED:
+        raise ValueError("Импорт уже завершен")
+    if not job.source_file:
+        raise ValueError("Исходный файл импорта не сохранен")
+
+    updated = ImportExportJob.objects.filter(
+        id=job.id,
+        status__in=[ImportExportJob.STATUS_FAILED, ImportExportJob.STATUS_PROCESSING]
+    ).exclude(
+        status=ImportExportJob.STATUS_PROCESSING,
+        heartbeat_at__gte=_stale_before()
+    ).update(status=ImportExportJob.STATUS_PENDING, attempts=0, run_after=None, error_message='')
+
+    if not updated:
+        job.refresh_from_db()
+        if job.status != ImportExportJob.STATUS_PENDING:
+            raise ValueError("Импорт еще выполняется")
+
+    forget_job_status(job.id)
+    job.refresh_from_db()
+    return enqueue_job(job)
+
+
+class JobRunner:
+    """Пул потоков, выбирающих задачи импорта/экспорта из таблицы ImportExportJob"""
+
+    def __init__(self, concurrency=None, poll_interval=None):
+        self.concurrency = concurrency or getattr(settings, 'BACKGROUND_TASK_CONCURRENCY', 2)
+        self.poll_interval = poll_interval or getattr(settings, 'BACKGROUND_TASK_POLL_INTERVAL', 5)
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Запуск потоков-обработчиков (повторный вызов ничего не делает)"""
+        with self._lock:
+            if self._threads:
+                return
+
+            self._stopped.clear()
+            for i in range(self.concurrency):
+                thread = threading.Thread(
+                    target=self._worker_loop,
+                    name=f'import-export-worker-{i}',
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+        logger.info(f"Запущено {self.concurrency} обработчиков задач импорта/экспорта")
+
+    def notify(self):
+        """Разбудить обработчики после постановки новой задачи"""
+        self._wakeup.set()
+
+    def stop(self, timeout=None):
+        """Остановка обработчиков после завершения текущих задач"""
+        self._stopped.set()
+        self._wakeup.set()
+
+        with self._lock:
+            threads, self._threads = self._threads, []
+
+        for thread in threads:
+            thread.join(timeout)
+
+    def run_forever(self):
+        """Блокирующий запуск для отдельного процесса-обработчика"""
+        self.start()
+        try:
+            while not self._stopped.is_set():
+                self._stopped.wait(self.poll_interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def _worker_loop(self):
+        while not self._stopped.is_set():
+            job = None
+            try:
+                close_old_connections()
+                job = claim_job()
+                if job:
+                    run_job(job)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика задач: {e}")
+            finally:
+                close_old_connections()
+
+            if job is None:
+                try:
+                    requeue_stale_jobs()
+                except Exception as e:
+                    logger.error(f"Ошибка проверки зависших задач: {e}")
+
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_runner():
+    """Общий для процесса пул обработчиков"""
+    global _runner
+
+    with _runner_lock:
+        if _runner is None:
+            _runner = JobRunner()
+        return _runner
+
+
+def embedded_runner_enabled():
+    """Очередь обрабатывается потоками веб-процесса, а не run_import_export_worker.
+
+    Выключено по умолчанию: каждый воркер WSGI-сервера запустил бы свои
+    BACKGROUND_TASK_CONCURRENCY потоков, а при --preload потоки мастера
+    не переживают fork. Подходит для разработки с одним процессом.
+    """
+    return (
+        getattr(settings, 'BACKGROUND_TASK_RUN_ASYNC', True)
+        and getattr(settings, 'BACKGROUND_TASK_EMBEDDED_RUNNER', False)
+    )
+
+
+def start_embedded_runner():
+    """Запуск встроенного пула при старте runserver: задачи из очереди и брошенные
+    задачи подхватываются, даже если новых задач в этом процессе не ставили"""
+    if embedded_runner_enabled():
+        get_runner().start()
+
+
+def enqueue_job(job, bitrix_token=None):
+    """Постановка задачи в очередь; при BACKGROUND_TASK_RUN_ASYNC = False выполняется сразу"""
+    if getattr(settings, 'BACKGROUND_TASK_RUN_ASYNC', True):
+        if embedded_runner_enabled():
+            runner = get_runner()
+            runner.start()
+            runner.notify()
+        return job
+
+    while True:
+        claimed = claim_job(job.id)
+        if claimed is None:
+            break
+        run_job(claimed, bitrix_token)
+
+    job.refresh_from_db()
+    return job
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from ..models import ImportExportJob
+
+STATUS_FIELDS = ['job_type', 'status', 'attempts', 'checkpoint_index', 'total_records', 'processed_records',
+                 'failed_records', 'error_message', 'stats']
+
+
+def _cache_key(job_id):
+    return f'import_export_job_status_{job_id}'
+
+
+def load_job_status(job_id, owner_id):
+    """Состояние задачи пользователя; None — задача не найдена или чужая.
+
+    Клиенты опрашивают статус раз в пару секунд, поэтому строка задачи
+    кэшируется на JOB_STATUS_CACHE_TIMEOUT секунд: сколько бы вкладок ни
+    следило за задачей, к БД уходит не больше одного запроса за период.
+    Продолжение импорта сбрасывает кэш через forget_job_status.
+    """
+    key = _cache_key(job_id)
+    row = cache.get(key)
+
+    if row is None:
+        row = ImportExportJob.objects.filter(id=job_id).values('created_by_id', *STATUS_FIELDS).first()
+        if row is None:
+            return None
+
+        cache.set(key, row, timeout=getattr(settings, 'JOB_STATUS_CACHE_TIMEOUT', 2))
+
+    if row['created_by_id'] != owner_id:
+        return None
+    return {field: row[field] for field in STATUS_FIELDS}
+
+
+def forget_job_status(job_id):
+    """Сброс кэшированного состояния после изменения задачи"""
+    cache.delete(_cache_key(job_id))
@@ -0,0 +1,244 @@
+import hashlib
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
+
+import requests
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from ..models import CompanyLogo
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+LOGO_DIR = 'company_logos'
+
+# Сигнатуры форматов: расширение файла определяется по содержимому, а не по ссылке.
+# Принимаются только растровые изображения: SVG и HTML, отданные с нашего домена,
+# выполнили бы встроенные скрипты у каждого, кто открыл карту
+IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+)
+
+
+def image_extension(content: bytes) -> Optional[str]:
+    """Расширение по сигнатуре растрового изображения; None — формат не принимается"""
+    for signature, extension in IMAGE_SIGNATURES:
+        if content.startswith(signature):
+            return extension
+
+    if content[:4] == b'RIFF' and content[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def logo_file_id(company) -> Optional[str]:
+    """ID файла логотипа в Bitrix24; меняется при замене логотипа"""
+    logo = company.get('LOGO')
+    if not logo or not logo.get('id'):
+        return None
+    return str(logo['id'])
+
+
+def media_url(name: str) -> str:
+    root_url = os.environ.get('ROOT_URL', 'http://localhost:8000')
+    return f"{root_url}{settings.MEDIA_URL}{name}".replace('\\', '/')
+
+
+class LogoStore:
+    """Зеркало логотипов компаний в MEDIA_ROOT/company_logos.
+
+    Файлы называются по sha1 содержимого, поэтому одинаковые логотипы хранятся
+    один раз, а замена логотипа в Bitrix24 дает новый файл. Индекс CompanyLogo
+    ведется по порталу и ID компании и хранит ID файла Bitrix24: если он
+    изменился, логотип загружается заново. Относительные ссылки на файл
+    загружаются с домена портала.
+    Неудачная загрузка повторяется только для нового ID файла или новой ссылки.
+    logo_urls только читает индекс и ставит недостающие логотипы в фоновую
+    загрузку с ограниченным числом потоков (LOGO_SYNC_CONCURRENCY). При
+    наличии Pillow для логотипов сохраняется миниатюра
+    LOGO_THUMBNAIL_SIZE пикселей, и на карту отдается она.
+    """
+
+    def __init__(self, concurrency=None):
+        self.concurrency = concurrency or getattr(settings, 'LOGO_SYNC_CONCURRENCY', 4)
+        self.thumbnail_size = getattr(settings, 'LOGO_THUMBNAIL_SIZE', 80)
+        self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='logo-sync')
+        self._in_flight = {}
+        self._lock = threading.RLock()
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            self._local.session = session
+        return session
+
+    def logo_urls(self, portal: str, companies: Iterable[dict]) -> Dict[str, str]:
+        """URL логотипов компаний портала {ID компании: URL} из индекса;
+        устаревшие и новые логотипы синхронизируются в фоне"""
+        wanted = {}
+        for company in companies:
+            file_id = logo_file_id(company)
+            if file_id:
+                wanted[int(company['ID'])] = (file_id, company['LOGO'].get('downloadUrl'))
+
+        if not wanted:
+            return {}
+
+        indexed = CompanyLogo.objects.filter(portal=portal, company_id__in=list(wanted)).only(
+            'company_id', 'file_id', 'file_name', 'thumbnail_name', 'failed_file_id', 'failed_url'
+        )
+
+        urls = {}
+        failed = set()
+        for logo in indexed:
+            file_id, download_url = wanted[logo.company_id]
+            if logo.file_name and logo.file_id == file_id:
+                urls[str(logo.company_id)] = media_url(logo.thumbnail_name or logo.file_name)
+            elif logo.failed_file_id == file_id and logo.failed_url == download_url:
+                failed.add(logo.company_id)
+
+        for company_id, (file_id, download_url) in wanted.items():
+            if str(company_id) not in urls and company_id not in failed and download_url:
+                self.submit(portal, company_id, file_id, download_url)
+
+        return urls
+
+    def submit(self, portal: str, company_id: int, file_id: str, download_url: str):
+        """Фоновая загрузка логотипа; повторная постановка той же компании не создает новую задачу"""
+        key = (portal, company_id)
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is None:
+                future = self._pool.submit(self.sync, portal, company_id, file_id, download_url)
+                self._in_flight[key] = future
+                future.add_done_callback(lambda _: self._forget(key))
+            return future
+
+    def _forget(self, key):
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+    def sync(self, portal: str, company_id: int, file_id: str, download_url: str) -> Optional[CompanyLogo]:
+        """Загрузка логотипа и обновление индекса; неудача запоминается до смены файла или ссылки"""
+        try:
+            close_old_connections()
+
+            try:
+                content = self._download(portal, download_url)
+                error = None if image_extension(content) else 'не является растровым изображением'
+            except Exception as e:
+                error = str(e)
+
+            if error:
+                logger.warning(f"Логотип компании {company_id} не загружен: {error}")
+                CompanyLogo.objects.update_or_create(
+                    portal=portal,
+                    company_id=company_id,
+                    defaults={
+                        'failed_file_id': file_id,
+                        'failed_url': download_url,
+                        'failed_at': timezone.now(),
+                    }
+                )
+                return None
+
+            content_hash = hashlib.sha1(content).hexdigest()
+            file_name = self._save(f'{content_hash}.{image_extension(content)}', content)
+            thumbnail_name = self._save_thumbnail(content_hash, content)
+
+            logo, _ = CompanyLogo.objects.update_or_create(
+                portal=portal,
+                company_id=company_id,
+                defaults={
+                    'file_id': file_id,
+                    'content_hash': content_hash,
+                    'file_name': file_name,
+                    'thumbnail_name': thumbnail_name,
+                    'synced_at': timezone.now(),
+                    'failed_file_id': '',
+                    'failed_url': '',
+                    'failed_at': None,
+                }
+            )
+            return logo
+
+        except Exception as e:
+            logger.warning(f"Ошибка сохранения логотипа компании {company_id}: {e}")
+            return None
+        finally:
+            close_old_connections()
+
+    def _download(self, portal: str, download_url: str) -> bytes:
+        if download_url.startswith(('http://', 'https://')):
+            full_url = download_url
+        else:
+            full_url = f'https://{portal}{download_url}'
+
+        response = self._session().get(full_url, timeout=10)
+        response.raise_for_status()
+        return response.content
+
+    def _path(self, name: str) -> str:
+        return os.path.join(settings.MEDIA_ROOT, name)
+
+    def _save(self, base_name: str, content: bytes) -> str:
+        """Запись файла по имени содержимого; существующий файл не перезаписывается"""
+        name = f'{LOGO_DIR}/{base_name[:2]}/{base_name}'
+        path = self._path(name)
+
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f'{path}.{threading.get_ident()}.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(content)
+            os.replace(temp_path, path)
+
+        return name
+
+    def _save_thumbnail(self, content_hash: str, content: bytes) -> str:
+        if Image is None:
+            return ''
+
+        try:
+            with Image.open(io.BytesIO(content)) as image:
+                image.thumbnail((self.thumbnail_size, self.thumbnail_size))
+                if image.mode not in ('RGB', 'RGBA'):
+                    image = image.convert('RGBA')
+
+                buffer = io.BytesIO()
+                image.save(buffer, format='PNG', optimize=True)
+        except Exception as e:
+            logger.warning(f"Не удалось уменьшить логотип {content_hash}: {e}")
+            return ''
+
+        return self._save(f'{content_hash}_{self.thumbnail_size}.png', buffer.getvalue())
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_logo_store():
+    """Общее для процесса хранилище логотипов"""
+    global _store
+
+    with _store_lock:
+        if _store is None:
+            _store = LogoStore()
+        return _store
@@ -0,0 +1,120 @@
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+PHONE_JUNK_RE = re.compile(r'[^\d+]')
+EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
+REASON_NO_NAME = 'Не указаны имя и фамилия'
+REASON_BAD_PHONE = 'Некорректный телефон'
+REASON_BAD_EMAIL = 'Некорректный email'
+
+
+def normalize_phone(phone: str) -> str:
+    """Телефон в формате +7XXXXXXXXXX или пустая строка"""
+    if not phone:
+        return ''
+
+    phone = PHONE_JUNK_RE.sub('', phone)
+    length = len(phone)
+
+    if length == 11 and phone[0] == '8':
+        phone = '+7' + phone[1:]
+    elif length == 11 and phone[0] == '7':
+        phone = '+' + phone
+    elif length == 10:
+        phone = '+7' + phone
+    elif length > 10 and phone[0] != '+':
+        phone = '+' + phone
+
+    return phone if len(phone) >= 11 else ''
+
+
+def is_valid_email(email: str) -> bool:
+    """Проверка валидности email"""
+    return bool(email) and EMAIL_RE.match(email) is not None
+
+
+def normalize_phones(phones: Iterable[str], use_pandas: bool = False) -> List[str]:
+    """Нормализация колонки телефонов, результат по строкам в исходном порядке.
+
+    Строковые операции pandas на object/string колонках не быстрее
+    скомпилированного шаблона (см. benchmark_normalization), поэтому
+    pandas используется только по явному use_pandas.
+    """
+    phones = list(phones)
+    if not use_pandas:
+        return [normalize_phone(phone) for phone in phones]
+
+    if pd is None:
+        raise ValueError("Для нормализации через pandas нужен установленный pandas")
+
+    digits = pd.Series(phones, dtype='string').fillna('').str.replace(PHONE_JUNK_RE, '', regex=True)
+    length = digits.str.len()
+    first = digits.str[:1]
+
+    # Маски применяются от младшей ветки normalize_phone к старшей: последняя побеждает
+    result = digits.mask((length > 10) & (first != '+'), '+' + digits)
+    result = result.mask(length == 10, '+7' + digits)
+    result = result.mask((length == 11) & (first == '7'), '+' + digits)
+    result = result.mask((length == 11) & (first == '8'), '+7' + digits.str[1:])
+    result = result.where(result.str.len() >= 11, '')
+
+    return result.tolist()
+
+
+def normalize_emails(emails: Iterable[str]) -> List[str]:
+    """Очищенные email колонки; невалидные заменяются пустой строкой"""
+    match = EMAIL_RE.match
+    cleaned = ((email or '').strip() for email in emails)
+    return [email if email and match(email) else '' for email in cleaned]
+
+
+def validate_contacts(contacts: List[Dict]) -> List[Tuple[Optional[Dict], List[str]]]:
+    """Проверка и нормализация строк импорта целыми колонками.
+
+    Для каждой строки возвращает (очищенный контакт или None, причины).
+    Строка отклоняется только без имени и фамилии; некорректные телефон
+    и email отбрасываются из контакта с причиной в списке.
+    """
+    rows = [contact or {} for contact in contacts]
+    phones = [(row.get('phone') or '').strip() for row in rows]
+    emails = [(row.get('email') or '').strip() for row in rows]
+
+    normalized_phones = normalize_phones(phones)
+    normalized_emails = normalize_emails(emails)
+
+    results = []
+    for row, phone, raw_phone, email, raw_email in zip(rows, normalized_phones, phones,
+                                                        normalized_emails, emails):
+        first_name = (row.get('first_name') or '').strip()
+        last_name = (row.get('last_name') or '').strip()
+
+        if not first_name and not last_name:
+            results.append((None, [REASON_NO_NAME]))
+            continue
+
+        validated = {'first_name': first_name, 'last_name': last_name}
+        reasons = []
+
+        if phone:
+            validated['phone'] = phone
+        elif raw_phone:
+            reasons.append(REASON_BAD_PHONE)
+
+        if email:
+            validated['email'] = email
+        elif raw_email:
+            reasons.append(REASON_BAD_EMAIL)
+
+        company_name = (row.get('company_name') or '').strip()
+        if company_name:
+            validated['company_name'] = company_name
+
+        results.append((validated, reasons))
+
+    return results
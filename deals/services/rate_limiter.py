@@ -0,0 +1,250 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+LIMIT_ERRORS = ('QUERY_LIMIT_EXCEEDED', 'OPERATION_TIME_LIMIT')
+WRAPPED_METHODS = ('call_api_method', 'call_batch')
+
+
+class BitrixRateLimiter:
+    """Token bucket запросов к одному порталу Bitrix24 с адаптивной скоростью.
+
+    Скорость уменьшается вдвое на QUERY_LIMIT_EXCEEDED и плавно возвращается
+    к настроенной после успешных запросов. Подсказки time.operating из ответов
+    приостанавливают метод до operating_reset_at, когда его лимит почти исчерпан.
+    """
+
+    OPERATING_LIMIT = 480
+    OPERATING_THRESHOLD = 0.8
+    MIN_RATE = 0.2
+
+    def __init__(self, portal, rate=None, burst=None):
+        self.portal = portal
+        self.max_rate = rate or getattr(settings, 'BITRIX_RATE_LIMIT', 2)
+        self.rate = self.max_rate
+        self.burst = burst or getattr(settings, 'BITRIX_RATE_BURST', 50)
+        self.tokens = float(self.burst)
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.method_blocked_until = {}
+
+        self.requests = 0
+        self.limit_errors = 0
+        self.waited_seconds = 0.0
+        self._recent = deque()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, method=None):
+        """Ожидание права на один HTTP-запрос к порталу"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+
+                wait = max(self.blocked_until, self.method_blocked_until.get(method, 0.0)) - now
+                if wait <= 0 and self.tokens >= 1:
+                    self.tokens -= 1
+                    self.requests += 1
+                    self._recent.append(now)
+                    return
+
+                if wait <= 0:
+                    wait = (1 - self.tokens) / self.rate
+
+                self.waited_seconds += wait
+
+            time.sleep(wait)
+
+    def on_success(self, method=None, response=None):
+        """Учет успешного ответа: восстановление скорости и подсказки time.operating"""
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+            timing = response.get('time') if isinstance(response, dict) else None
+            if not isinstance(timing, dict):
+                return
+
+            operating = timing.get('operating') or 0
+            if method and operating >= self.OPERATING_LIMIT * self.OPERATING_THRESHOLD:
+                reset_at = timing.get('operating_reset_at') or (time.time() + 60)
+                delay = max(0.0, reset_at - time.time())
+                self.method_blocked_until[method] = time.monotonic() + delay
+                logger.warning(f"Метод {method} портала {self.portal} приостановлен на {delay:.0f} с "
+                               f"(time.operating = {operating})")
+
+    def on_limit_exceeded(self, attempt):
+        """Снижение скорости и пауза после QUERY_LIMIT_EXCEEDED"""
+        with self._lock:
+            self.limit_errors += 1
+            self.rate = max(self.MIN_RATE, self.rate / 2)
+            self.tokens = 0.0
+            delay = min(2 ** attempt, 30)
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+
+        logger.warning(f"QUERY_LIMIT_EXCEEDED на портале {self.portal}, скорость снижена до {self.rate:.2f} запр/с, "
+                       f"пауза {delay} с")
+
+    def metrics(self):
+        """Текущий бюджет и пропускная способность"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            while self._recent and self._recent[0] < now - 60:
+                self._recent.popleft()
+
+            return {
+                'portal': self.portal,
+                'rate': round(self.rate, 3),
+                'max_rate': self.max_rate,
+                'burst': self.burst,
+                'available_tokens': round(self.tokens, 2),
+                'requests_total': self.requests,
+                'requests_last_minute': len(self._recent),
+                'throughput_per_second': round(len(self._recent) / 60, 3),
+                'limit_errors': self.limit_errors,
+                'waited_seconds': round(self.waited_seconds, 2),
+                'blocked_for_seconds': round(max(0.0, self.blocked_until - now), 2),
+                'blocked_methods': sorted(
+                    method for method, until in self.method_blocked_until.items() if until > now
+                ),
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_portal_name(bitrix_token):
+    """Домен портала токена для выбора лимитера"""
+    domain = getattr(bitrix_token, 'domain', None)
+    if domain:
+        return str(domain)
+
+    app_settings = getattr(settings, 'APP_SETTINGS', None)
+    return getattr(app_settings, 'portal_domain', None) or 'default'
+
+
+def get_limiter(portal):
+    """Общий для процесса лимитер портала"""
+    with _limiters_lock:
+        if portal not in _limiters:
+            _limiters[portal] = BitrixRateLimiter(portal)
+        return _limiters[portal]
+
+
+def get_limiter_metrics(portal=None):
+    """Метрики лимитеров процесса; при указанном portal — только его лимитера"""
+    with _limiters_lock:
+        limiters = [limiter for name, limiter in _limiters.items() if portal is None or name == portal]
+    return [limiter.metrics() for limiter in limiters]
+
+
+def is_limit_error(error):
+    """Признак превышения лимита запросов в исключении или ответе"""
+    if isinstance(error, dict):
+        error = f"{error.get('error', '')} {error.get('error_description', '')}"
+    return any(code in str(error) for code in LIMIT_ERRORS)
+
+
+class RateLimitedToken:
+    """Токен Bitrix24, вызовы API которого проходят через лимитер портала.
+
+    Остальные атрибуты проксируются к исходному токену, поэтому проверки
+    hasattr(token, 'call_batch') работают как раньше. call_list_method
+    листает страницы сам через call_batch, чтобы лимитер учитывал каждый
+    HTTP-запрос, а не весь список одним вызовом.
+    """
+
+    def __init__(self, bitrix_token, limiter=None):
+        self._token = bitrix_token
+        self.limiter = limiter or get_limiter(get_portal_name(bitrix_token))
+        self.max_retries = getattr(settings, 'BITRIX_RATE_MAX_RETRIES', 5)
+
+    def __getattr__(self, name):
+        attr = getattr(self._token, name)
+        if name not in WRAPPED_METHODS:
+            return attr
+
+        def limited_call(*args, **kwargs):
+            method = args[0] if args and isinstance(args[0], str) else name
+            return self._call(attr, method, *args, **kwargs)
+
+        return limited_call
+
+    def call_list_method(self, method, fields=None):
+        """Все элементы списочного метода.
+
+        Первая страница запрашивается отдельно и сообщает total, остальные смещения
+        start отправляются командами call_batch по BITRIX_LIST_PAGES_PER_BATCH страниц:
+        лимитер расходует один токен на batch, а не на каждые 50 элементов.
+        """
+        # bitrix_batch сам импортирует этот модуль
+        from .bitrix_batch import BatchExecutor
+
+        params = dict(fields or {})
+        response = self._call(self._token.call_api_method, method, method, {**params, 'start': 0})
+        items = self._list_page(method, response)
+
+        page_size = response.get('next')
+        total = int(response.get('total') or 0)
+        if not page_size or total <= len(items):
+            return items
+
+        offsets = list(range(page_size, total, page_size))
+        executor = BatchExecutor(self, chunk_size=getattr(settings, 'BITRIX_LIST_PAGES_PER_BATCH', 50))
+        results = executor.execute([(method, {**params, 'start': start}) for start in offsets], idempotent=True)
+
+        for start, result in zip(offsets, results):
+            if not result['success']:
+                raise ValueError(f"Ошибка {method} со смещения {start}: {result['error']}")
+            items.extend(self._list_page(method, {'result': result['result']}))
+
+        return items
+
+    @staticmethod
+    def _list_page(method, response):
+        if not isinstance(response, dict) or 'error' in response:
+            raise ValueError(f"Ошибка {method}: {response}")
+
+        result = response.get('result') or []
+        if not isinstance(result, list):
+            raise ValueError(f"Ошибка {method}: ожидался список, получено {type(result).__name__}")
+        return list(result)
+
+    def _call(self, func, method, *args, **kwargs):
+        attempt = 0
+
+        while True:
+            self.limiter.acquire(method)
+            try:
+                response = func(*args, **kwargs)
+            except Exception as e:
+                if not is_limit_error(e) or attempt >= self.max_retries:
+                    raise
+            else:
+                limit_hit = isinstance(response, dict) and 'error' in response and is_limit_error(response)
+                if not limit_hit:
+                    self.limiter.on_success(method, response)
+                    return response
+                if attempt >= self.max_retries:
+                    return response
+
+            # Пауза выдерживается в следующем acquire
+            self.limiter.on_limit_exceeded(attempt)
+            attempt += 1
+
+
+def rate_limited(bitrix_token):
+    """Обертка токена лимитером; повторная обертка не создается"""
+    if bitrix_token is None or isinstance(bitrix_token, RateLimitedToken):
+        return bitrix_token
+    return RateLimitedToken(bitrix_token)
@@ -0,0 +1,163 @@
+import gzip
+import json
+import logging
+import os
+import shutil
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from ..models import ImportExportJob, ImportExportRecord
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = [ImportExportJob.STATUS_COMPLETED, ImportExportJob.STATUS_FAILED]
+
+ARCHIVE_FIELDS = ['record_index', 'contact_data', 'bitrix_contact_id', 'status', 'error_message', 'created_at']
+
+
+def get_retention_days():
+    """Сроки хранения в днях из IMPORT_EXPORT_RETENTION_DAYS; None или отсутствующий ключ — хранить бессрочно"""
+    return getattr(settings, 'IMPORT_EXPORT_RETENTION_DAYS', {
+        'export_file': 7,
+        'import_file': 30,
+        'export_records': 7,
+        'import_records': 180,
+    })
+
+
+class RetentionCleaner:
+    """Удаление устаревших файлов и журналов задач импорта/экспорта.
+
+    Затрагиваются только завершенные задачи. Файлы удаляются из хранилища,
+    а поле очищается, строки журнала удаляются порциями по batch_size
+    отдельными запросами, чтобы не держать долгих блокировок таблицы.
+    При archive строки журнала перед удалением сохраняются в jsonl.gz.
+    """
+
+    def __init__(self, dry_run=False, archive=False, batch_size=None, now=None):
+        self.dry_run = dry_run
+        self.archive = archive
+        self.batch_size = batch_size or getattr(settings, 'IMPORT_EXPORT_RETENTION_BATCH_SIZE', 5000)
+        self.archive_dir = getattr(settings, 'IMPORT_EXPORT_ARCHIVE_DIR', 'media/import_export_archive')
+        self.now = now or timezone.now()
+        self.days = get_retention_days()
+
+    def run(self):
+        """Очистка по всем срокам, возвращает отчет с освобожденными байтами и строками"""
+        report = {
+            'export_files': 0,
+            'import_files': 0,
+            'freed_bytes': 0,
+            'records_deleted': 0,
+            'records_archived': 0,
+        }
+
+        self._cleanup_files(ImportExportJob.JOB_TYPE_EXPORT, 'export_file', 'export_file', 'export_files', report)
+        self._cleanup_files(ImportExportJob.JOB_TYPE_IMPORT, 'import_file', 'source_file', 'import_files', report)
+        self._cleanup_records(ImportExportJob.JOB_TYPE_EXPORT, 'export_records', report)
+        self._cleanup_records(ImportExportJob.JOB_TYPE_IMPORT, 'import_records', report)
+
+        return report
+
+    def _expired_jobs(self, job_type, key):
+        days = self.days.get(key)
+        if days is None:
+            return ImportExportJob.objects.none()
+
+        return ImportExportJob.objects.filter(
+            job_type=job_type,
+            status__in=FINISHED_STATUSES,
+            created_at__lt=self.now - timedelta(days=days)
+        )
+
+    def _cleanup_files(self, job_type, key, field, counter, report):
+        jobs = self._expired_jobs(job_type, key).exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+
+        for job in jobs.only('id', field).iterator(chunk_size=self.batch_size):
+            file = getattr(job, field)
+            size = 0
+
+            try:
+                if file.storage.exists(file.name):
+                    size = file.storage.size(file.name)
+                    if not self.dry_run:
+                        file.storage.delete(file.name)
+            except OSError as e:
+                logger.error(f"Не удалось удалить файл {file.name} задачи {job.id}: {e}")
+                continue
+
+            if not self.dry_run:
+                ImportExportJob.objects.filter(id=job.id).update(**{field: None})
+
+            report[counter] += 1
+            report['freed_bytes'] += size
+
+    def _cleanup_records(self, job_type, key, report):
+        job_ids = self._expired_jobs(job_type, key).filter(records__isnull=False).distinct().values_list('id', flat=True)
+
+        for job_id in job_ids.iterator(chunk_size=self.batch_size):
+            records = ImportExportRecord.objects.filter(job_id=job_id)
+
+            if self.dry_run:
+                report['records_deleted'] += records.count()
+                continue
+
+            if self.archive:
+                report['records_archived'] += self._archive_records(job_id, records)
+
+            report['records_deleted'] += self._delete_in_batches(records)
+
+    def _archive_records(self, job_id, records):
+        """Сохранение журнала задачи в <archive_dir>/records_<job_id>.jsonl.gz.
+
+        Архив собирается во временном файле и заменяет прежний только целиком,
+        строки удаляются уже после замены. Если прошлый запуск прервался на удалении,
+        архив дополняется новой частью gzip, а уже сохраненные строки пропускаются.
+        """
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir, f'records_{job_id}.jsonl.gz')
+        archived_indexes = self._archived_indexes(path)
+
+        archived = 0
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'wb') as output:
+            if archived_indexes:
+                with open(path, 'rb') as existing:
+                    shutil.copyfileobj(existing, output)
+
+            with gzip.open(output, 'wt', encoding='utf-8') as file:
+                rows = records.order_by('record_index').values(*ARCHIVE_FIELDS).iterator(chunk_size=self.batch_size)
+                for row in rows:
+                    if row['record_index'] in archived_indexes:
+                        continue
+                    file.write(json.dumps(row, ensure_ascii=False, cls=DjangoJSONEncoder))
+                    file.write('\n')
+                    archived += 1
+
+            output.flush()
+            os.fsync(output.fileno())
+
+        os.replace(temp_path, path)
+        return archived
+
+    @staticmethod
+    def _archived_indexes(path):
+        """Номера строк, уже сохраненных в архиве"""
+        if not os.path.exists(path):
+            return set()
+
+        with gzip.open(path, 'rt', encoding='utf-8') as file:
+            return {json.loads(line)['record_index'] for line in file if line.strip()}
+
+    def _delete_in_batches(self, records):
+        deleted = 0
+        while True:
+            ids = list(records.order_by().values_list('id', flat=True)[:self.batch_size])
+            if not ids:
+                return deleted
+
+            count, _ = ImportExportRecord.objects.filter(id__in=ids).delete()
+            deleted += count
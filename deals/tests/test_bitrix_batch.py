@@ -0,0 +1,136 @@
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from deals.services.bitrix_batch import BatchExecutor, chunked, parse_batch_response
+from deals.services.rate_limiter import RateLimitedToken
+
+
+class BatchToken:
+    """Токен с call_batch: ответ на команду задается функцией answer(ключ, метод, параметры, номер попытки)"""
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.batches = []
+        self.sent = {}
+        self._lock = threading.Lock()
+
+    def call_batch(self, commands):
+        with self._lock:
+            self.batches.append(list(commands))
+            attempts = {key: self.sent.setdefault(key, 0) for key in commands}
+            for key in commands:
+                self.sent[key] += 1
+
+        result, result_error = {}, {}
+        for key, (method, params) in commands.items():
+            value = self.answer(key, method, params, attempts[key])
+            if isinstance(value, Exception):
+                raise value
+            if isinstance(value, dict) and 'error' in value:
+                result_error[key] = value
+            else:
+                result[key] = value
+        return {'result': {'result': result, 'result_error': result_error}}
+
+
+def executor(token, **kwargs):
+    return BatchExecutor(RateLimitedToken(token, limiter=mock.Mock()), **kwargs)
+
+
+def add_commands(count):
+    return [('crm.contact.add', {'fields': {'NAME': f'Контакт {i}'}}) for i in range(count)]
+
+
+class ChunkingTests(SimpleTestCase):
+
+    def test_chunked(self):
+        self.assertEqual(chunked(range(5), 2), [[0, 1], [2, 3], [4]])
+        self.assertEqual(chunked([], 2), [])
+
+    def test_commands_are_split_by_batch_limit_and_keep_order(self):
+        token = BatchToken(lambda key, method, params, attempt: params['fields']['NAME'])
+
+        results = executor(token, concurrency=2).execute(add_commands(120))
+
+        self.assertEqual(sorted(len(batch) for batch in token.batches), [20, 50, 50])
+        self.assertEqual([result['result'] for result in results], [f'Контакт {i}' for i in range(120)])
+        self.assertEqual([result['original_index'] for result in results], list(range(120)))
+
+
+class ParseBatchResponseTests(SimpleTestCase):
+
+    def test_result_error_is_parsed_per_command(self):
+        response = {'result': {
+            'result': {'cmd_0': 10, 'cmd_2': {'result': [1, 2]}},
+            'result_error': {'cmd_1': {'error': 'ACCESS_DENIED', 'error_description': 'Доступ запрещен'}},
+        }}
+
+        parsed = parse_batch_response(response, ['cmd_0', 'cmd_1', 'cmd_2', 'cmd_3'])
+
+        self.assertEqual(parsed['cmd_0'], (True, 10, None))
+        self.assertEqual(parsed['cmd_1'], (False, None, 'ACCESS_DENIED: Доступ запрещен'))
+        self.assertEqual(parsed['cmd_2'], (True, [1, 2], None))
+        self.assertFalse(parsed['cmd_3'][0])
+
+    def test_flat_results_by_key(self):
+        parsed = parse_batch_response({'cmd_0': 1, 'cmd_1': {'error': 'NOT_FOUND'}}, ['cmd_0', 'cmd_1'])
+
+        self.assertEqual(parsed['cmd_0'], (True, 1, None))
+        self.assertEqual(parsed['cmd_1'], (False, None, 'NOT_FOUND'))
+
+
+class RetryTests(SimpleTestCase):
+
+    def failing_once(self, error):
+        def answer(key, method, params, attempt):
+            if key == 'cmd_1' and attempt == 0:
+                return error
+            return key
+        return answer
+
+    def test_limit_error_is_retried_for_non_idempotent_commands(self):
+        token = BatchToken(self.failing_once({'error': 'QUERY_LIMIT_EXCEEDED'}))
+
+        results = executor(token).execute(add_commands(3))
+
+        self.assertTrue(all(result['success'] for result in results))
+        self.assertEqual(token.sent, {'cmd_0': 1, 'cmd_1': 2, 'cmd_2': 1})
+
+    def test_internal_error_is_not_resent_for_non_idempotent_commands(self):
+        token = BatchToken(self.failing_once({'error': 'INTERNAL_SERVER_ERROR'}))
+
+        results = executor(token).execute(add_commands(3))
+
+        self.assertFalse(results[1]['success'])
+        self.assertEqual(token.sent['cmd_1'], 1)
+
+    def test_internal_error_is_retried_for_idempotent_commands(self):
+        token = BatchToken(self.failing_once({'error': 'INTERNAL_SERVER_ERROR'}))
+
+        results = executor(token).execute(add_commands(3), idempotent=True)
+
+        self.assertTrue(results[1]['success'])
+        self.assertEqual(token.sent['cmd_1'], 2)
+
+    def test_failed_batch_request_is_retried_only_when_idempotent(self):
+        def answer(key, method, params, attempt):
+            return ConnectionError('connection reset') if attempt == 0 else key
+
+        token = BatchToken(answer)
+        results = executor(token).execute(add_commands(2))
+        self.assertEqual([result['success'] for result in results], [False, False])
+        self.assertEqual(len(token.batches), 1)
+
+        token = BatchToken(answer)
+        results = executor(token).execute(add_commands(2), idempotent=True)
+        self.assertEqual([result['result'] for result in results], ['cmd_0', 'cmd_1'])
+
+    def test_retries_are_limited(self):
+        token = BatchToken(lambda key, method, params, attempt: {'error': 'QUERY_LIMIT_EXCEEDED'})
+
+        results = executor(token, max_retries=2).execute(add_commands(1))
+
+        self.assertFalse(results[0]['success'])
+        self.assertEqual(token.sent['cmd_0'], 3)
@@ -0,0 +1,111 @@
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from deals.models import CompanyMapPoint, CompanyMapState
+from deals.services.company_map import CompanyMapSnapshot
+
+
+class CompanyMapPendingTests(TestCase):
+
+    def setUp(self):
+        self.snapshot = CompanyMapSnapshot(SimpleNamespace(domain='portal.bitrix24.ru'))
+        for company_id, query in ((1, 'Москва'), (2, 'Нигде'), (3, 'Казань')):
+            CompanyMapPoint.objects.create(
+                portal=self.snapshot.portal, company_id=company_id, title=query, address=query, query=query
+            )
+        CompanyMapPoint.objects.create(
+            portal='other.bitrix24.ru', company_id=1, title='Чужая', address='Омск', query='Омск'
+        )
+
+    def geocode(self, results, pending=()):
+        geocoder = mock.Mock()
+        geocoder.geocode_many.return_value = (results, list(pending))
+        return mock.patch('deals.services.company_map.get_geocoder', return_value=geocoder)
+
+    def test_geocode_pending_uses_only_portal_addresses(self):
+        with self.geocode({'Москва': [55.75, 37.62]}, pending=['Казань']) as get_geocoder:
+            filled, pending = self.snapshot.geocode_pending()
+
+        queries = get_geocoder.return_value.geocode_many.call_args[0][0]
+        self.assertEqual(sorted(queries), ['Казань', 'Москва', 'Нигде'])
+        # Москва получила координаты, Нигде не найдена, Казань еще ожидает ответа
+        self.assertEqual(filled, 1)
+        self.assertEqual(pending, 1)
+        self.assertTrue(CompanyMapPoint.objects.get(portal=self.snapshot.portal, company_id=2).geocode_failed)
+
+    def test_not_found_addresses_are_not_requested_again(self):
+        with self.geocode({}):
+            self.snapshot.geocode_pending()
+
+        with self.geocode({}) as get_geocoder:
+            filled, pending = self.snapshot.geocode_pending()
+
+        get_geocoder.return_value.geocode_many.assert_not_called()
+        self.assertEqual((filled, pending), (0, 0))
+
+    def test_summary_reports_refreshing_until_first_refresh(self):
+        self.assertTrue(self.snapshot.summary()['refreshing'])
+
+        CompanyMapState.objects.create(portal=self.snapshot.portal, refreshed_at=timezone.now())
+        summary = self.snapshot.summary()
+
+        self.assertFalse(summary['refreshing'])
+        self.assertEqual((summary['companies'], summary['geocoded'], summary['pending']), (3, 0, 3))
+        self.assertIsNone(summary['bounds'])
+
+
+class ClusterRebuildTests(TestCase):
+
+    def setUp(self):
+        self.snapshot = CompanyMapSnapshot(SimpleNamespace(domain='portal.bitrix24.ru'))
+        self.state = CompanyMapState.objects.create(portal=self.snapshot.portal, refreshed_at=timezone.now())
+        for company_id, query in ((1, 'Москва'), (2, 'Казань'), (3, 'Омск')):
+            CompanyMapPoint.objects.create(
+                portal=self.snapshot.portal, company_id=company_id, title=query, address=query, query=query
+            )
+
+    def geocode(self, results, pending=()):
+        geocoder = mock.Mock()
+        geocoder.geocode_many.return_value = (results, list(pending))
+        return mock.patch('deals.services.company_map.get_geocoder', return_value=geocoder)
+
+    def test_polls_rebuild_at_most_once_per_interval(self):
+        with mock.patch.object(self.snapshot, 'rebuild_clusters') as rebuild:
+            with self.geocode({'Москва': [55.75, 37.62]}, pending=['Казань', 'Омск']):
+                self.snapshot.geocode_pending()
+            with self.geocode({'Казань': [55.79, 49.12]}, pending=['Омск']):
+                self.snapshot.geocode_pending()
+
+            self.assertEqual(rebuild.call_count, 1)
+
+            # Последние координаты пересчитываются сразу, без ожидания интервала
+            with self.geocode({'Омск': [54.99, 73.37]}):
+                self.assertEqual(self.snapshot.geocode_pending(), (1, 0))
+            self.assertEqual(rebuild.call_count, 2)
+
+    def test_stale_clusters_are_rebuilt_after_interval(self):
+        CompanyMapState.objects.filter(id=self.state.id).update(
+            clusters_stale=True, clustered_at=timezone.now() - timedelta(minutes=5)
+        )
+
+        with mock.patch.object(self.snapshot, 'rebuild_clusters') as rebuild:
+            self.assertTrue(self.snapshot.rebuild_stale_clusters())
+            self.assertFalse(self.snapshot.rebuild_stale_clusters())
+
+        rebuild.assert_called_once()
+
+    def test_logo_only_fill_does_not_rebuild(self):
+        CompanyMapPoint.objects.filter(portal=self.snapshot.portal).update(latitude=55.0, longitude=37.0)
+        CompanyMapPoint.objects.filter(company_id=1).update(logo_file_id='10', logo_download_url='/logo')
+        store = mock.Mock()
+        store.logo_urls.return_value = {'1': 'http://localhost/media/logo.png'}
+
+        with mock.patch('deals.services.company_map.get_logo_store', return_value=store), \
+                self.geocode({}):
+            located, changed = self.snapshot._fill_missing()
+
+        self.assertEqual((located, changed), (0, 1))
@@ -0,0 +1,40 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from deals.services.company_resolver import CompanyResolver
+
+
+def batch_result(result=None, error=None):
+    return {'success': error is None, 'result': result, 'error': error, 'original_index': 0}
+
+
+class CompanyTitlesTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.resolver = CompanyResolver(SimpleNamespace(domain='portal.bitrix24.ru'))
+        self.resolver.batch_executor = mock.Mock()
+
+    def test_titles_are_requested_once_and_cached(self):
+        self.resolver.batch_executor.execute.return_value = [
+            batch_result([{'ID': '1', 'TITLE': 'Ромашка'}, {'ID': '2', 'TITLE': 'Лютик'}])
+        ]
+
+        self.assertEqual(self.resolver.titles([1, '2', '3']), {'1': 'Ромашка', '2': 'Лютик'})
+        self.assertEqual(self.resolver.titles(['1', '3']), {'1': 'Ромашка'})
+        self.assertEqual(self.resolver.batch_executor.execute.call_count, 1)
+
+        # Следующая задача берет названия из общего кэша
+        other = CompanyResolver(SimpleNamespace(domain='portal.bitrix24.ru'))
+        other.batch_executor = mock.Mock()
+        self.assertEqual(other.titles(['2']), {'2': 'Лютик'})
+        other.batch_executor.execute.assert_not_called()
+
+    def test_request_error_is_raised(self):
+        self.resolver.batch_executor.execute.return_value = [batch_result(error='QUERY_LIMIT_EXCEEDED')]
+
+        with self.assertRaises(ValueError):
+            self.resolver.titles(['1'])
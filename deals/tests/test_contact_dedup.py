@@ -0,0 +1,42 @@
+from unittest import mock
+
+from django.test import TestCase
+from integration_utils.bitrix24.models import BitrixUser
+
+from deals.models import ImportExportJob, ImportExportRecord
+from deals.services.contact_dedup import ContactDeduplicator, dedup_hash
+
+PHONE = '+79001234567'
+
+
+class LocalIndexOwnerTests(TestCase):
+
+    def setUp(self):
+        self.owner = BitrixUser.objects.create()
+        self.other = BitrixUser.objects.create()
+        self.imported(self.owner, contact_id=101)
+        self.imported(self.other, contact_id=202)
+
+    def imported(self, user, contact_id):
+        job = ImportExportJob.objects.create(
+            job_type=ImportExportJob.JOB_TYPE_IMPORT,
+            file_format=ImportExportJob.FORMAT_CSV,
+            created_by=user,
+            file_name='contacts.csv'
+        )
+        ImportExportRecord.objects.create(
+            job=job, record_index=0, contact_data={}, status='created',
+            bitrix_contact_id=contact_id, phone_hash=dedup_hash(PHONE)
+        )
+
+    def find(self, owner_id):
+        deduplicator = ContactDeduplicator(mock.Mock(), mode='skip', owner_id=owner_id)
+        return deduplicator.find_duplicates([(0, {'phone': PHONE})], local_only=True)
+
+    def test_only_owner_records_are_matched(self):
+        self.assertEqual(self.find(self.owner.id), {0: (101, ['PHONE'])})
+        self.assertEqual(self.find(self.other.id), {0: (202, ['PHONE'])})
+
+    def test_unknown_owner_matches_nothing(self):
+        self.assertEqual(self.find(None), {})
+        self.assertEqual(self.find(BitrixUser.objects.create().id), {})
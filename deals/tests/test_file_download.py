@@ -0,0 +1,160 @@
+import gzip
+
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils.http import http_date
+from integration_utils.bitrix24.models import BitrixUser
+
+from deals import views
+from deals.services.file_download import export_etag, parse_range
+from deals.tests.test_views import ExportStorageMixin, authenticated
+
+CONTENT = b'ID;NAME\n' + b''.join(f'{i};Contact {i}\n'.encode() for i in range(100))
+
+
+class ParseRangeTests(SimpleTestCase):
+
+    def test_ranges(self):
+        size = 100
+        self.assertEqual(parse_range('bytes=0-9', size), (0, 9))
+        self.assertEqual(parse_range('bytes=90-', size), (90, 99))
+        self.assertEqual(parse_range('bytes=-10', size), (90, 99))
+        self.assertEqual(parse_range('bytes=95-200', size), (95, 99))
+        self.assertEqual(parse_range('bytes=-200', size), (0, 99))
+
+    def test_whole_file(self):
+        for header in (None, '', 'bytes=-', 'bytes=0-1,5-6', 'items=0-1'):
+            self.assertIsNone(parse_range(header, 100), header)
+
+    def test_unsatisfiable(self):
+        for header in ('bytes=100-', 'bytes=10-5', 'bytes=-0'):
+            self.assertIs(parse_range(header, 100), False, header)
+
+
+class DownloadExportViewTests(ExportStorageMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.factory = RequestFactory()
+        self.user = BitrixUser.objects.create()
+
+    def download(self, job, **headers):
+        request = self.factory.get(f'/download/{job.id}/', **headers)
+        with authenticated(self.user):
+            response = views.download_export(request, job.id)
+        self.addCleanup(response.close)
+        return response
+
+    def body(self, response):
+        return b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_full_file(self):
+        job = self.create_export(self.user, 'contacts.csv', CONTENT)
+
+        response = self.download(job)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), CONTENT)
+        self.assertEqual(response['Content-Length'], str(len(CONTENT)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['ETag'], export_etag(job, len(CONTENT)))
+        self.assertIn('attachment', response['Content-Disposition'])
+
+    def test_range_returns_partial_content(self):
+        job = self.create_export(self.user, 'contacts.csv', CONTENT)
+
+        response = self.download(job, HTTP_RANGE='bytes=8-17')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.body(response), CONTENT[8:18])
+        self.assertEqual(response['Content-Range'], f'bytes 8-17/{len(CONTENT)}')
+        self.assertEqual(response['Content-Length'], '10')
+
+    def test_unsatisfiable_range(self):
+        job = self.create_export(self.user, 'contacts.csv', CONTENT)
+
+        response = self.download(job, HTTP_RANGE=f'bytes={len(CONTENT)}-')
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(CONTENT)}')
+
+    def test_if_range(self):
+        job = self.create_export(self.user, 'contacts.csv', CONTENT)
+        etag = export_etag(job, len(CONTENT))
+
+        matching = self.download(job, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        stale = self.download(job, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+
+        self.assertEqual(matching.status_code, 206)
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(self.body(stale), CONTENT)
+
+    def test_conditional_requests(self):
+        job = self.create_export(self.user, 'contacts.csv', CONTENT)
+
+        by_etag = self.download(job, HTTP_IF_NONE_MATCH=export_etag(job, len(CONTENT)))
+        by_date = self.download(job, HTTP_IF_MODIFIED_SINCE=http_date(job.completed_at.timestamp() + 60))
+        changed = self.download(job, HTTP_IF_NONE_MATCH='"stale"')
+
+        self.assertEqual(by_etag.status_code, 304)
+        self.assertEqual(by_date.status_code, 304)
+        self.assertEqual(changed.status_code, 200)
+
+    @override_settings(EXPORT_DOWNLOAD_OFFLOAD='x-accel', EXPORT_ACCEL_REDIRECT_PREFIX='/protected/export_files/')
+    def test_accel_redirect_offload(self):
+        job = self.create_export(self.user, 'contacts.csv', CONTENT)
+
+        response = self.download(job)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/export_files/{job.export_file.name}')
+        self.assertEqual(response['ETag'], export_etag(job, len(CONTENT)))
+
+    @override_settings(EXPORT_DOWNLOAD_OFFLOAD='x-sendfile')
+    def test_sendfile_offload(self):
+        job = self.create_export(self.user, 'contacts.csv', CONTENT)
+
+        response = self.download(job)
+
+        self.assertEqual(response['X-Sendfile'], job.export_file.path)
+        self.assertEqual(response.content, b'')
+
+    def test_gzip_is_sent_as_is_when_accepted(self):
+        compressed = gzip.compress(CONTENT)
+        job = self.create_export(self.user, 'contacts.csv.gz', compressed)
+
+        response = self.download(job, HTTP_ACCEPT_ENCODING='br, gzip;q=0.8')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), compressed)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['ETag'], export_etag(job, len(compressed), 'gzip'))
+        self.assertIn('text/csv', response['Content-Type'])
+
+    def test_gzip_is_decompressed_when_not_accepted(self):
+        compressed = gzip.compress(CONTENT)
+        job = self.create_export(self.user, 'contacts.csv.gz', compressed)
+
+        for headers in ({}, {'HTTP_ACCEPT_ENCODING': 'gzip;q=0, deflate'}):
+            response = self.download(job, **headers)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.body(response), CONTENT)
+            self.assertFalse(response.has_header('Content-Encoding'))
+            self.assertEqual(response['Accept-Ranges'], 'none')
+            self.assertEqual(response['ETag'], export_etag(job, len(compressed), 'identity'))
+
+    def test_gzip_etag_depends_on_encoding(self):
+        job = self.create_export(self.user, 'contacts.csv.gz', gzip.compress(CONTENT))
+        identity_etag = self.download(job)['ETag']
+
+        response = self.download(job, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=identity_etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_other_users_export_is_not_found(self):
+        job = self.create_export(BitrixUser.objects.create(), 'contacts.csv', CONTENT)
+
+        self.assertEqual(self.download(job).status_code, 404)
@@ -0,0 +1,67 @@
+import io
+
+import openpyxl
+from django.test import SimpleTestCase
+
+from deals.file_handlers.base_handler import CSVHandler, XLSXHandler
+
+
+class CSVEncodingTests(SimpleTestCase):
+
+    def test_cp1251_after_ascii_head(self):
+        """Байт cp1251 после первого блока: кодировка определяется по всему файлу"""
+        handler = CSVHandler()
+        header = b'first_name,last_name,phone,email\n'
+        row = b'John,Smith,+79990000000,john@example.com\n'
+        ascii_rows = row * (handler.CHUNK_SIZE // len(row) + 1)
+        content = header + ascii_rows + 'Иван,Петров,+79991111111,ivan@example.com\n'.encode('cp1251')
+
+        self.assertGreater(len(header + ascii_rows), handler.CHUNK_SIZE)
+
+        records = list(handler.iter_records(io.BytesIO(content)))
+
+        self.assertEqual(len(records), ascii_rows.count(b'\n') + 1)
+        self.assertEqual(records[-1]['first_name'], 'Иван')
+        self.assertEqual(records[-1]['last_name'], 'Петров')
+
+    def test_utf8_with_bom(self):
+        content = '\ufeffИмя;Фамилия;Телефон\nИван;Петров;+79991111111\n'.encode('utf-8')
+
+        records = list(CSVHandler().iter_records(io.BytesIO(content)))
+
+        self.assertEqual(records[0]['first_name'], 'Иван')
+        self.assertEqual(records[0]['phone'], '+79991111111')
+
+
+class RowNumberTests(SimpleTestCase):
+
+    def test_csv_rows_keep_file_line_numbers(self):
+        content = (
+            'Имя,Фамилия,Телефон,Компания\n'
+            'Иван,Петров,+79991111111,\n'
+            '\n'
+            ',,+79992222222,\n'
+            'Анна,Смирнова,,"ООО\nРога"\n'
+            'Петр,,,\n'
+        ).encode('utf-8')
+
+        rows = list(CSVHandler().iter_rows(io.BytesIO(content)))
+
+        self.assertEqual([number for number, _ in rows], [2, 4, 5, 7])
+        self.assertEqual(rows[1][1]['phone'], '+79992222222')
+        # Строка без имени и фамилии не попадает в записи для импорта
+        self.assertEqual(len(list(CSVHandler().iter_records(io.BytesIO(content)))), 3)
+
+    def test_xlsx_rows_keep_sheet_row_numbers(self):
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        for row in (['Имя', 'Фамилия', 'Телефон'], ['Иван', 'Петров', '+79991111111'], [None, None, None],
+                    [None, None, '+79992222222']):
+            sheet.append(row)
+        content = io.BytesIO()
+        workbook.save(content)
+
+        rows = list(XLSXHandler().iter_rows(content))
+
+        self.assertEqual([number for number, _ in rows], [2, 4])
+        self.assertEqual(rows[1][1]['first_name'], '')
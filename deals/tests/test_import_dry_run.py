@@ -0,0 +1,69 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.test import TestCase
+from integration_utils.bitrix24.models import BitrixUser
+
+from deals.models import ImportExportJob
+from deals.services.import_export_service import DRY_RUN_STAGES, process_import_file
+from deals.services.normalization import REASON_BAD_PHONE, REASON_NO_NAME
+
+CONTENT = (
+    'Имя,Фамилия,Телефон,Email\n'
+    'Иван,Петров,+79991111111,ivan@example.com\n'
+    '\n'
+    ',,+79992222222,\n'
+    'Анна,Смирнова,12,\n'
+    'Петр,Иванов,+7 999 111-11-11,\n'
+).encode('utf-8')
+
+
+class ImportDryRunTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        storage = ImportExportJob._meta.get_field('source_file').storage
+        patcher = mock.patch.object(storage, 'location', directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.job = ImportExportJob.objects.create(
+            job_type=ImportExportJob.JOB_TYPE_IMPORT,
+            file_format=ImportExportJob.FORMAT_CSV,
+            created_by=BitrixUser.objects.create(),
+            file_name='contacts.csv',
+            filter_params={'dry_run': True, 'dedup_mode': 'skip'}
+        )
+        self.job.source_file.save('contacts.csv', ContentFile(CONTENT))
+        self.token = mock.Mock(spec=['call_api_method', 'call_batch'])
+
+    def test_verdicts_use_file_line_numbers(self):
+        self.assertTrue(process_import_file(self.job, self.token))
+
+        verdicts = {
+            record.record_index: (record.status, record.error_message)
+            for record in self.job.records.all()
+        }
+        self.assertEqual(verdicts, {
+            2: ('valid', ''),
+            4: ('failed', REASON_NO_NAME),
+            5: ('valid', REASON_BAD_PHONE),
+            6: ('duplicate', 'Повторяет строку 2'),
+        })
+        self.token.call_api_method.assert_not_called()
+        self.token.call_batch.assert_not_called()
+
+    def test_stats_report_rows_verdicts_and_stages(self):
+        process_import_file(self.job, self.token)
+
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, ImportExportJob.STATUS_COMPLETED)
+        self.assertEqual((self.job.total_records, self.job.processed_records, self.job.failed_records), (4, 4, 1))
+        self.assertEqual(self.job.stats['rows'], 4)
+        self.assertEqual(self.job.stats['verdicts'], {'valid': 2, 'failed': 1, 'duplicate': 1})
+        self.assertEqual(set(self.job.stats['stages']), set(DRY_RUN_STAGES))
+        for stage in self.job.stats['stages'].values():
+            self.assertGreaterEqual(stage['seconds'], 0)
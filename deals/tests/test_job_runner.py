@@ -0,0 +1,93 @@
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from integration_utils.bitrix24.models import BitrixUser
+
+from deals.models import ImportExportJob
+from deals.services import job_runner
+
+
+def failing_job(attempts):
+    return mock.Mock(id='job', job_type=ImportExportJob.JOB_TYPE_IMPORT, attempts=attempts)
+
+
+@override_settings(BACKGROUND_TASK_MAX_ATTEMPTS=3, BACKGROUND_TASK_RETRY_DELAY=30,
+                   BACKGROUND_TASK_RETRY_MAX_DELAY=600)
+class RunJobRetryTests(SimpleTestCase):
+
+    def run_failing(self, job):
+        handler = mock.Mock(side_effect=ValueError('Bitrix24 недоступен'))
+        with mock.patch.dict(job_runner.JOB_HANDLERS, {ImportExportJob.JOB_TYPE_IMPORT: handler}):
+            job_runner.run_job(job, bitrix_token=object())
+
+    def test_failed_job_waits_before_retry(self):
+        job = failing_job(attempts=2)
+        before = timezone.now()
+
+        self.run_failing(job)
+
+        self.assertEqual(job.status, ImportExportJob.STATUS_PENDING)
+        self.assertGreaterEqual(job.run_after, before + timedelta(seconds=60))
+        job.save.assert_called_once()
+
+    def test_last_attempt_fails_without_retry(self):
+        job = failing_job(attempts=3)
+
+        self.run_failing(job)
+
+        self.assertEqual(job.status, ImportExportJob.STATUS_FAILED)
+        self.assertIsNone(job.run_after)
+
+    def test_retry_delay_is_capped(self):
+        self.assertEqual(job_runner.retry_delay(1), timedelta(seconds=30))
+        self.assertEqual(job_runner.retry_delay(10), timedelta(seconds=600))
+
+
+class JobHeartbeatTests(SimpleTestCase):
+
+    def test_heartbeat_ticks_while_job_runs(self):
+        with mock.patch.object(job_runner.ImportExportJob, 'objects') as objects, \
+                mock.patch.object(job_runner, 'connection'):
+            with job_runner.JobHeartbeat('job', interval=0.01):
+                time.sleep(0.1)
+            ticks = objects.filter.return_value.update.call_count
+
+            time.sleep(0.05)
+            self.assertGreater(ticks, 0)
+            self.assertEqual(objects.filter.return_value.update.call_count, ticks)
+
+
+@override_settings(BACKGROUND_TASK_MAX_ATTEMPTS=3, BACKGROUND_TASK_STALE_TIMEOUT=60)
+class RequeueStaleJobsTests(TestCase):
+
+    def setUp(self):
+        self.owner = BitrixUser.objects.create()
+
+    def stale_job(self, attempts):
+        return ImportExportJob.objects.create(
+            job_type=ImportExportJob.JOB_TYPE_IMPORT,
+            file_format=ImportExportJob.FORMAT_CSV,
+            created_by=self.owner,
+            file_name='contacts.csv',
+            status=ImportExportJob.STATUS_PROCESSING,
+            attempts=attempts,
+            heartbeat_at=timezone.now() - timedelta(minutes=5)
+        )
+
+    def test_stale_job_with_attempts_left_is_requeued(self):
+        job = self.stale_job(attempts=1)
+
+        self.assertEqual(job_runner.requeue_stale_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportExportJob.STATUS_PENDING)
+
+    def test_stale_job_out_of_attempts_fails(self):
+        job = self.stale_job(attempts=3)
+
+        self.assertEqual(job_runner.requeue_stale_jobs(), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportExportJob.STATUS_FAILED)
+        self.assertTrue(job.error_message)
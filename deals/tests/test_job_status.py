@@ -0,0 +1,41 @@
+from django.core.cache import cache
+from django.test import TestCase
+from integration_utils.bitrix24.models import BitrixUser
+
+from deals.models import ImportExportJob
+from deals.services.job_status import forget_job_status, load_job_status
+
+
+class JobStatusCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.owner = BitrixUser.objects.create()
+        self.job = ImportExportJob.objects.create(
+            job_type=ImportExportJob.JOB_TYPE_IMPORT,
+            file_format=ImportExportJob.FORMAT_CSV,
+            created_by=self.owner,
+            file_name='contacts.csv'
+        )
+
+    def test_repeated_polls_hit_the_cache(self):
+        with self.assertNumQueries(1):
+            first = load_job_status(self.job.id, self.owner.id)
+        with self.assertNumQueries(0):
+            second = load_job_status(self.job.id, self.owner.id)
+
+        self.assertEqual(first, second)
+        self.assertEqual(first['status'], ImportExportJob.STATUS_PENDING)
+        self.assertNotIn('created_by_id', first)
+
+    def test_other_user_gets_nothing(self):
+        load_job_status(self.job.id, self.owner.id)
+
+        self.assertIsNone(load_job_status(self.job.id, BitrixUser.objects.create().id))
+
+    def test_forget_reloads_the_row(self):
+        load_job_status(self.job.id, self.owner.id)
+        ImportExportJob.objects.filter(id=self.job.id).update(status=ImportExportJob.STATUS_PROCESSING)
+        forget_job_status(self.job.id)
+
+        self.assertEqual(load_job_status(self.job.id, self.owner.id)['status'], ImportExportJob.STATUS_PROCESSING)
@@ -0,0 +1,103 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from deals.models import CompanyLogo
+from deals.services.logo_store import LogoStore, image_extension
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 32
+SVG = b'<?xml version="1.0"?><svg xmlns="http://www.w3.org/2000/svg"><script>alert(1)</script></svg>'
+HTML = b'<html><body><svg onload="alert(1)"></svg></body></html>'
+PORTAL = 'first.bitrix24.ru'
+
+
+class ImageExtensionTests(SimpleTestCase):
+
+    def test_raster_formats(self):
+        self.assertEqual(image_extension(PNG), 'png')
+        self.assertEqual(image_extension(b'\xff\xd8\xff\xe0' + b'\x00' * 16), 'jpg')
+        self.assertEqual(image_extension(b'RIFF\x00\x00\x00\x00WEBPVP8 '), 'webp')
+
+    def test_svg_and_html_rejected(self):
+        self.assertIsNone(image_extension(SVG))
+        self.assertIsNone(image_extension(HTML))
+
+
+class LogoStoreSyncTests(SimpleTestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.store = LogoStore(concurrency=1)
+
+    def tearDown(self):
+        self.settings_override.disable()
+
+    def stored_files(self):
+        return [name for _, _, names in os.walk(self.media_root) for name in names]
+
+    def test_svg_and_html_payloads_are_not_stored(self):
+        for payload in (SVG, HTML):
+            with self.subTest(payload=payload[:20]), \
+                    mock.patch.object(self.store, '_download', return_value=payload), \
+                    mock.patch('deals.services.logo_store.CompanyLogo.objects.update_or_create') as update_or_create:
+                self.assertIsNone(self.store.sync(PORTAL, 1, '10', '/logo'))
+
+                defaults = update_or_create.call_args.kwargs['defaults']
+                self.assertNotIn('file_name', defaults)
+                self.assertEqual((defaults['failed_file_id'], defaults['failed_url']), ('10', '/logo'))
+
+        self.assertEqual(self.stored_files(), [])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class LogoStoreFailureTests(TestCase):
+
+    def setUp(self):
+        self.store = LogoStore(concurrency=1)
+
+    def company(self, file_id='10', download_url='/logo?token=1'):
+        return {'ID': '1', 'LOGO': {'id': file_id, 'downloadUrl': download_url}}
+
+    def test_failed_download_is_not_retried_for_same_file_and_url(self):
+        with mock.patch.object(self.store, '_download', side_effect=OSError('403 Forbidden')):
+            self.assertIsNone(self.store.sync(PORTAL, 1, '10', '/logo?token=1'))
+
+        logo = CompanyLogo.objects.get(portal=PORTAL, company_id=1)
+        self.assertEqual((logo.failed_file_id, logo.failed_url, logo.file_name), ('10', '/logo?token=1', ''))
+
+        with mock.patch.object(self.store, 'submit') as submit:
+            self.assertEqual(self.store.logo_urls(PORTAL, [self.company()]), {})
+            submit.assert_not_called()
+
+            self.store.logo_urls(PORTAL, [self.company(download_url='/logo?token=2')])
+            submit.assert_called_once_with(PORTAL, 1, '10', '/logo?token=2')
+
+            submit.reset_mock()
+            self.store.logo_urls(PORTAL, [self.company(file_id='11')])
+            submit.assert_called_once_with(PORTAL, 1, '11', '/logo?token=1')
+
+    def test_logos_are_kept_per_portal(self):
+        with mock.patch.object(self.store, '_download', return_value=PNG) as download:
+            self.store.sync(PORTAL, 1, '10', '/logo?token=1')
+            self.store.sync('second.bitrix24.ru', 1, '20', '/logo?token=2')
+
+        self.assertEqual(
+            sorted(CompanyLogo.objects.values_list('portal', 'file_id')),
+            [(PORTAL, '10'), ('second.bitrix24.ru', '20')]
+        )
+        download.assert_any_call('second.bitrix24.ru', '/logo?token=2')
+
+        with mock.patch.object(self.store, 'submit') as submit:
+            self.assertIn('1', self.store.logo_urls(PORTAL, [self.company()]))
+            submit.assert_not_called()
+
+    def test_relative_url_is_loaded_from_portal_domain(self):
+        session = mock.Mock()
+        with mock.patch.object(self.store, '_session', return_value=session):
+            self.store._download(PORTAL, '/logo?token=1')
+
+        self.assertEqual(session.get.call_args[0][0], f'https://{PORTAL}/logo?token=1')
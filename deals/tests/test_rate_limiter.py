@@ -0,0 +1,124 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from deals.services import rate_limiter
+from deals.services.rate_limiter import RateLimitedToken, get_limiter_metrics
+
+
+class PagedToken:
+    """Токен со списком из 120 элементов, который отдается страницами по 50"""
+
+    def __init__(self, total=120, page_size=50):
+        self.items = [{'ID': str(i)} for i in range(total)]
+        self.page_size = page_size
+        self.calls = []
+        self.batches = []
+
+    def call_api_method(self, method, params):
+        self.calls.append((method, params))
+        start = params['start']
+        response = {'result': self.items[start:start + self.page_size], 'total': len(self.items)}
+        if start + self.page_size < len(self.items):
+            response['next'] = start + self.page_size
+        return response
+
+    def call_batch(self, commands):
+        self.batches.append(commands)
+        return {
+            'result': {
+                key: self.items[params['start']:params['start'] + self.page_size]
+                for key, (method, params) in commands.items()
+            },
+            'result_error': {},
+        }
+
+
+@override_settings(BITRIX_BATCH_CONCURRENCY=1)
+class CallListMethodTests(SimpleTestCase):
+
+    def test_pages_after_first_go_through_batch(self):
+        token = PagedToken()
+        limiter = mock.Mock()
+
+        items = RateLimitedToken(token, limiter=limiter).call_list_method('crm.company.list', {'select': ['ID']})
+
+        self.assertEqual([item['ID'] for item in items], [str(i) for i in range(120)])
+        self.assertEqual([params['start'] for _, params in token.calls], [0])
+        self.assertEqual(len(token.batches), 1)
+        self.assertEqual(
+            [params for _, params in token.batches[0].values()],
+            [{'select': ['ID'], 'start': 50}, {'select': ['ID'], 'start': 100}]
+        )
+        # Первая страница и один batch
+        self.assertEqual(limiter.acquire.call_count, 2)
+
+    @override_settings(BITRIX_LIST_PAGES_PER_BATCH=2)
+    def test_batch_size_is_configurable(self):
+        token = PagedToken(total=300)
+        limiter = mock.Mock()
+
+        items = RateLimitedToken(token, limiter=limiter).call_list_method('crm.company.list')
+
+        self.assertEqual(len(items), 300)
+        self.assertEqual([len(batch) for batch in token.batches], [2, 2, 1])
+        self.assertEqual(limiter.acquire.call_count, 4)
+
+    def test_single_page_makes_one_request(self):
+        token = PagedToken(total=30)
+        limiter = mock.Mock()
+
+        items = RateLimitedToken(token, limiter=limiter).call_list_method('crm.company.list')
+
+        self.assertEqual(len(items), 30)
+        self.assertEqual(token.batches, [])
+        self.assertEqual(limiter.acquire.call_count, 1)
+
+    def test_limit_error_retries_the_batch(self):
+        token = PagedToken()
+        original = token.call_batch
+        responses = [{'error': 'QUERY_LIMIT_EXCEEDED'}]
+
+        def flaky(commands):
+            if responses:
+                return responses.pop()
+            return original(commands)
+
+        token.call_batch = flaky
+        limiter = mock.Mock()
+
+        items = RateLimitedToken(token, limiter=limiter).call_list_method('crm.company.list')
+
+        self.assertEqual(len(items), 120)
+        self.assertEqual(limiter.on_limit_exceeded.call_count, 1)
+        self.assertEqual(len(token.batches), 1)
+
+    def test_error_response_raises(self):
+        token = mock.Mock()
+        token.call_api_method.return_value = {'error': 'ACCESS_DENIED'}
+
+        with self.assertRaises(ValueError):
+            RateLimitedToken(token, limiter=mock.Mock()).call_list_method('crm.company.list')
+
+    def test_failed_page_raises(self):
+        token = PagedToken()
+        token.call_batch = mock.Mock(return_value={
+            'result': {'cmd_0': token.items[50:100]},
+            'result_error': {'cmd_1': {'error': 'ACCESS_DENIED', 'error_description': 'Нет доступа'}},
+        })
+
+        with self.assertRaisesMessage(ValueError, 'со смещения 100'):
+            RateLimitedToken(token, limiter=mock.Mock()).call_list_method('crm.company.list')
+
+
+class LimiterMetricsTests(SimpleTestCase):
+
+    def test_metrics_can_be_filtered_by_portal(self):
+        limiters = {
+            'a.bitrix24.ru': rate_limiter.BitrixRateLimiter('a.bitrix24.ru'),
+            'b.bitrix24.ru': rate_limiter.BitrixRateLimiter('b.bitrix24.ru'),
+        }
+
+        with mock.patch.dict(rate_limiter._limiters, limiters, clear=True):
+            self.assertEqual([m['portal'] for m in get_limiter_metrics('b.bitrix24.ru')], ['b.bitrix24.ru'])
+            self.assertEqual(len(get_limiter_metrics()), 2)
@@ -0,0 +1,84 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from integration_utils.bitrix24.models import BitrixUser
+
+from deals.models import ImportExportJob, ImportExportRecord
+from deals.services.retention import RetentionCleaner
+
+
+class ArchiveRecordsTests(TestCase):
+
+    def setUp(self):
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir, ignore_errors=True)
+        settings_patcher = override_settings(IMPORT_EXPORT_ARCHIVE_DIR=self.archive_dir,
+                                             IMPORT_EXPORT_RETENTION_DAYS={'import_records': 1})
+        settings_patcher.enable()
+        self.addCleanup(settings_patcher.disable)
+
+        self.job = ImportExportJob.objects.create(
+            job_type=ImportExportJob.JOB_TYPE_IMPORT,
+            file_format=ImportExportJob.FORMAT_CSV,
+            status=ImportExportJob.STATUS_COMPLETED,
+            created_by=BitrixUser.objects.create(),
+            file_name='contacts.csv'
+        )
+        ImportExportJob.objects.filter(id=self.job.id).update(created_at=timezone.now() - timedelta(days=2))
+        ImportExportRecord.objects.bulk_create([
+            ImportExportRecord(job=self.job, record_index=index, contact_data={'NAME': f'Контакт {index}'},
+                               status='success')
+            for index in range(5)
+        ])
+
+    def archived_rows(self):
+        path = os.path.join(self.archive_dir, f'records_{self.job.id}.jsonl.gz')
+        with gzip.open(path, 'rt', encoding='utf-8') as file:
+            return [json.loads(line)['record_index'] for line in file]
+
+    def test_rows_are_archived_then_deleted(self):
+        report = RetentionCleaner(archive=True).run()
+
+        self.assertEqual((report['records_archived'], report['records_deleted']), (5, 5))
+        self.assertEqual(self.archived_rows(), [0, 1, 2, 3, 4])
+        self.assertFalse(os.path.exists(os.path.join(self.archive_dir, f'records_{self.job.id}.jsonl.gz.tmp')))
+
+    def test_rerun_after_interrupted_delete_keeps_all_rows(self):
+        def delete_some(cleaner, records):
+            ImportExportRecord.objects.filter(job=self.job, record_index__lt=3).delete()
+            raise KeyboardInterrupt
+
+        with mock.patch.object(RetentionCleaner, '_delete_in_batches', delete_some):
+            with self.assertRaises(KeyboardInterrupt):
+                RetentionCleaner(archive=True, batch_size=3).run()
+
+        report = RetentionCleaner(archive=True).run()
+
+        self.assertEqual((report['records_archived'], report['records_deleted']), (0, 2))
+        self.assertEqual(self.archived_rows(), [0, 1, 2, 3, 4])
+
+    def test_interrupted_archive_leaves_rows_in_place(self):
+        with mock.patch('deals.services.retention.os.replace', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                RetentionCleaner(archive=True).run()
+
+        self.assertEqual(ImportExportRecord.objects.filter(job=self.job).count(), 5)
+
+        RetentionCleaner(archive=True).run()
+        self.assertEqual(self.archived_rows(), [0, 1, 2, 3, 4])
+
+    def test_new_rows_are_appended_to_existing_archive(self):
+        RetentionCleaner(archive=True).run()
+        ImportExportRecord.objects.create(job=self.job, record_index=5, contact_data={}, status='failed')
+
+        report = RetentionCleaner(archive=True).run()
+
+        self.assertEqual(report['records_archived'], 1)
+        self.assertEqual(self.archived_rows(), [0, 1, 2, 3, 4, 5])
@@ -0,0 +1,90 @@
+import shutil
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+from integration_utils.bitrix24.models import BitrixUser
+
+from deals import views
+from deals.models import ImportExportJob
+
+
+def authenticated(user, domain='portal.bitrix24.ru'):
+    """Запрос от пользователя user без обращения к куки и токенам в БД"""
+    token = SimpleNamespace(user=user, domain=domain)
+    return mock.patch(
+        'integration_utils.bitrix24.bitrix_user_auth.main_auth.get_bitrix_user_token_from_cookie',
+        return_value=token
+    )
+
+
+def create_job(user, **fields):
+    return ImportExportJob.objects.create(**{
+        'job_type': ImportExportJob.JOB_TYPE_EXPORT,
+        'file_format': ImportExportJob.FORMAT_CSV,
+        'created_by': user,
+        'file_name': 'contacts.csv',
+        **fields,
+    })
+
+
+class ExportStorageMixin:
+    """Файлы экспорта во временном каталоге вместо media/export_files"""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+
+        storage = ImportExportJob._meta.get_field('export_file').storage
+        patcher = mock.patch.object(storage, 'location', directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_export(self, user, name, content):
+        job = create_job(user, status=ImportExportJob.STATUS_COMPLETED, completed_at=timezone.now())
+        job.export_file.save(name, ContentFile(content))
+        return job
+
+
+class ViewQueryCountTests(ExportStorageMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.factory = RequestFactory()
+        self.user = BitrixUser.objects.create()
+
+    def test_contacts_history_is_one_query(self):
+        for _ in range(5):
+            create_job(self.user)
+
+        with authenticated(self.user), self.assertNumQueries(1):
+            response = views.contacts_history(self.factory.get('/contacts/history/'))
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_job_status_polls_are_cached(self):
+        job = create_job(self.user)
+        request = self.factory.get(f'/job-status/{job.id}/')
+
+        with authenticated(self.user):
+            with self.assertNumQueries(1):
+                views.get_job_status(request, job.id)
+            with self.assertNumQueries(0):
+                response = views.get_job_status(request, job.id)
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_download_export_is_one_query(self):
+        job = self.create_export(self.user, 'contacts.csv', b'ID;NAME\n1;Anna\n')
+
+        with authenticated(self.user), self.assertNumQueries(1):
+            response = views.download_export(self.factory.get(f'/download/{job.id}/'), job.id)
+
+        self.assertEqual(response.status_code, 200)
+        response.close()
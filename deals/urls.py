@@ -15,12 +15,17 @@ urlpatterns = [
     path('employees/', views.employees_table, name='employees_table'),
     path('api/generate-test-calls/', views.generate_test_calls, name='generate_test_calls'),
     path('company-map/', views.company_map, name='company_map'),
+    path('company-map/points/', views.company_map_points, name='company_map_points'),
+    path('company-map/geocode/', views.company_map_geocode, name='company_map_geocode'),
     path('contacts/', views.contacts_import_export, name='contacts_import_export'),
     path('contacts/import/', views.import_contacts, name='import_contacts'),
     path('contacts/export/', views.export_contacts, name='export_contacts'),
     path('contacts/download/<uuid:job_id>/', views.download_export, name='download_export'),
     path('contacts/status/<uuid:job_id>/', views.get_job_status, name='get_job_status'),
+    path('contacts/resume/<uuid:job_id>/', views.resume_import, name='resume_import'),
+    path('contacts/failed/<uuid:job_id>/', views.download_failed_records, name='download_failed_records'),
     path('contacts/history/', views.contacts_history, name='contacts_history'),
+    path('api/bitrix-rate-metrics/', views.bitrix_rate_metrics, name='bitrix_rate_metrics'),
 ]
 
 if settings.DEBUG:
@@ -1,8 +1,6 @@
-from linecache import cache
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse, JsonResponse, HttpResponseBadRequest
+from django.http import HttpResponse, JsonResponse, HttpResponseBadRequest, FileResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.core.files.base import ContentFile
 from django.conf import settings
 from django.utils import  timezone
 from integration_utils.bitrix24.bitrix_user_auth.main_auth import main_auth
@@ -10,24 +8,27 @@ from integration_utils.bitrix24.bitrix_user_auth.authenticate_on_start_applicati
     authenticate_on_start_application
 from integration_utils.bitrix24.bitrix_user_auth.get_bitrix_user_token_from_cookie import \
     get_bitrix_user_token_from_cookie, EmptyCookie
-from .models import CustomDeal, ProductQRLink, ImportExportJob, ImportExportRecord
+from .models import CustomDeal, ProductQRLink, ImportExportJob
 import qrcode
 import io
 import base64
 import json
 from urllib.parse import urljoin
-import requests
 import random
 import logging
 from datetime import datetime, timedelta
 from . import telephony_utils
 from .telephony_utils import generate_external_call
 import os
-from django.core.cache import cache
+import tempfile
 import csv
-from .file_handlers.base_handler import FileHandlerFactory
-from .services.contact_service import ContactService
-import time
+from .services.company_map import CompanyMapSnapshot, schedule_refresh
+from .services.contact_dedup import DEDUP_MODES
+from .services.file_download import CONTENT_TYPES, serve_export_file
+from .services.import_export_service import HISTORY_FIELDS, write_failed_records
+from .services.job_status import load_job_status
+from .services.job_runner import enqueue_job, resume_job
+from .services.rate_limiter import get_limiter_metrics, get_portal_name
 from django.db import transaction
 
 logger = logging.getLogger(__name__)
@@ -659,163 +660,28 @@ def generate_test_calls(request):
         return JsonResponse({'success': False, 'error': str(e)})
 
 
-def get_geocode(address_data):
-    """Получение координат по адресу"""
-    try:
-        address_parts = [
-            address_data.get('ADDRESS_1'),
-            address_data.get('CITY'),
-            address_data.get('REGION'),
-            address_data.get('PROVINCE'),
-            address_data.get('COUNTRY')
-        ]
-        address = ' '.join(filter(None, address_parts))
-
-        if not address:
-            return None
-
-        cache_key = f'geocode_{hash(address)}'
-        cached_coords = cache.get(cache_key)
-        if cached_coords:
-            return cached_coords
-
-        api_key = os.environ.get('YANDEX_API_KEY', '398bf0ac-876c-44ac-a830-0b7e29f5f4f9')
-
-        response = requests.get(
-            f'https://geocode-maps.yandex.ru/1.x/',
-            params={
-                'apikey': api_key,
-                'geocode': address,
-                'format': 'json'
-            },
-            timeout=10
-        )
-
-        response.raise_for_status()
-        data = response.json()
-
-        feature_member = data['response']['GeoObjectCollection']['featureMember']
-        if not feature_member:
-            return None
-
-        pos = feature_member[0]['GeoObject']['Point']['pos']
-        longitude, latitude = map(float, pos.split(' '))
-        coords = [latitude, longitude]
-
-        cache.set(cache_key, coords, timeout=60 * 60 * 24 * 30)
-
-        return coords
-
-    except Exception as e:
-        logger.warning(f"Ошибка геокодирования адреса: {e}")
-        return None
-
-
-def get_logo(company):
-    """Получение логотипа компании"""
-    try:
-        logo_data = company.get('LOGO')
-        if not logo_data:
-            return None
-
-        cache_key = f'logo_{company["ID"]}'
-        cached_logo_url = cache.get(cache_key)
-        if cached_logo_url:
-            return cached_logo_url
-
-        bitrix_domain = os.environ.get('BITRIX_DOMAIN', 'b24-oyi9l4.bitrix24.ru')
-        root_url = os.environ.get('ROOT_URL', 'http://localhost:8000')
-
-        download_url = logo_data.get('downloadUrl')
-        if not download_url:
-            return None
-
-        if download_url.startswith(('http://', 'https://')):
-            full_url = download_url
-        else:
-            full_url = f'https://{bitrix_domain}{download_url}'
-
-        logo_dir = os.path.join(settings.MEDIA_ROOT, 'company_logos')
-        os.makedirs(logo_dir, exist_ok=True)
-
-        file_name = f"logo_{company['ID']}.png"
-        file_path = os.path.join(logo_dir, file_name)
-
-        if os.path.exists(file_path):
-            relative_path = os.path.relpath(file_path, settings.MEDIA_ROOT)
-            logo_url = f"{root_url}{settings.MEDIA_URL}{relative_path}".replace('\\', '/')
-            cache.set(cache_key, logo_url, timeout=60 * 60 * 24 * 30)
-            return logo_url
-
-        response = requests.get(full_url, timeout=10)
-        response.raise_for_status()
-
-        with open(file_path, 'wb') as f:
-            f.write(response.content)
-
-        relative_path = os.path.relpath(file_path, settings.MEDIA_ROOT)
-        logo_url = f"{root_url}{settings.MEDIA_URL}{relative_path}".replace('\\', '/')
-        cache.set(cache_key, logo_url, timeout=60 * 60 * 24 * 30)
-        return logo_url
-
-    except Exception as e:
-        logger.warning(f"Ошибка загрузки логотипа компании {company.get('ID')}: {e}")
-        return None
-
-
 @main_auth(on_cookies=True)
 def company_map(request):
     """Карта с адресами компаний"""
     try:
-        but = request.bitrix_user_token
-
-        companies = but.call_list_method('crm.company.list', {
-            'select': ['ID', 'TITLE', 'LOGO', 'ADDRESS', 'COMMENTS'],
-            'order': {'DATE_CREATE': 'DESC'}
-        })
-
-        companies_dict = {company['ID']: company for company in companies}
+        # Снимок обновляется в фоне или командой refresh_company_map; страница только читает его
+        snapshot = CompanyMapSnapshot(request.bitrix_user_token)
+        if getattr(settings, 'COMPANY_MAP_BACKGROUND_REFRESH', True):
+            schedule_refresh(request.bitrix_user_token)
 
-        addresses = but.call_list_method('crm.address.list', {
-            'filter': {'ENTITY_TYPE_ID': 4},
-            'select': ['ENTITY_ID', 'ADDRESS_1', 'CITY', 'REGION', 'PROVINCE', 'COUNTRY']
-        })
-
-        addresses_dict = {}
-        for address in addresses:
-            company_id = address['ENTITY_ID']
-            addresses_dict[company_id] = address
-
-        points = []
-        geocoded_count = 0
-
-        for company in companies:
-            company_id = company['ID']
-            address = addresses_dict.get(company_id)
-
-            if address:
-                geocode = get_geocode(address)
-
-                if geocode:
-                    geocoded_count += 1
-
-                    full_address = format_address(address)
-
-                    logo_url = get_logo(company)
+        summary = snapshot.summary()
 
-                    point = {
-                        'TITLE': company['TITLE'],
-                        'DESCRIPTION': company.get('COMMENTS', ''),
-                        'ADDRESS': full_address,
-                        'GEOCODE': geocode,
-                        'LogoURL': logo_url
-                    }
-                    points.append(point)
-
-        logger.info(f"Загружено {len(points)} компаний с координатами из {len(companies)} всего")
+        logger.info(
+            f"Карта компаний: {summary['geocoded']} с координатами из {summary['companies']} с адресом, "
+            f"{summary['pending']} адресов еще геокодируются"
+        )
 
         return render(request, 'deals/company_map.html', {
-            'points': points,
+            'companies_count': summary['companies'],
+            'geocoded_count': summary['geocoded'],
+            'pending_count': summary['pending'],
+            'refreshing': summary['refreshing'],
+            'map_bounds': json.dumps(summary['bounds']),
             'error': None,
             'user_name': f"{request.bitrix_user.first_name} {request.bitrix_user.last_name}".strip() or request.bitrix_user.email,
             'yandex_api_key': settings.YANDEX_MAPS_API_KEY
@@ -825,25 +691,46 @@ def company_map(request):
         error_message = f"Ошибка при загрузке карты компаний: {str(e)}"
         logger.error(error_message)
         return render(request, 'deals/company_map.html', {
-            'points': [],
+            'companies_count': 0,
+            'geocoded_count': 0,
+            'pending_count': 0,
+            'refreshing': False,
+            'map_bounds': 'null',
             'error': error_message,
             'user_name': f"{request.bitrix_user.first_name} {request.bitrix_user.last_name}".strip() or request.bitrix_user.email,
             'yandex_api_key': settings.YANDEX_MAPS_API_KEY
         })
 
 
-def format_address(address_data):
-    """Форматирует адрес в читаемый вид"""
-    address_parts = [
-        address_data.get('ADDRESS_1'),
-        address_data.get('CITY'),
-        address_data.get('REGION'),
-        address_data.get('PROVINCE'),
-        address_data.get('COUNTRY')
-    ]
+@main_auth(on_cookies=True)
+def company_map_points(request):
+    """Кластеры и точки карты компаний в видимой области: bbox=юг,запад,север,восток и zoom"""
+    try:
+        south, west, north, east = map(float, request.GET['bbox'].split(','))
+        zoom = min(max(int(request.GET['zoom']), 0), 23)
+    except (KeyError, ValueError):
+        return JsonResponse({'success': False, 'error': 'Укажите bbox=юг,запад,север,восток и zoom'}, status=400)
+
+    # pending и refreshing говорят клиенту, что точки еще появятся и область стоит перезагрузить
+    snapshot = CompanyMapSnapshot(request.bitrix_user_token)
+    return JsonResponse({
+        'success': True,
+        **snapshot.viewport(south, west, north, east, zoom),
+        'pending': snapshot.pending_count(),
+        'refreshing': snapshot.is_refreshing(),
+    })
+
+
+@main_auth(on_cookies=True)
+@csrf_exempt
+def company_map_geocode(request):
+    """Геокодирование ожидающих адресов компаний портала; адреса берутся из снимка, а не из запроса"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Неверный метод запроса'}, status=405)
 
-    formatted_address = ', '.join(filter(None, address_parts))
-    return formatted_address
+    snapshot = CompanyMapSnapshot(request.bitrix_user_token)
+    geocoded, _ = snapshot.geocode_pending()
+    return JsonResponse({'success': True, 'filled': geocoded, **snapshot.summary()})
 
 
 @main_auth(on_cookies=True)
@@ -866,29 +753,49 @@ def import_contacts(request):
             if not file:
                 return JsonResponse({'success': False, 'error': 'Файл не загружен'})
 
-            job = ImportExportJob.objects.create(
+            import_params = {}
+            for param in ('column_mapping', 'aliases'):
+                if request.POST.get(param):
+                    try:
+                        import_params[param] = json.loads(request.POST[param])
+                    except ValueError:
+                        return JsonResponse({'success': False, 'error': f'Некорректный параметр {param}'})
+
+            if request.POST.get('dry_run'):
+                import_params['dry_run'] = True
+
+            dedup_mode = request.POST.get('dedup_mode')
+            if dedup_mode:
+                if dedup_mode not in DEDUP_MODES:
+                    return JsonResponse({'success': False, 'error': 'Некорректный режим обработки дубликатов'})
+                import_params['dedup_mode'] = dedup_mode
+
+            job = ImportExportJob(
                 job_type=ImportExportJob.JOB_TYPE_IMPORT,
                 file_format=file_format,
                 created_by=request.bitrix_user,
                 file_name=file.name,
+                filter_params=import_params or None,
                 status=ImportExportJob.STATUS_PENDING
             )
+            job.source_file.save(f"import_{job.id}.{file_format}", file)
 
+            job = enqueue_job(job, request.bitrix_user_token)
 
-            success = process_import_file(job.id, file, file_format, request.bitrix_user_token)
-
-            if success:
-                return JsonResponse({
-                    'success': True,
-                    'job_id': str(job.id),
-                    'message': 'Импорт завершен успешно!'
-                })
-            else:
+            if job.status == ImportExportJob.STATUS_FAILED:
                 return JsonResponse({
                     'success': False,
-                    'error': 'Ошибка при импорте контактов'
+                    'job_id': str(job.id),
+                    'error': job.error_message or 'Ошибка при импорте контактов'
                 })
 
+            return JsonResponse({
+                'success': True,
+                'job_id': str(job.id),
+                'status': job.status,
+                'message': 'Проверка файла поставлена в очередь' if import_params.get('dry_run') else 'Импорт поставлен в очередь'
+            })
+
         except Exception as e:
             logger.error(f"Ошибка импорта контактов: {e}")
             return JsonResponse({'success': False, 'error': str(e)})
@@ -904,6 +811,12 @@ def export_contacts(request):
         try:
             file_format = request.POST.get('format', 'csv')
             date_filter = request.POST.get('date_filter', 'all')
+            compression = request.POST.get('compression', ImportExportJob.COMPRESSION_NONE)
+
+            if compression not in dict(ImportExportJob.COMPRESSION_CHOICES):
+                return JsonResponse({'success': False, 'error': 'Неизвестный вид сжатия'})
+            if compression == ImportExportJob.COMPRESSION_GZIP and file_format != ImportExportJob.FORMAT_CSV:
+                return JsonResponse({'success': False, 'error': 'Сжатие GZIP доступно только для CSV'})
 
             filters = {}
             if date_filter == 'today':
@@ -919,26 +832,29 @@ def export_contacts(request):
             job = ImportExportJob.objects.create(
                 job_type=ImportExportJob.JOB_TYPE_EXPORT,
                 file_format=file_format,
+                compression=compression,
                 created_by=request.bitrix_user,
-                file_name=f"contacts_export.{file_format}",
+                file_name=f"contacts_export.{'zip' if compression == ImportExportJob.COMPRESSION_ZIP else file_format}",
                 filter_params=filters,
                 status=ImportExportJob.STATUS_PENDING
             )
 
-            success = process_export(job.id, filters, file_format, request.bitrix_user_token)
+            job = enqueue_job(job, request.bitrix_user_token)
 
-            if success:
-                return JsonResponse({
-                    'success': True,
-                    'job_id': str(job.id),
-                    'message': 'Экспорт завершен успешно!'
-                })
-            else:
+            if job.status == ImportExportJob.STATUS_FAILED:
                 return JsonResponse({
                     'success': False,
-                    'error': 'Ошибка при экспорте контактов'
+                    'job_id': str(job.id),
+                    'error': job.error_message or 'Ошибка при экспорте контактов'
                 })
 
+            return JsonResponse({
+                'success': True,
+                'job_id': str(job.id),
+                'status': job.status,
+                'message': 'Экспорт поставлен в очередь'
+            })
+
         except Exception as e:
             logger.error(f"Ошибка экспорта контактов: {e}")
             return JsonResponse({'success': False, 'error': str(e)})
@@ -946,182 +862,21 @@ def export_contacts(request):
     return JsonResponse({'success': False, 'error': 'Неверный метод запроса'})
 
 
-def process_import_file(job_id, file, file_format, bitrix_token):
-    """Обработка импорта контактов с использованием batch"""
-    try:
-        job = ImportExportJob.objects.get(id=job_id)
-        job.status = ImportExportJob.STATUS_PROCESSING
-        job.save()
-
-        contact_service = ContactService(bitrix_token)
-
-        handler = FileHandlerFactory.get_handler(file_format)
-        records = handler.read_records(file)
-
-        if not records:
-            job.status = ImportExportJob.STATUS_FAILED
-            job.error_message = "Файл не содержит валидных данных"
-            job.save()
-            return False
-
-        job.total_records = len(records)
-        job.save()
-
-        batch_size = 50
-        success_count = 0
-        fail_count = 0
-
-        for i in range(0, len(records), batch_size):
-            batch = records[i:i + batch_size]
-            results = contact_service.batch_create_contacts(batch)
-
-            for j, result in enumerate(results):
-                record_index = i + j
-                contact_data = batch[j] if j < len(batch) else {}
-
-                ImportExportRecord.objects.create(
-                    job=job,
-                    record_index=record_index,
-                    contact_data=contact_data,
-                    status='success' if result.get('success') else 'failed',
-                    error_message=str(result.get('error', ''))[:500],
-                    bitrix_contact_id=result.get('contact_id')
-                )
-
-                if result.get('success'):
-                    success_count += 1
-                else:
-                    fail_count += 1
-
-            job.processed_records = min(i + batch_size, len(records))
-            job.failed_records = fail_count
-            job.save()
-
-            time.sleep(0.5)
-
-        job.status = ImportExportJob.STATUS_COMPLETED
-        job.completed_at = timezone.now()
-        job.save()
-
-        logger.info(f"Импорт завершен: {success_count} успешно, {fail_count} с ошибками")
-        return True
-
-    except Exception as e:
-        logger.error(f"Ошибка обработки импорта: {e}")
-        if 'job' in locals():
-            job.status = ImportExportJob.STATUS_FAILED
-            job.error_message = str(e)
-            job.save()
-        return False
-
-
-def process_export(job_id, filters, file_format, bitrix_token):
-    """Обработка экспорта контактов с использованием batch"""
-    try:
-        job = ImportExportJob.objects.get(id=job_id)
-        job.status = ImportExportJob.STATUS_PROCESSING
-        job.save()
-
-        contact_service = ContactService(bitrix_token)
-
-        contacts = contact_service.get_contacts(filters)
-
-        if not contacts:
-            job.status = ImportExportJob.STATUS_COMPLETED
-            job.total_records = 0
-            job.processed_records = 0
-            job.completed_at = timezone.now()
-            job.save()
-            return True
-
-        job.total_records = len(contacts)
-        job.save()
-
-        contact_ids = [contact['ID'] for contact in contacts]
-        company_names = contact_service.get_contact_companies(contact_ids)
-
-        export_data = []
-        for i, contact in enumerate(contacts):
-            phone = ''
-            if contact.get('PHONE'):
-                phones = contact['PHONE']
-                if isinstance(phones, list) and phones:
-                    phone = phones[0].get('VALUE', '')
-                elif isinstance(phones, dict):
-                    phone = phones.get('VALUE', '')
-
-
-            email = ''
-            if contact.get('EMAIL'):
-                emails = contact['EMAIL']
-                if isinstance(emails, list) and emails:
-                    email = emails[0].get('VALUE', '')
-                elif isinstance(emails, dict):
-                    email = emails.get('VALUE', '')
-
-            company_name = company_names.get(contact['ID'], '')
-
-            record_data = {
-                'first_name': contact.get('NAME', ''),
-                'last_name': contact.get('LAST_NAME', ''),
-                'phone': phone,
-                'email': email,
-                'company_name': company_name
-            }
-
-            ImportExportRecord.objects.create(
-                job=job,
-                record_index=i,
-                contact_data=record_data,
-                status='exported',
-                bitrix_contact_id=contact['ID']
-            )
-
-            export_data.append(record_data)
-            job.processed_records = i + 1
-
-            if (i + 1) % 50 == 0:
-                job.save()
-
-        job.save()
-
-        handler = FileHandlerFactory.get_handler(file_format)
-        response = handler.write_records(export_data)
-
-        file_name = f"export_{job_id}.{file_format}"
-        job.export_file.save(file_name, ContentFile(response.content))
-
-        job.status = ImportExportJob.STATUS_COMPLETED
-        job.completed_at = timezone.now()
-        job.save()
-
-        return True
-
-    except Exception as e:
-        logger.error(f"Ошибка обработки экспорта: {e}")
-        job.status = ImportExportJob.STATUS_FAILED
-        job.error_message = str(e)
-        job.save()
-        return False
-
-
 @main_auth(on_cookies=True)
 def download_export(request, job_id):
     """Скачивание экспортированного файла"""
     try:
-        job = ImportExportJob.objects.get(
+        job = ImportExportJob.objects.only('id', 'file_name', 'completed_at', 'export_file').get(
             id=job_id,
             created_by=request.bitrix_user,
             status=ImportExportJob.STATUS_COMPLETED,
             job_type=ImportExportJob.JOB_TYPE_EXPORT
         )
 
-        if not job.export_file:
+        if not job.export_file or not job.export_file.storage.exists(job.export_file.name):
             return HttpResponse("Файл не найден", status=404)
 
-        response = HttpResponse(job.export_file.read(), content_type='application/octet-stream')
-        response['Content-Disposition'] = f'attachment; filename="{job.file_name}"'
-        return response
+        return serve_export_file(request, job)
 
     except ImportExportJob.DoesNotExist:
         return HttpResponse("Файл не найден или еще не готов", status=404)
@@ -1131,22 +886,71 @@ def download_export(request, job_id):
 
 
 @main_auth(on_cookies=True)
-def get_job_status(request, job_id):
-    """Получение статуса задачи"""
+def download_failed_records(request, job_id):
+    """Скачивание строк импорта с ошибками в формате исходного файла"""
+    try:
+        job = ImportExportJob.objects.only('id', 'file_format', 'file_name').get(
+            id=job_id,
+            created_by=request.bitrix_user,
+            job_type=ImportExportJob.JOB_TYPE_IMPORT
+        )
+
+        # Отчет собирается во временном файле на диске, строки читаются серверным курсором
+        report = tempfile.TemporaryFile()
+        try:
+            write_failed_records(job, report)
+        except Exception:
+            report.close()
+            raise
+        report.seek(0)
+
+        base_name = os.path.splitext(job.file_name)[0] or 'contacts'
+        return FileResponse(
+            report,
+            as_attachment=True,
+            filename=f"{base_name}_errors.{job.file_format}",
+            content_type=CONTENT_TYPES.get(job.file_format)
+        )
+
+    except ImportExportJob.DoesNotExist:
+        return HttpResponse("Задача не найдена", status=404)
+    except Exception as e:
+        logger.error(f"Ошибка формирования отчета об ошибках: {e}")
+        return HttpResponse("Ошибка при создании файла", status=500)
+
+
+@main_auth(on_cookies=True)
+@csrf_exempt
+def resume_import(request, job_id):
+    """Продолжение прерванного импорта с контрольной точки"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Неверный метод запроса'})
+
     try:
         job = ImportExportJob.objects.get(id=job_id, created_by=request.bitrix_user)
+        job = resume_job(job)
 
         return JsonResponse({
             'success': True,
+            'job_id': str(job.id),
             'status': job.status,
-            'total_records': job.total_records,
-            'processed_records': job.processed_records,
-            'failed_records': job.failed_records,
-            'error_message': job.error_message
+            'message': 'Импорт продолжен'
         })
 
     except ImportExportJob.DoesNotExist:
         return JsonResponse({'success': False, 'error': 'Задача не найдена'})
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+
+@main_auth(on_cookies=True)
+def get_job_status(request, job_id):
+    """Получение статуса задачи; строка задачи кратко кэшируется для частого опроса"""
+    job = load_job_status(job_id, request.bitrix_user.id)
+    if job is None:
+        return JsonResponse({'success': False, 'error': 'Задача не найдена'})
+
+    return JsonResponse({'success': True, **job})
 
 
 @main_auth(on_cookies=True)
@@ -1155,7 +959,7 @@ def contacts_history(request):
     try:
         jobs = ImportExportJob.objects.filter(
             created_by=request.bitrix_user
-        ).order_by('-created_at')[:20]
+        ).only(*HISTORY_FIELDS).order_by('-created_at')[:20]
 
         history_data = []
         for job in jobs:
@@ -1177,4 +981,11 @@ def contacts_history(request):
 
     except Exception as e:
         logger.error(f"Ошибка получения истории: {e}")
-        return JsonResponse([], safe=False)
\ No newline at end of file
+        return JsonResponse([], safe=False)
+
+
+@main_auth(on_cookies=True)
+def bitrix_rate_metrics(request):
+    """Текущий бюджет запросов к Bitrix24 и пропускная способность портала пользователя"""
+    portal = get_portal_name(request.bitrix_user_token)
+    return JsonResponse({'success': True, 'limiters': get_limiter_metrics(portal)})
@@ -162,4 +162,74 @@ CACHES = {
 }
 
 BACKGROUND_TASK_MAX_ATTEMPTS = 3
-BACKGROUND_TASK_RUN_ASYNC = True
\ No newline at end of file
+BACKGROUND_TASK_RUN_ASYNC = True
+BACKGROUND_TASK_CONCURRENCY = 2
+BACKGROUND_TASK_POLL_INTERVAL = 5
+# Очередь обрабатывает отдельный процесс: python manage.py run_import_export_worker.
+# True — обрабатывать задачи потоками веб-процесса (только для разработки с одним процессом)
+BACKGROUND_TASK_EMBEDDED_RUNNER = False
+
+IMPORT_EXPORT_JOURNAL_CHUNK_SIZE = 500
+BITRIX_LIST_PAGES_PER_BATCH = 50
+
+BITRIX_RATE_LIMIT = 2
+BITRIX_RATE_BURST = 50
+BITRIX_RATE_MAX_RETRIES = 5
+
+COMPANY_CACHE_TIMEOUT = 60 * 60 * 24
+BITRIX_BATCH_CONCURRENCY = 2
+BITRIX_BATCH_MAX_RETRIES = 2
+BACKGROUND_TASK_STALE_TIMEOUT = 60 * 10
+# Выполняемая задача отмечается раз в N секунд; должно быть меньше BACKGROUND_TASK_STALE_TIMEOUT
+BACKGROUND_TASK_HEARTBEAT_INTERVAL = 60
+# Пауза перед повтором неудачной задачи, удваивается с каждой попыткой, сек
+BACKGROUND_TASK_RETRY_DELAY = 30
+BACKGROUND_TASK_RETRY_MAX_DELAY = 60 * 10
+CONTACT_DEDUP_MODE = 'skip'
+
+# Отдача файлов экспорта веб-сервером: None, 'x-accel' (nginx) или 'x-sendfile'.
+# Для nginx: location /protected/export_files/ { internal; alias <BASE_DIR>/media/export_files/; }
+EXPORT_DOWNLOAD_OFFLOAD = None
+EXPORT_ACCEL_REDIRECT_PREFIX = '/protected/export_files/'
+EXPORT_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+EXPORT_SPLIT_ROWS = 500_000
+
+# Сроки хранения файлов и журналов импорта/экспорта в днях (manage.py cleanup_import_export)
+IMPORT_EXPORT_RETENTION_DAYS = {
+    'export_file': 7,
+    'import_file': 30,
+    'export_records': 7,
+    # Журнал импорта — локальный индекс дедупликации, поэтому хранится дольше
+    'import_records': 180,
+}
+IMPORT_EXPORT_RETENTION_BATCH_SIZE = 5000
+IMPORT_EXPORT_ARCHIVE_DIR = 'media/import_export_archive'
+
+# Статус задачи для опроса клиентом кэшируется на N секунд
+JOB_STATUS_CACHE_TIMEOUT = 2
+
+# Геокодирование карты компаний: параллельные запросы и ожидание перед отрисовкой страницы, сек
+GEOCODER_CONCURRENCY = 8
+GEOCODER_WAIT_TIMEOUT = 3
+# Координаты адресов хранятся в GeocodedAddress (manage.py prewarm_geocodes);
+# ненайденный адрес запрашивается повторно не раньше чем через N дней
+GEOCODE_LRU_SIZE = 10000
+GEOCODE_NEGATIVE_TTL_DAYS = 7
+# Зеркало логотипов компаний (media/company_logos): потоки загрузки и размер миниатюр, px
+LOGO_SYNC_CONCURRENCY = 4
+LOGO_THUMBNAIL_SIZE = 80
+# Снимок карты компаний (manage.py refresh_company_map): частичное обновление по DATE_MODIFY
+# не чаще раза в N секунд, полное — раз в N часов. При COMPANY_MAP_BACKGROUND_REFRESH = False
+# открытие карты не запускает обновление, снимок обновляет только команда
+COMPANY_MAP_REFRESH_INTERVAL = 60
+COMPANY_MAP_FULL_REFRESH_HOURS = 24
+COMPANY_MAP_BACKGROUND_REFRESH = True
+# Кластеризация карты компаний на сервере: масштабы с кластерами, ячейка сетки в пикселях,
+# максимум объектов в ответе /company-map/points/
+COMPANY_MAP_CLUSTER_MAX_ZOOM = 15
+COMPANY_MAP_CLUSTER_GRID = 64
+COMPANY_MAP_POINTS_LIMIT = 2000
+# Кластеры портала пересчитываются после геокодирования не чаще раза в N секунд
+COMPANY_MAP_CLUSTER_REBUILD_INTERVAL = 30
+# Адресов, геокодируемых за один запрос /company-map/geocode/
+COMPANY_MAP_GEOCODE_BATCH = 50
@@ -11,96 +11,18 @@ function initMap() {
             controls: ['zoomControl', 'fullscreenControl', 'typeSelector']
         });
 
-        var points = window.points || [];
-
-        console.log('Загружено точек:', points.length);
-        console.log('Точки:', points);
-
-        if (points.length === 0) {
-            var noDataControl = new ymaps.Control({
-                content: '<div style="padding: 10px; background: white; border-radius: 5px; border: 1px solid #ddd;">' +
-                         '<p>Нет данных для отображения на карте</p>' +
-                         '<button onclick="refreshMap()" style="padding: 5px 10px; background: #007bff; color: white; border: none; border-radius: 3px; cursor: pointer; margin-top: 5px;">Обновить карту</button>' +
-                         '</div>',
-                position: {top: 10, left: 10}
+        if (window.mapBounds) {
+            map.setBounds(window.mapBounds, {
+                checkZoomRange: true,
+                zoomMargin: 50
             });
-            map.controls.add(noDataControl);
-            return;
         }
 
         var objectCollection = new ymaps.GeoObjectCollection(null, {
-            preset: 'islands#blueIcon',
-            clusterize: true,
-            gridSize: 64,
-            clusterDisableClickZoom: true
+            preset: 'islands#blueIcon'
         });
-
-        points.forEach(function(point, index) {
-            if (!point.GEOCODE || !Array.isArray(point.GEOCODE) || point.GEOCODE.length !== 2) {
-                console.warn('Пропущена точка без координат:', point);
-                return;
-            }
-
-            var iconContent = point.LogoURL ?
-                '<img src="' + point.LogoURL + '" style="width: 40px; height: 40px; border-radius: 50%; object-fit: cover; border: 2px solid white; box-shadow: 0 2px 5px rgba(0,0,0,0.3);">' :
-                '<div style="width: 40px; height: 40px; border-radius: 50%; background: #007bff; color: white; display: flex; align-items: center; justify-content: center; font-weight: bold; border: 2px solid white; box-shadow: 0 2px 5px rgba(0,0,0,0.3);">' +
-                (point.TITLE ? point.TITLE.charAt(0).toUpperCase() : 'C') +
-                '</div>';
-
-            var placemark = new ymaps.Placemark(point.GEOCODE, {
-                    balloonContentHeader: '<div class="company-name">' + (point.TITLE || 'Без названия') + '</div>',
-                    balloonContentBody: `
-                        <div class="company-balloon">
-                            ${point.DESCRIPTION ?
-                                '<div class="company-description" style="margin-bottom: 10px; font-size: 13px; color: #666;">' +
-                                point.DESCRIPTION +
-                                '</div>' :
-                                ''}
-                            ${point.ADDRESS ?
-                                '<div class="company-address" style="font-size: 12px; color: #888; border-top: 1px solid #eee; padding-top: 8px; margin-top: 8px;">' +
-                                '<strong>Адрес:</strong> ' + point.ADDRESS +
-                                '</div>' :
-                                ''}
-                            ${point.LogoURL ?
-                                `<img src="${point.LogoURL}" alt="Логотип" class="company-logo"
-                                      onerror="this.style.display='none'" style="margin-top: 10px;">` :
-                                ''}
-                        </div>
-                    `,
-                    hintContent: point.TITLE || 'Компания'
-                }, {
-                iconLayout: 'default#imageWithContent',
-                iconImageHref: '',
-                iconImageSize: [50, 50],
-                iconImageOffset: [-25, -25],
-
-                iconContentLayout: ymaps.templateLayoutFactory.createClass(
-                    '<div style="background: transparent; width: 50px; height: 50px; display: flex; align-items: center; justify-content: center;">' +
-                    iconContent +
-                    '</div>'
-                ),
-                iconContentOffset: [0, 0],
-                iconContentSize: [50, 50],
-
-                balloonCloseButton: true,
-                balloonPanelMaxMapArea: 0
-            });
-
-            objectCollection.add(placemark);
-        });
-
         map.geoObjects.add(objectCollection);
 
-        if (objectCollection.getLength() > 0) {
-            var bounds = objectCollection.getBounds();
-            if (bounds) {
-                map.setBounds(bounds, {
-                    checkZoomRange: true,
-                    zoomMargin: 50
-                });
-            }
-        }
-
         var searchControl = new ymaps.control.SearchControl({
             options: {
                 float: 'right',
@@ -119,27 +41,180 @@ function initMap() {
         });
 
         map.behaviors.enable('scrollZoom');
+
+        var reloadTimer = null;
+        map.events.add('boundschange', function() {
+            clearTimeout(reloadTimer);
+            reloadTimer = setTimeout(function() {
+                loadViewport(map, objectCollection);
+            }, VIEWPORT_RELOAD_DELAY);
+        });
+
+        loadViewport(map, objectCollection);
     });
 }
 
-function refreshMap() {
-    location.reload();
+var POLL_DELAY = 2000;
+var POLL_MAX_ATTEMPTS = 60;
+var pollTimer = null;
+var pollAttempts = 0;
+
+function schedulePoll(map, objectCollection, data) {
+    // Снимок еще строится или адреса ждут геокодера: сервер догеокодирует порцию, карта дозагрузится
+    clearTimeout(pollTimer);
+    if (!(data.pending > 0 || data.refreshing) || pollAttempts >= POLL_MAX_ATTEMPTS) {
+        return;
+    }
+
+    pollAttempts++;
+    pollTimer = setTimeout(function() {
+        geocodePending(map, objectCollection);
+    }, POLL_DELAY);
+}
+
+function geocodePending(map, objectCollection) {
+    fetch(window.mapGeocodeUrl, {
+        method: 'POST',
+        headers: {
+            'X-Requested-With': 'XMLHttpRequest',
+        }
+    })
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success) {
+                console.error('Ошибка геокодирования адресов:', data.error);
+                return;
+            }
+
+            document.getElementById('companies-count').textContent = data.companies;
+            document.getElementById('geocoded-count').textContent = data.geocoded;
+
+            if (!window.mapBounds && data.bounds) {
+                // Первые точки снимка: смена границ сама перезагрузит область
+                window.mapBounds = data.bounds;
+                map.setBounds(data.bounds, {
+                    checkZoomRange: true,
+                    zoomMargin: 50
+                });
+            } else {
+                loadViewport(map, objectCollection);
+            }
+        })
+        .catch(error => {
+            console.error('Ошибка геокодирования адресов:', error);
+        });
 }
 
-function updateStats() {
-    var points = window.points || [];
-    var validPoints = points.filter(function(point) {
-        return point.GEOCODE && Array.isArray(point.GEOCODE) && point.GEOCODE.length === 2;
+var VIEWPORT_RELOAD_DELAY = 300;
+var viewportRequestId = 0;
+
+function loadViewport(map, objectCollection) {
+    // Сервер отдает кластеры и точки только видимой области для текущего масштаба
+    var requestId = ++viewportRequestId;
+    var bounds = map.getBounds();
+    var params = new URLSearchParams({
+        bbox: [bounds[0][0], bounds[0][1], bounds[1][0], bounds[1][1]].join(','),
+        zoom: Math.round(map.getZoom())
     });
 
-    document.getElementById('companies-count').textContent = points.length;
-    document.getElementById('geocoded-count').textContent = validPoints.length;
+    fetch(window.mapPointsUrl + '?' + params.toString())
+        .then(response => response.json())
+        .then(data => {
+            if (requestId !== viewportRequestId) {
+                return;
+            }
+            if (!data.success) {
+                console.error('Ошибка загрузки точек карты:', data.error);
+                return;
+            }
+
+            objectCollection.removeAll();
+
+            data.clusters.forEach(function(cluster) {
+                objectCollection.add(createClusterPlacemark(map, cluster));
+            });
+
+            data.points.forEach(function(point) {
+                objectCollection.add(createPlacemark(point));
+            });
+
+            schedulePoll(map, objectCollection, data);
+        })
+        .catch(error => {
+            console.error('Ошибка загрузки точек карты:', error);
+        });
 }
 
-document.addEventListener('DOMContentLoaded', function() {
-    updateStats();
+function createClusterPlacemark(map, cluster) {
+    var placemark = new ymaps.Placemark(cluster.GEOCODE, {
+        iconContent: cluster.COUNT,
+        hintContent: 'Компаний: ' + cluster.COUNT
+    }, {
+        preset: 'islands#blueCircleIcon'
+    });
+
+    placemark.events.add('click', function() {
+        map.setCenter(cluster.GEOCODE, map.getZoom() + 2, {duration: 300});
+    });
+
+    return placemark;
+}
+
+function createPlacemark(point) {
+    var iconContent = point.LogoURL ?
+        '<img src="' + point.LogoURL + '" style="width: 40px; height: 40px; border-radius: 50%; object-fit: cover; border: 2px solid white; box-shadow: 0 2px 5px rgba(0,0,0,0.3);">' :
+        '<div style="width: 40px; height: 40px; border-radius: 50%; background: #007bff; color: white; display: flex; align-items: center; justify-content: center; font-weight: bold; border: 2px solid white; box-shadow: 0 2px 5px rgba(0,0,0,0.3);">' +
+        (point.TITLE ? point.TITLE.charAt(0).toUpperCase() : 'C') +
+        '</div>';
+
+    var placemark = new ymaps.Placemark(point.GEOCODE, {
+            balloonContentHeader: '<div class="company-name">' + (point.TITLE || 'Без названия') + '</div>',
+            balloonContentBody: `
+                <div class="company-balloon">
+                    ${point.DESCRIPTION ?
+                        '<div class="company-description" style="margin-bottom: 10px; font-size: 13px; color: #666;">' +
+                        point.DESCRIPTION +
+                        '</div>' :
+                        ''}
+                    ${point.ADDRESS ?
+                        '<div class="company-address" style="font-size: 12px; color: #888; border-top: 1px solid #eee; padding-top: 8px; margin-top: 8px;">' +
+                        '<strong>Адрес:</strong> ' + point.ADDRESS +
+                        '</div>' :
+                        ''}
+                    ${point.LogoURL ?
+                        `<img src="${point.LogoURL}" alt="Логотип" class="company-logo"
+                              onerror="this.style.display='none'" style="margin-top: 10px;">` :
+                        ''}
+                </div>
+            `,
+            hintContent: point.TITLE || 'Компания'
+        }, {
+        iconLayout: 'default#imageWithContent',
+        iconImageHref: '',
+        iconImageSize: [50, 50],
+        iconImageOffset: [-25, -25],
+
+        iconContentLayout: ymaps.templateLayoutFactory.createClass(
+            '<div style="background: transparent; width: 50px; height: 50px; display: flex; align-items: center; justify-content: center;">' +
+            iconContent +
+            '</div>'
+        ),
+        iconContentOffset: [0, 0],
+        iconContentSize: [50, 50],
+
+        balloonCloseButton: true,
+        balloonPanelMaxMapArea: 0
+    });
 
+    return placemark;
+}
+
+function refreshMap() {
+    location.reload();
+}
+
+document.addEventListener('DOMContentLoaded', function() {
     if (document.getElementById('map')) {
         setTimeout(initMap, 100);
     }
-});
\ No newline at end of file
+});
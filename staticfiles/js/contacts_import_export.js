@@ -35,8 +35,12 @@ document.getElementById('importForm').addEventListener('submit', function(e) {
     .then(response => response.json())
     .then(data => {
         if (data.success) {
-            document.getElementById('importStatus').textContent = 'Импорт завершен успешно!';
-            loadHistory();
+            document.getElementById('importStatus').textContent = data.message;
+            watchJob(data.job_id, 'import', function(job) {
+                document.getElementById('importStatus').textContent = job.stats && job.stats.dry_run ?
+                    formatDryRunStats(job.stats) : 'Импорт завершен успешно!';
+                loadHistory();
+            });
         } else {
             document.getElementById('importStatus').textContent = 'Ошибка: ' + data.error;
         }
@@ -66,9 +70,12 @@ document.getElementById('exportForm').addEventListener('submit', function(e) {
     .then(response => response.json())
     .then(data => {
         if (data.success) {
-            document.getElementById('exportStatus').textContent = 'Экспорт завершен успешно!';
-            window.location.href = `/contacts/download/${data.job_id}/`;
-            loadHistory();
+            document.getElementById('exportStatus').textContent = data.message;
+            watchJob(data.job_id, 'export', function() {
+                document.getElementById('exportStatus').textContent = 'Экспорт завершен успешно!';
+                window.location.href = `/contacts/download/${data.job_id}/`;
+                loadHistory();
+            });
         } else {
             document.getElementById('exportStatus').textContent = 'Ошибка: ' + data.error;
         }
@@ -79,6 +86,101 @@ document.getElementById('exportForm').addEventListener('submit', function(e) {
     });
 });
 
+function formatDryRunStats(stats) {
+    const verdicts = stats.verdicts || {};
+    const stages = Object.entries(stats.stages || {})
+        .map(([stage, info]) => `${stage}: ${info.rows_per_second || '—'} строк/с`)
+        .join(', ');
+
+    return `Проверка завершена: строк ${stats.rows}, будут созданы ${verdicts.valid || 0}, ` +
+        `дубликатов ${verdicts.duplicate || 0}, с ошибками ${verdicts.failed || 0}. Скорость этапов: ${stages}`;
+}
+
+function renderJobStatus(data, prefix, onCompleted) {
+    const statusElement = document.getElementById(prefix + 'Status');
+    const progressBar = document.querySelector('#' + prefix + 'Progress .progress-bar');
+
+    if (data.total_records > 0) {
+        const percent = Math.round(data.processed_records / data.total_records * 100);
+        progressBar.style.width = percent + '%';
+    }
+
+    if (data.status === 'completed') {
+        progressBar.style.width = '100%';
+        onCompleted(data);
+        return true;
+    }
+
+    if (data.status === 'failed') {
+        statusElement.textContent = 'Ошибка: ' + data.error_message;
+        loadHistory();
+        return true;
+    }
+
+    if (data.status === 'processing') {
+        statusElement.textContent = `Обработано ${data.processed_records} из ${data.total_records}` +
+            (data.failed_records ? `, с ошибками: ${data.failed_records}` : '');
+    } else {
+        statusElement.textContent = 'Задача в очереди...';
+    }
+    return false;
+}
+
+function watchJob(jobId, prefix, onCompleted) {
+    // Статус опрашивается обычными запросами: сервер отдает его из короткого кэша
+    pollJobStatus(jobId, prefix, onCompleted);
+}
+
+function pollJobStatus(jobId, prefix, onCompleted) {
+    fetch(`/contacts/status/${jobId}/`)
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success) {
+            document.getElementById(prefix + 'Status').textContent = 'Ошибка: ' + data.error;
+            return;
+        }
+
+        if (!renderJobStatus(data, prefix, onCompleted)) {
+            setTimeout(() => pollJobStatus(jobId, prefix, onCompleted), 2000);
+        }
+    })
+    .catch(error => {
+        console.error('Ошибка получения статуса:', error);
+        setTimeout(() => pollJobStatus(jobId, prefix, onCompleted), 5000);
+    });
+}
+
+function resumeImport(jobId) {
+    const formData = new FormData();
+    formData.append('csrfmiddlewaretoken', document.querySelector('[name=csrfmiddlewaretoken]').value);
+
+    fetch(`/contacts/resume/${jobId}/`, {
+        method: 'POST',
+        body: formData,
+        headers: {
+            'X-Requested-With': 'XMLHttpRequest',
+        }
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success) {
+            alert('Ошибка: ' + data.error);
+            return;
+        }
+
+        document.getElementById('importProgress').style.display = 'block';
+        document.getElementById('importStatus').textContent = data.message;
+        watchJob(data.job_id, 'import', function() {
+            document.getElementById('importStatus').textContent = 'Импорт завершен успешно!';
+            loadHistory();
+        });
+        loadHistory();
+    })
+    .catch(error => {
+        console.error('Ошибка:', error);
+    });
+}
+
 function loadHistory() {
     fetch('/contacts/history/')
     .then(response => response.json())
@@ -102,6 +204,10 @@ function loadHistory() {
                 <td>
                     ${operation.job_type === 'export' && operation.status === 'completed' ?
                         `<a href="/contacts/download/${operation.id}/" class="download-link">Скачать</a>` :
+                    operation.job_type === 'import' && operation.status === 'failed' ?
+                        `<a href="#" class="download-link" onclick="resumeImport('${operation.id}'); return false;">Продолжить</a>` :
+                    operation.job_type === 'import' && operation.failed_records > 0 ?
+                        `<a href="/contacts/failed/${operation.id}/" class="download-link">Строки с ошибками</a>` :
                         '—'
                     }
                 </td>